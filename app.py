@@ -1,34 +1,37 @@
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Response, jsonify, request, render_template
 from flask_socketio import SocketIO, emit
 import os
 import random
 import math  # Add math module for UCT calculations
 from src.mcts.node import MCTSState, MCTSNode
 from src.mcts.tree import MCTS
+from src.mcts.speculation import SpeculativeExpander
 from pathlib import Path
 from werkzeug.utils import secure_filename
 import uuid
 from src.agents.structured_review import StructuredReviewAgent
 from src.agents.ideation import IdeationAgent
 from src.agents.review import ReviewAgent
+from src.agents.registry import load_config, get_agent
+from src.utils.cancellation import CancellationToken, OperationCancelled
+from src.utils.knowledge_index import KnowledgeIndex
+from src.utils.pdf_ingestion import PDFIngestor
+from src.utils.warmup import WarmUp
+from src.utils import metrics
+import functools
 import json
 import re
 import yaml
 import traceback
+import threading
 import sys
 import logging
 import click
 
 logger = logging.getLogger(__name__)
 
-# Remove the old external path and use local scholarqa package
+# Remove the old external path and use local scholarqa package; its ML stack is imported by get_scholar_qa()
 sys.path.insert(0, str(Path(__file__).parent / "src" / "retrieval_api"))
-from scholarqa import ScholarQA
-from scholarqa.rag.retrieval import PaperFinder, PaperFinderWithReranker
-from scholarqa.rag.retriever_base import FullTextRetriever
-from scholarqa.rag.reranker.modal_engine import ModalReranker
-from scholarqa.rag.reranker.modal_engine import HuggingFaceReranker
-import pymupdf  # PyMuPDF for PDF parsing
 # Import the key manager
 # from src.utils.key_manager import encrypt_api_key, decrypt_api_key, get_client_encryption_script
 
@@ -96,16 +99,43 @@ current_root = None
 current_node = None
 current_state = None
 exploration_in_progress = False
-
-# Initialize agents
-structured_review_agent = StructuredReviewAgent("config/config.yaml")
-ideation_agent = IdeationAgent("config/config.yaml")
-review_agent = ReviewAgent("config/config.yaml")  # Initialize review agent directly
-
-# Get the configuration from config.yaml
-import yaml
-with open("config/config.yaml", "r") as f:
-    config = yaml.safe_load(f)
+exploration_token = None  # CancellationToken of the running exploration, cancelled by stop_exploration
+
+# Initialize agents, shared with MCTS through the registry
+structured_review_agent = get_agent(StructuredReviewAgent, "config/config.yaml")
+ideation_agent = get_agent(IdeationAgent, "config/config.yaml")
+review_agent = get_agent(ReviewAgent, "config/config.yaml")
+
+# Get the configuration from config.yaml (parsed once, shared with the agents)
+config = load_config("config/config.yaml")
+
+# Deadlines (seconds) for long-running exploration and retrieval work
+EXPLORATION_TIMEOUT = config.get("timeouts", {}).get("exploration")
+RETRIEVAL_TIMEOUT = config.get("timeouts", {}).get("retrieval")
+
+# Persistent vector index over chunks of the user's uploaded papers
+knowledge_index_config = config.get("knowledge_index", {})
+knowledge_index = KnowledgeIndex(
+    knowledge_index_config.get("dir", "data/knowledge_index"),
+    embedding_model=knowledge_index_config.get("embedding_model", "sentence-transformers/all-MiniLM-L6-v2"),
+    chunk_size=knowledge_index_config.get("chunk_size", 200),
+    chunk_overlap=knowledge_index_config.get("chunk_overlap", 40),
+)
+
+
+def uploaded_context(query):
+    """Format the uploaded-paper chunks most relevant to query for the ideation prompts."""
+    if not len(knowledge_index):
+        return ""
+    try:
+        hits = knowledge_index.search(query, top_k=knowledge_index_config.get("top_k", 5))
+    except Exception as e:
+        logger.error(f"Knowledge index search failed: {e}")
+        return ""
+    if not hits:
+        return ""
+    excerpts = "\n\n".join(f"[{hit['source']}] {hit['text']}" for hit in hits)
+    return f"Relevant excerpts from the user's uploaded papers:\n{excerpts}"
 
 # Set Semantic Scholar API key
 s2_api_key = os.environ.get("SEMANTIC_SCHOLAR_API_KEY")
@@ -130,11 +160,93 @@ else:
     if not azure_endpoint:
         logger.warning("AZURE_OPENAI_ENDPOINT not set while in deployment mode")
 
-retriever = FullTextRetriever(n_retrieval=10, n_keyword_srch=10)
-# paper_finder = PaperFinder(retriever, context_threshold=0.1)
-reranker = HuggingFaceReranker(model_name="cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size=256)
-paper_finder = PaperFinderWithReranker(retriever, reranker=reranker, n_rerank=5, context_threshold=0.1)
-scholar_qa = ScholarQA(paper_finder=paper_finder, llm_model="gemini/gemini-2.0-flash-lite")
+scholar_qa = None
+scholar_qa_lock = threading.Lock()
+
+
+def get_scholar_qa():
+    """Build the ScholarQA pipeline on first use: it pulls in pandas, litellm, torch and the reranker model,
+    which would otherwise dominate app startup."""
+    global scholar_qa
+    with scholar_qa_lock:
+        if scholar_qa is not None:
+            return scholar_qa
+        from scholarqa import ScholarQA
+        from scholarqa.rag.retrieval import PaperFinderWithReranker
+        from scholarqa.rag.retriever_base import FullTextRetriever
+        from scholarqa.rag.reranker.modal_engine import HuggingFaceReranker
+        from scholarqa.stage_cache import StageCache
+
+        retrieval_backend_config = config.get("retrieval_backend", {})
+        if retrieval_backend_config.get("type") == "local":
+            # Offline retrieval over a local corpus of S2ORC-style paper json instead of the S2 snippet api
+            from scholarqa.rag.local_retriever import LocalHybridRetriever
+
+            retriever = LocalHybridRetriever.from_dir(
+                retrieval_backend_config.get("corpus_dir", "data/local_corpus"),
+                n_retrieval=10,
+                n_keyword_srch=10,
+                embedding_model=retrieval_backend_config.get("embedding_model",
+                                                             "sentence-transformers/all-MiniLM-L6-v2"),
+            )
+        else:
+            retriever = FullTextRetriever(n_retrieval=10, n_keyword_srch=10)
+        # paper_finder = PaperFinder(retriever, context_threshold=0.1)
+        reranker = HuggingFaceReranker(model_name="cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size=256)
+        # top 5 passages: the cut needs every rerank score first, so quote extraction starts after the full rerank
+        # (with ~20 candidates there is a single rerank chunk anyway); only the metadata request overlaps with it
+        paper_finder = PaperFinderWithReranker(retriever, reranker=reranker, n_rerank=5, context_threshold=0.1)
+        qa_cache_config = config.get("qa_cache", {})
+        scholar_qa = ScholarQA(
+            paper_finder=paper_finder,
+            stage_cache=StageCache(
+                max_entries=qa_cache_config.get("max_entries", 256),
+                ttl_seconds=qa_cache_config.get("ttl_seconds", 3600),
+            ) if qa_cache_config.get("enabled", False) else None,
+            **scholar_qa_options(),
+        )
+        return scholar_qa
+
+
+def scholar_qa_options():
+    """ScholarQA arguments shared by the foreground and the speculative pipeline."""
+    quote_budget_config = config.get("quote_budget", {})
+    return dict(
+        llm_model="gemini/gemini-2.0-flash-lite",
+        min_quotes=quote_budget_config.get("min_quotes"),
+        quote_token_budget=quote_budget_config.get("token_budget"),
+        already_written_token_budget=config.get("prompt_budget", {}).get("already_written_tokens", 3000),
+    )
+
+
+speculative_scholar_qa = None
+
+
+def get_speculative_scholar_qa():
+    """ScholarQA pipeline for speculative retrieval on the speculation thread.
+
+    run_qa_pipeline keeps the request it is answering on the instance (tool_request, the task id of the
+    log formatter), so a background query must not share the pipeline with a foreground one. This instance
+    reuses the foreground paper finder (retriever and reranker model) and stage cache, and has its own log
+    formatter that is not attached to any handler, so its task ids never end up in foreground log lines.
+    """
+    global speculative_scholar_qa
+    foreground = get_scholar_qa()
+    with scholar_qa_lock:
+        if speculative_scholar_qa is not None:
+            return speculative_scholar_qa
+        from scholarqa import ScholarQA
+        from scholarqa.config.config_setup import LogsConfig
+        from scholarqa.utils import TaskIdAwareLogFormatter
+
+        speculative_scholar_qa = ScholarQA(
+            paper_finder=foreground.paper_finder,
+            logs_config=LogsConfig(llm_cache_dir=foreground.logs_config.llm_cache_dir,
+                                   tid_log_formatter=TaskIdAwareLogFormatter()),
+            stage_cache=foreground.stage_cache,
+            **scholar_qa_options(),
+        )
+        return speculative_scholar_qa
 
 # API Key management endpoints with improved security
 @app.route("/api/set_api_key", methods=["POST"])
@@ -414,12 +526,13 @@ def chat():
                     {"role": "system", "content": "Generating initial idea..."}
                 )
 
-                # Extract the abstract from the knowledge chunks (if available)
-                abstract_text = ""
+                # Pull the most relevant chunks of the uploaded papers, falling back to the first abstract
+                abstract_text = uploaded_context(user_message)
                 for chunk in knowledge_chunks:
+                    if abstract_text:
+                        break
                     if "abstract" in chunk:
                         abstract_text = chunk["abstract"]
-                        break 
                 
                 # Create a root state that represents just the research goal
                 root_state = MCTSState(
@@ -433,6 +546,7 @@ def chat():
                 
                 # Create root node with the research goal
                 current_root = MCTSNode(state=root_state)
+                speculator.reset()
                 
                 # Use the ideation agent to generate the idea
                 response = mcts.ideation_agent.execute_action(
@@ -536,6 +650,8 @@ def chat():
                 
                 # Add the improved idea as an assistant message
                 chat_messages.append({"role": "assistant", "content": improved_content})
+
+            speculator.speculate(current_node)
                 
             # Return the updated state
             return jsonify(
@@ -763,7 +879,7 @@ def chat():
 #                 "content": "Searching for relevant papers..."
 #             })
             
-#             search_results = scholar_qa.answer_query(query)
+#             search_results = get_scholar_qa().answer_query(query)
             
 #             # Add message showing search results
 #             if search_results and "sections" in search_results:
@@ -876,7 +992,7 @@ def chat():
 
 @app.route("/api/step", methods=["POST"])
 def step():
-    global main_idea, current_node, current_state, exploration_in_progress, current_root
+    global main_idea, current_node, current_state, exploration_in_progress, current_root, exploration_token
     
     if current_node is None:
         return jsonify({"error": "Please enter an initial research idea first"}), 400
@@ -898,6 +1014,7 @@ def step():
                 return jsonify({"error": "MCTS exploration already in progress"}), 429
             
             exploration_in_progress = True
+            exploration_token = CancellationToken(timeout=EXPLORATION_TIMEOUT)
             
             try:
                 
@@ -913,7 +1030,7 @@ def step():
                     
                     # Phase 3: EXPAND - Create children if not terminal and below max depth
                     if selected_node.state.depth < mcts.config["experiment"]["max_depth"]:
-                        mcts_expand(selected_node)
+                        mcts_expand(selected_node, exploration_token)
                     
                     # Phase 4: BACKPROPAGATE - Update Q and N values up the tree
                     mcts_backpropagate(selected_node, reward)
@@ -948,6 +1065,10 @@ def step():
                     "average_score": getattr(current_node.state, "average_score", 0.0),
                     "messages": chat_messages[-5:]  # Return last 5 messages
                 })
+
+            except OperationCancelled as e:
+                chat_messages.append({"role": "system", "content": f"🛑 MCTS step stopped: {e}"})
+                return jsonify({"error": f"MCTS step stopped: {e}", "messages": chat_messages[-5:]}), 409
                 
             finally:
                 exploration_in_progress = False
@@ -986,177 +1107,20 @@ def step():
                 "review_feedback": review_data.get("reviews", {})
             })
         
-        # Handle regular actions with their existing implementation
-        elif action == "review_and_refine":
-            # First get unified review
-            review_data = review_agent.unified_review(current_node.state.current_idea)
-            
-            # Sort aspects by score to find lowest scoring ones
-            aspect_scores = []
-            if "scores" in review_data:
-                aspect_scores = sorted(
-                    review_data["scores"].items(),
-                    key=lambda x: x[1]
-                )[:3]  # Get 3 lowest scoring aspects
-            
-            # Get detailed reviews for lowest aspects
-            detailed_reviews = []
-            for aspect, score in aspect_scores:
-                review = structured_review_agent.review_aspect(
-                    current_node.state.current_idea,
-                    aspect
-                )
-                if review:
-                    detailed_reviews.append(review)
-            
-            # Create improvement prompt with focused feedback
-            improvement_state = MCTSState(
-                research_goal=current_node.state.research_goal,
-                current_idea=current_node.state.current_idea,
-                retrieved_knowledge=current_node.state.retrieved_knowledge.copy(),
-                feedback=detailed_reviews,
-                depth=current_node.state.depth + 1
-            )
-            
-            # Get improved idea from ideation agent
-            response = mcts.ideation_agent.execute_action(
-                "review_and_refine",
-                {
-                    "current_idea": current_node.state.current_idea,
-                    "reviews": detailed_reviews,
-                    "action_type": "execute"
-                }
-            )
-            
-            # Update state with improved idea
-            improvement_state.current_idea = response["content"]
-            
-            # Get new review scores
-            new_review = review_agent.unified_review(improvement_state.current_idea)
-            if new_review:
-                improvement_state.review_scores = new_review.get("scores", {})
-                improvement_state.review_feedback = new_review.get("reviews", {})
-                improvement_state.average_score = new_review.get("average_score", 0.0)
-                improvement_state.reward = new_review.get("average_score", 0.0) / 10
-            
-            # Create new node and update current
-            new_node = current_node.add_child(improvement_state, action)
-            current_node = new_node
-            main_idea = improvement_state.current_idea
+        # Handle regular actions, adopting a speculative result when one is available
+        elif action in ("review_and_refine", "retrieve_and_refine"):
+            speculated = speculator.adopt(current_node, action)
+            if speculated is not None:
+                new_state, notes = speculated
+                for note in notes:
+                    add_system_message(note)
+            else:
+                new_state = compute_step_action(current_node, action, notify=add_system_message)
 
-        # IMPLEMENT MISSING retrieve_and_refine ACTION
-        elif action == "retrieve_and_refine":
-            # Step 1: Generate search query based on current idea
-            chat_messages.append({
-                "role": "system",
-                "content": "Generating search query for knowledge retrieval..."
-            })
-            
-            # Generate query using ideation agent (consistent with frontend)
-            query_response = mcts.ideation_agent.execute_action(
-                "generate_query",
-                {
-                    "current_idea": current_node.state.current_idea,
-                    "action_type": "generate_query"
-                }
-            )
-            
-            # Extract query from response
-            query = None
-            try:
-                content = query_response.get("content", "")
-                # Try to parse JSON response first
-                json_match = re.search(r'{.*}', content)
-                if json_match:
-                    query_json = json.loads(json_match.group())
-                    query = query_json.get("query", content.split(".")[0])
-                else:
-                    # Fallback to using first sentence
-                    query = content.split(".")[0] if content else current_node.state.current_idea[:100]
-                    
-                chat_messages.append({
-                    "role": "system", 
-                    "content": f"Generated search query: {query}"
-                })
-                
-            except Exception as e:
-                print(f"Error parsing query: {e}")
-                query = current_node.state.current_idea[:100]  # Fallback
-                
-            # Step 2: Retrieve relevant knowledge using ScholarQA
-            chat_messages.append({
-                "role": "system",
-                "content": "Searching for relevant papers..."
-            })
-            
-            try:
-                search_results = scholar_qa.answer_query(query)
-                
-                if search_results and "sections" in search_results:
-                    chat_messages.append({
-                        "role": "system",
-                        "content": f"Found {len(search_results['sections'])} relevant sections from papers"
-                    })
-                else:
-                    search_results = {"sections": [], "query": query}
-                    chat_messages.append({
-                        "role": "system",
-                        "content": "No relevant papers found, proceeding without additional knowledge"
-                    })
-                    
-            except Exception as e:
-                print(f"Error in knowledge retrieval: {e}")
-                search_results = {"sections": [], "query": query}
-                chat_messages.append({
-                    "role": "system",
-                    "content": f"Error in retrieval: {str(e)}"
-                })
-            
-            # Step 3: Improve idea with retrieved knowledge
-            chat_messages.append({
-                "role": "system",
-                "content": "Refining idea with retrieved knowledge..."
-            })
-            
-            # Create new state with retrieved knowledge
-            retrieval_state = MCTSState(
-                research_goal=current_node.state.research_goal,
-                current_idea=current_node.state.current_idea,
-                retrieved_knowledge=current_node.state.retrieved_knowledge + [search_results],
-                feedback=current_node.state.feedback.copy(),
-                depth=current_node.state.depth + 1
-            )
-            
-            # Improve idea with retrieved knowledge using ideation agent
-            improvement_response = mcts.ideation_agent.execute_action(
-                "retrieve_and_refine",
-                {
-                    "current_idea": current_node.state.current_idea,
-                    "retrieved_content": search_results,
-                    "action_type": "execute"
-                }
-            )
-            
-            # Update state with improved idea
-            retrieval_state.current_idea = improvement_response["content"]
-            
-            # Step 4: Get new review scores for the improved idea
-            new_review = review_agent.unified_review(retrieval_state.current_idea)
-            if new_review:
-                retrieval_state.review_scores = new_review.get("scores", {})
-                retrieval_state.review_feedback = new_review.get("reviews", {})
-                retrieval_state.average_score = new_review.get("average_score", 0.0)
-                retrieval_state.reward = new_review.get("average_score", 0.0) / 10
-            
             # Create new node and update current
-            new_node = current_node.add_child(retrieval_state, action)
+            new_node = current_node.add_child(new_state, action)
             current_node = new_node
-            main_idea = retrieval_state.current_idea
-            
-            chat_messages.append({
-                "role": "system",
-                "content": f"Idea refined with retrieved knowledge. New score: {getattr(retrieval_state, 'average_score', 0):.1f}/10"
-            })
+            main_idea = new_state.current_idea
 
         elif action == "refresh_idea":
             # Get the research goal from the root node
@@ -1170,6 +1134,7 @@ def step():
                 {
                     "research_goal": research_goal,
                     "current_idea": current_node.state.current_idea,
+                    "abstract": uploaded_context(research_goal or current_node.state.current_idea),
                     "action_type": "execute"
                 }
             )
@@ -1216,6 +1181,9 @@ def step():
         else:
             return jsonify({"error": "Invalid action"}), 400
 
+        # Pre-compute the likely next actions while the user reads the new idea
+        speculator.speculate(current_node)
+
         # Return updated state
         return jsonify({
             "idea": main_idea,
@@ -1235,13 +1203,207 @@ def step():
         return jsonify({"error": error_message}), 500
 
 
-def execute_mcts_action(state, action):
+def add_system_message(content):
+    """Append a system message to the chat."""
+    chat_messages.append({"role": "system", "content": content})
+
+
+def review_and_refine_state(node, cancel_token=None, notify=lambda message: None):
+    """Review node's idea, focus on its weakest aspects and return the refined, re-reviewed child state."""
+    # First get unified review
+    review_data = review_agent.unified_review(node.state.current_idea, cancel_token)
+
+    # Sort aspects by score to find lowest scoring ones
+    aspect_scores = []
+    if "scores" in review_data:
+        aspect_scores = sorted(
+            review_data["scores"].items(),
+            key=lambda x: x[1]
+        )[:3]  # Get 3 lowest scoring aspects
+
+    # Get detailed reviews for lowest aspects
+    detailed_reviews = []
+    for aspect, score in aspect_scores:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        review = structured_review_agent.review_aspect(
+            node.state.current_idea,
+            aspect
+        )
+        if review:
+            detailed_reviews.append(review)
+
+    # Create improvement prompt with focused feedback
+    improvement_state = MCTSState(
+        research_goal=node.state.research_goal,
+        current_idea=node.state.current_idea,
+        retrieved_knowledge=node.state.retrieved_knowledge.copy(),
+        feedback=detailed_reviews,
+        depth=node.state.depth + 1
+    )
+
+    # Get improved idea from ideation agent
+    response = mcts.ideation_agent.execute_action(
+        "review_and_refine",
+        {
+            "current_idea": node.state.current_idea,
+            "reviews": detailed_reviews,
+            "action_type": "execute"
+        },
+        cancel_token
+    )
+
+    # Update state with improved idea
+    improvement_state.current_idea = response["content"]
+
+    # Get new review scores
+    new_review = review_agent.unified_review(improvement_state.current_idea, cancel_token)
+    if new_review:
+        improvement_state.review_scores = new_review.get("scores", {})
+        improvement_state.review_feedback = new_review.get("reviews", {})
+        improvement_state.average_score = new_review.get("average_score", 0.0)
+        improvement_state.reward = new_review.get("average_score", 0.0) / 10
+
+    return improvement_state
+
+
+def retrieve_and_refine_state(node, cancel_token=None, notify=lambda message: None, get_qa=get_scholar_qa):
+    """Retrieve literature for node's idea and return the refined, re-reviewed child state.
+
+    get_qa returns the ScholarQA pipeline to search with; speculation passes get_speculative_scholar_qa.
+    """
+    # Step 1: Generate search query based on current idea
+    notify("Generating search query for knowledge retrieval...")
+
+    # Generate query using ideation agent (consistent with frontend)
+    query_response = mcts.ideation_agent.execute_action(
+        "generate_query",
+        {
+            "current_idea": node.state.current_idea,
+            "action_type": "generate_query"
+        },
+        cancel_token
+    )
+
+    # Extract query from response
+    query = None
+    try:
+        content = query_response.get("content", "")
+        # Try to parse JSON response first
+        json_match = re.search(r'{.*}', content)
+        if json_match:
+            query_json = json.loads(json_match.group())
+            query = query_json.get("query", content.split(".")[0])
+        else:
+            # Fallback to using first sentence
+            query = content.split(".")[0] if content else node.state.current_idea[:100]
+
+        notify(f"Generated search query: {query}")
+
+    except Exception as e:
+        print(f"Error parsing query: {e}")
+        query = node.state.current_idea[:100]  # Fallback
+
+    # Step 2: Retrieve relevant knowledge using ScholarQA
+    notify("Searching for relevant papers...")
+
+    try:
+        search_results = get_qa().answer_query(query, cancel_token=cancel_token)
+
+        if search_results and "sections" in search_results:
+            notify(f"Found {len(search_results['sections'])} relevant sections from papers")
+        else:
+            search_results = {"sections": [], "query": query}
+            notify("No relevant papers found, proceeding without additional knowledge")
+
+    except Exception as e:
+        print(f"Error in knowledge retrieval: {e}")
+        search_results = {"sections": [], "query": query}
+        notify(f"Error in retrieval: {str(e)}")
+
+    # Step 3: Improve idea with retrieved knowledge
+    notify("Refining idea with retrieved knowledge...")
+
+    # Create new state with retrieved knowledge
+    retrieval_state = MCTSState(
+        research_goal=node.state.research_goal,
+        current_idea=node.state.current_idea,
+        retrieved_knowledge=node.state.retrieved_knowledge + [search_results],
+        feedback=node.state.feedback.copy(),
+        depth=node.state.depth + 1
+    )
+
+    # Improve idea with retrieved knowledge using ideation agent
+    improvement_response = mcts.ideation_agent.execute_action(
+        "retrieve_and_refine",
+        {
+            "current_idea": node.state.current_idea,
+            "retrieved_content": search_results,
+            "abstract": uploaded_context(node.state.current_idea),
+            "action_type": "execute"
+        },
+        cancel_token
+    )
+
+    # Update state with improved idea
+    retrieval_state.current_idea = improvement_response["content"]
+
+    # Step 4: Get new review scores for the improved idea
+    new_review = review_agent.unified_review(retrieval_state.current_idea, cancel_token)
+    if new_review:
+        retrieval_state.review_scores = new_review.get("scores", {})
+        retrieval_state.review_feedback = new_review.get("reviews", {})
+        retrieval_state.average_score = new_review.get("average_score", 0.0)
+        retrieval_state.reward = new_review.get("average_score", 0.0) / 10
+
+    notify(f"Idea refined with retrieved knowledge. New score: {getattr(retrieval_state, 'average_score', 0):.1f}/10")
+    return retrieval_state
+
+
+STEP_ACTIONS = {
+    "review_and_refine": review_and_refine_state,
+    "retrieve_and_refine": retrieve_and_refine_state,
+}
+
+
+def compute_step_action(node, action, cancel_token=None, notify=lambda message: None):
+    """Compute the child state that /api/step creates for action, reporting progress through notify."""
+    return STEP_ACTIONS[action](node, cancel_token=cancel_token, notify=notify)
+
+
+# Speculation runs concurrently with foreground requests, so it searches with its own ScholarQA instance
+SPECULATIVE_STEP_ACTIONS = {
+    "review_and_refine": review_and_refine_state,
+    "retrieve_and_refine": functools.partial(retrieve_and_refine_state, get_qa=get_speculative_scholar_qa),
+}
+
+
+def speculate_step_action(node, action, cancel_token):
+    """Background variant of compute_step_action that buffers chat messages until the result is adopted."""
+    notes = []
+    state = SPECULATIVE_STEP_ACTIONS[action](node, cancel_token=cancel_token, notify=notes.append)
+    return state, notes
+
+
+# Opt-in speculative pre-expansion of the node the user is viewing (see `speculation` in config.yaml)
+speculation_config = config.get("speculation", {})
+speculator = SpeculativeExpander(
+    speculate_step_action,
+    actions=[a for a in speculation_config.get("actions", list(STEP_ACTIONS)) if a in STEP_ACTIONS],
+    budget=speculation_config.get("max_per_session", 6),
+    cache_size=speculation_config.get("cache_size", 8),
+    timeout=EXPLORATION_TIMEOUT,
+    enabled=speculation_config.get("enabled", False),
+)
+
+
+def execute_mcts_action(state, action, cancel_token=None):
     """Execute an action within MCTS to create a new state"""
     try:
         if action == "review_and_refine":
             # Get current reviews if not available
             if not hasattr(state, "review_scores") or not state.review_scores:
-                review_data = review_agent.unified_review(state.current_idea)
+                review_data = review_agent.unified_review(state.current_idea, cancel_token)
                 if review_data:
                     state.review_scores = review_data.get("scores", {})
                     state.review_feedback = review_data.get("reviews", {})
@@ -1268,7 +1430,8 @@ def execute_mcts_action(state, action):
                     "current_idea": state.current_idea,
                     "reviews": detailed_reviews,
                     "action_type": "execute"
-                }
+                },
+                cancel_token
             )
             
             # Create new state
@@ -1290,7 +1453,8 @@ def execute_mcts_action(state, action):
                 {
                     "current_idea": state.current_idea,
                     "action_type": "generate_query"
-                }
+                },
+                cancel_token
             )
             
             # Extract query from response
@@ -1309,7 +1473,7 @@ def execute_mcts_action(state, action):
             
             # Step 2: Retrieve knowledge
             try:
-                search_results = scholar_qa.answer_query(query)
+                search_results = get_scholar_qa().answer_query(query, cancel_token=cancel_token)
                 if not search_results or "sections" not in search_results:
                     search_results = {"sections": [], "query": query}
             except Exception as e:
@@ -1323,8 +1487,10 @@ def execute_mcts_action(state, action):
                     {
                         "current_idea": state.current_idea,
                         "retrieved_content": search_results,
+                        "abstract": uploaded_context(state.current_idea),
                         "action_type": "execute"
-                    }
+                    },
+                    cancel_token
                 )
                 
                 new_state = MCTSState(
@@ -1347,8 +1513,10 @@ def execute_mcts_action(state, action):
                 {
                     "research_goal": state.research_goal,
                     "current_idea": state.current_idea,
+                    "abstract": uploaded_context(state.research_goal or state.current_idea),
                     "action_type": "execute"
-                }
+                },
+                cancel_token
             )
             
             new_state = MCTSState(
@@ -1366,7 +1534,7 @@ def execute_mcts_action(state, action):
         return None
 
 
-def mcts_expand(node):
+def mcts_expand(node, cancel_token=None):
     """Phase 2: EXPAND - Add new child nodes for unexplored actions"""
     if node.state.depth >= mcts.config["experiment"]["max_depth"]:
         return
@@ -1377,7 +1545,7 @@ def mcts_expand(node):
         if not any(child.action == action for child in node.children):
             try:
                 # Execute action to create new state
-                new_state = execute_mcts_action(node.state, action)
+                new_state = execute_mcts_action(node.state, action, cancel_token)
                 
                 if new_state:
                     # # SPECIAL HANDLING FOR REFRESH_IDEA - create sibling instead of child
@@ -1392,7 +1560,7 @@ def mcts_expand(node):
                     
                     # Evaluate the new child/sibling node
                     try:
-                        review_data = review_agent.unified_review(new_state.current_idea)
+                        review_data = review_agent.unified_review(new_state.current_idea, cancel_token)
                         if review_data:
                             child.state.review_scores = review_data.get("scores", {})
                             child.state.review_feedback = review_data.get("reviews", {})
@@ -1418,42 +1586,20 @@ def mcts_expand(node):
 def mcts_select(root_node):
     """Phase 1: SELECT - Traverse tree using UCT to find leaf node"""
     current = root_node
-    path = [current]
     
     while True:
         # If node has unvisited children, select one randomly
-        unvisited_children = [child for child in current.children if child.visits == 0]
-        if unvisited_children:
-            selected = random.choice(unvisited_children)
-            path.append(selected)
-            return selected
+        unvisited_children = current.child_stats.unvisited()
+        if len(unvisited_children):
+            return current.children[random.choice(unvisited_children)]
         
         # If all children visited, use UCT to select next node
         if not current.children:
             return current  # Leaf node
         
-        # Calculate UCT scores for all children
-        best_child = None
-        best_uct = float('-inf')
-        
-        for child in current.children:
-            if child.visits == 0:
-                uct_value = float('inf')  # Unvisited nodes have infinite priority
-            else:
-                # UCT formula from PDF: Q(n)/N(n) + c * sqrt(ln(N(parent))/N(n))
-                exploitation = child.value  # Q(n)/N(n) is already calculated in child.value
-                exploration = math.sqrt(math.log(max(current.visits, 1)) / child.visits)
-                uct_value = exploitation + (1.414 * exploration)  # c = sqrt(2) ≈ 1.414
-            
-            if uct_value > best_uct:
-                best_uct = uct_value
-                best_child = child
-        
-        if best_child is None:
-            return current
-        
-        current = best_child
-        path.append(current)
+        # UCT formula from PDF: Q(n)/N(n) + c * sqrt(ln(N(parent))/N(n)), c = sqrt(2) ≈ 1.414,
+        # over the child statistics (numpy arrays for wide nodes); Q(n)/N(n) is the child's mean value
+        current = current.children[current.child_stats.select(current.visits, 1.414, mcts.selection_rule)]
         
         # If we've reached a leaf or terminal node, return it
         if not current.children or current.state.depth >= mcts.config["experiment"]["max_depth"]:
@@ -1494,11 +1640,8 @@ def mcts_backpropagate(node, reward):
     current_reward = reward
     
     while current is not None:
-        # Update visit count
-        current.visits += 1
-        
-        # Update value using incremental average: value += (reward - value) / visits
-        current.value += (current_reward - current.value) / current.visits
+        # Update visit count and value using incremental average: value += (reward - value) / visits
+        current.update(current_reward)
         
         # Apply discount factor for parent nodes
         current_reward *= mcts.discount_factor
@@ -1509,18 +1652,8 @@ def mcts_backpropagate(node, reward):
 
 def mcts_best_child(node):
     """Select the child with highest average reward Q/N"""
-    if not node.children:
-        return None
-    
-    best_child = None
-    best_value = float('-inf')
-    
-    for child in node.children:
-        if child.visits > 0 and child.value > best_value:
-            best_value = child.value
-            best_child = child
-    
-    return best_child
+    best = node.child_stats.best_value()
+    return None if best is None else node.children[best]
 
 # Helper function to avoid code duplication
 def step_action(action):
@@ -1640,6 +1773,7 @@ def select_node():
         # Update current node and idea
         current_node = node
         main_idea = node.state.current_idea
+        speculator.speculate(node)
         
         # Log this action in chat
         chat_messages.append({
@@ -1698,6 +1832,46 @@ def get_idea():
     })
 
 
+def add_uploaded_file_chunk(filename, file_path, file_content, abstract):
+    """Register an uploaded file in knowledge_chunks and return its entry."""
+    new_id = len(knowledge_chunks) + 1
+    chunk = {
+        "id": new_id,
+        "text": f"Uploaded file: {filename}",
+        "full_text": file_content,
+        "abstract": abstract,
+        "source": file_path,
+        "file_type": "attachment",
+    }
+    knowledge_chunks.append(chunk)
+    return chunk
+
+
+def finish_pdf_ingestion(job, pages):
+    """Runs on the ingestion thread once a PDF's text is available."""
+    file_content = "\n".join(pages)
+    abstract = extract_abstract(pages)
+    chunk = add_uploaded_file_chunk(job["filename"], job["source"], file_content, abstract)
+    # Chunk and embed the paper so later prompts can pull its relevant passages
+    try:
+        knowledge_index.add_document(job["content_hash"], file_content, source=job["filename"])
+    except Exception as index_err:
+        logger.error(f"Error indexing {job['filename']}: {index_err}")
+    return {"abstract": abstract, "chunk": chunk}
+
+
+# PDF text extraction runs in the background so uploads return immediately
+pdf_ingestion_config = config.get("pdf_ingestion", {})
+pdf_ingestor = PDFIngestor(
+    pdf_ingestion_config.get("cache_dir", "data/pdf_text_cache"),
+    on_complete=finish_pdf_ingestion,
+    max_jobs=pdf_ingestion_config.get("max_jobs", 2),
+    max_processes=pdf_ingestion_config.get("max_processes"),
+    pages_per_task=pdf_ingestion_config.get("pages_per_task", 16),
+    parallel_page_threshold=pdf_ingestion_config.get("parallel_page_threshold", 32),
+)
+
+
 @app.route("/api/upload", methods=["POST"])
 def upload_file():
     if "file" not in request.files:
@@ -1707,9 +1881,6 @@ def upload_file():
     if file.filename == "":
         return jsonify({"error": "No selected file"}), 400
 
-    # Initialize abstract variable
-    abstract = "Abstract could not be extracted"  # Default value in case no abstract is found
-
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
         unique_filename = f"{uuid.uuid4()}_{filename}"
@@ -1717,34 +1888,23 @@ def upload_file():
 
         try:
             file.save(file_path)
-            file_content = "File content could not be extracted"
-            
-            # Extract text content from PDF using PyMuPDF if it's a PDF
+
             if file_path.lower().endswith('.pdf'):
-                try:
-                    pdf_text = []
-                    with pymupdf.open(file_path) as doc:
-                        for page_num in range(len(doc)):
-                            page = doc.load_page(page_num)
-                            pdf_text.append(page.get_text())
-                    file_content = "\n".join(pdf_text)
-                    # Extract the abstract from the PDF content
-                    abstract = extract_abstract(pdf_text)
-                except Exception as pdf_err:
-                    print(f"Error extracting PDF content: {pdf_err}")
-            
-            # Add file info to knowledge chunks
-            new_id = len(knowledge_chunks) + 1
-            chunk = {
-                "id": new_id,
-                "text": f"Uploaded file: {filename}",
-                "full_text": file_content,
-                "abstract": abstract,  # Added abstract here
-                "source": file_path,
-                "file_type": "attachment",
-            }
-            knowledge_chunks.append(chunk)
+                ingestion_id = pdf_ingestor.submit(file_path, filename)
+                return (
+                    jsonify(
+                        {
+                            "message": "File uploaded, extracting text",
+                            "filename": filename,
+                            "ingestion_id": ingestion_id,
+                            "status_url": f"/api/upload/{ingestion_id}",
+                        }
+                    ),
+                    202,
+                )
 
+            abstract = "Abstract could not be extracted"
+            chunk = add_uploaded_file_chunk(filename, file_path, "File content could not be extracted", abstract)
             return (
                 jsonify(
                     {
@@ -1763,6 +1923,16 @@ def upload_file():
     return jsonify({"error": "File type not allowed"}), 400
 
 
+@app.route("/api/upload/<ingestion_id>", methods=["GET"])
+def upload_status(ingestion_id):
+    """Progress of a background PDF ingestion started by /api/upload."""
+    status = pdf_ingestor.status(ingestion_id)
+    if status is None:
+        return jsonify({"error": "Unknown ingestion id"}), 404
+    status.pop("source", None)
+    return jsonify(status)
+
+
 @app.route("/api/review_aspect", methods=["POST"])
 def review_aspect():
     data = request.get_json()
@@ -1984,7 +2154,7 @@ def retrieve_knowledge():
         print(f"Retrieving knowledge for query: {query}")
         
         # Use ScholarQA to retrieve knowledge
-        result = scholar_qa.answer_query(query)
+        result = get_scholar_qa().answer_query(query, cancel_token=CancellationToken(timeout=RETRIEVAL_TIMEOUT))
         
         # Store the retrieval results globally
         global retrieval_results
@@ -2032,6 +2202,13 @@ def retrieve_knowledge():
             "query": query,
             "sections": formatted_sections
         })
+
+    except OperationCancelled as e:
+        chat_messages.append({
+            "role": "system",
+            "content": f"Knowledge retrieval timed out ({e}), please try a narrower query."
+        })
+        return jsonify({"error": f"Knowledge retrieval timed out: {e}"}), 504
     
     except Exception as e:
         error_trace = traceback.format_exc()
@@ -2058,27 +2235,6 @@ def improve_idea_with_knowledge():
         return jsonify({"error": "No retrieved knowledge available"}), 400
     
     try:
-        # Format the retrieved knowledge for the ideation agent
-        retrieved_content = []
-        for section in retrieval_results.get("sections", []):
-            section_text = f"## {section.get('title', 'Untitled')}\n\n"
-            section_text += f"{section.get('text', '')}\n\n"
-            
-            # Add citations if available
-            if section.get("citations"):
-                section_text += "### References:\n"
-                for citation in section.get("citations", []):
-                    paper = citation.get("paper", {})
-                    authors = ", ".join([author.get("name", "") for author in paper.get("authors", [])[:3]])
-                    if len(paper.get("authors", [])) > 3:
-                        authors += " et al."
-                    section_text += f"- {paper.get('title', 'Untitled')} ({authors}, {paper.get('year', 'n.d.')})\n"
-            
-            retrieved_content.append(section_text)
-        
-        # Join all sections into a single text
-        formatted_knowledge = "\n\n".join(retrieved_content)
-        
         # Add system message about the improvement process
         chat_messages.append({
             "role": "system",
@@ -2088,7 +2244,8 @@ def improve_idea_with_knowledge():
         # Add instructions to ensure markdown format and making only relevant improvements
         prompt_instructions = {
             "current_idea": idea,
-            "retrieved_content": formatted_knowledge,
+            # sections with their references, trimmed to the most relevant ones by the agent's prompt budget
+            "retrieved_content": retrieval_results,
         }
         
         # Call the ideation agent to improve the idea based on the retrieved knowledge
@@ -2269,12 +2426,13 @@ def refresh_idea():
 # WebSocket endpoints for real-time MCTS exploration
 @socketio.on('start_exploration')
 def handle_start_exploration():
-    global exploration_in_progress, current_state
+    global exploration_in_progress, current_state, exploration_token
     
     if exploration_in_progress:
         return {'error': 'Exploration already in progress'}
     
     exploration_in_progress = True
+    exploration_token = CancellationToken(timeout=EXPLORATION_TIMEOUT)
     
     try:
         # Create initial state if none exists
@@ -2289,7 +2447,8 @@ def handle_start_exploration():
             })
         
         # Run MCTS with callback
-        root = mcts.run(current_state, num_iterations=5, callback=exploration_callback)
+        root = mcts.run(current_state, num_iterations=5, callback=exploration_callback,
+                        cancel_token=exploration_token)
         
         # Store best path
         best_node = root
@@ -2303,7 +2462,8 @@ def handle_start_exploration():
         emit('exploration_complete', {
             'idea': current_state.current_idea,
             'score': current_state.average_score if hasattr(current_state, 'average_score') else None,
-            'tree_data': root.to_dict()
+            'tree_data': root.to_dict(),
+            'cancelled': exploration_token.cancelled
         })
         
     except Exception as e:
@@ -2314,9 +2474,28 @@ def handle_start_exploration():
 @socketio.on('stop_exploration')
 def handle_stop_exploration():
     global exploration_in_progress
+    if exploration_token is not None:
+        exploration_token.cancel("stopped by user")
     exploration_in_progress = False
     emit('exploration_stopped')
 
+@app.route("/api/speculation", methods=["GET", "POST"])
+def speculation_settings():
+    """Get or toggle speculative pre-expansion of the current node"""
+    if request.method == "POST":
+        data = request.get_json() or {}
+        if "enabled" not in data:
+            return jsonify({"error": "Missing 'enabled' in request"}), 400
+        speculator.enabled = bool(data["enabled"])
+        if speculator.enabled and current_node is not None:
+            speculator.speculate(current_node)
+    return jsonify({
+        "enabled": speculator.enabled,
+        "actions": speculator.actions,
+        "budget": speculator.budget,
+        "launched": speculator.launched,
+    })
+
 @app.route("/api/set_aspect_weights", methods=["POST"])
 def set_aspect_weights():
     """Update the weights for different review aspects."""
@@ -2411,5 +2590,61 @@ def check_configuration():
         
     return len(issues) == 0
 
+
+def warm_up_reranker(batch_size):
+    """Score one dummy batch so tokenizer setup and the first forward pass happen before real traffic."""
+    paper_finder = get_scholar_qa().paper_finder
+    if hasattr(paper_finder, "reranker_engine"):
+        paper_finder.reranker_engine.get_scores("warm-up query", ["warm-up passage text"] * batch_size)
+
+
+def import_llm_client():
+    """Import litellm (and the provider modules it loads) ahead of the first agent call. No request is sent and no
+    connection is opened, so the first call to the LLM provider still pays for its connection and TLS setup."""
+    import litellm  # noqa: F401
+
+
+def prime_s2_connection():
+    from scholarqa.utils import prime_s2_session
+
+    prime_s2_session()
+
+
+# Load models, run dummy inference and open pooled connections in the background; /readyz turns ready once done
+warmup_config = config.get("warmup", {})
+warmup = WarmUp()
+# IRIS_WARMUP=0 turns it off for one process, e.g. benchmarks/check_import_time.py
+if warmup_config.get("enabled", True) and os.environ.get("IRIS_WARMUP", "1") != "0":
+    warmup.add_step("scholar_qa", get_scholar_qa)
+    warmup.add_step("reranker", lambda: warm_up_reranker(warmup_config.get("rerank_batch_size", 32)))
+    # uploads are optional, so a missing embedding model must not keep /readyz at 503
+    warmup.add_step("knowledge_index", knowledge_index.warm_up, required=False)
+    warmup.add_step("llm_import", import_llm_client, required=False)
+    warmup.add_step("s2_connection", prime_s2_connection, required=False)
+    # the session retrieve_and_refine (/api/step) downloads papers and searches S2 with
+    warmup.add_step("mcts_s2_connection", mcts.prime_s2_session, required=False)
+warmup.start()
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Prometheus scrape endpoint: pipeline stage, MCTS phase and agent call latencies, cache, retry and token counters."""
+    body, content_type = metrics.render_latest()
+    return Response(body, content_type=content_type)
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: models are loaded and warm-up is done, 503 until then."""
+    state = warmup.snapshot()
+    return jsonify(state), 200 if state["ready"] else 503
+
+
 if __name__ == "__main__":
     socketio.run(app, debug=True)
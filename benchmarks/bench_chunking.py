@@ -0,0 +1,73 @@
+"""Micro-benchmark PaperProcessor._create_chunks against its previous sentence-by-sentence tokenization.
+
+Both versions chunk the same synthetic paper text; the chunks are checked to contain the same words.
+
+    python benchmarks/bench_chunking.py --sentences 20000 --model sentence-transformers/all-MiniLM-L6-v2
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+from transformers import AutoTokenizer
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.utils.chunking import iter_chunks
+
+WORDS = ["retrieval", "attention", "sparse", "language", "model", "benchmark", "hallucination", "summarization",
+         "graph", "reward", "training", "evaluation", "human", "dataset", "latency", "memory", "scaling", "tokens"]
+
+
+def legacy_create_chunks(tokenizer, text: str, chunk_size: int = 512) -> List[str]:
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    chunks, current_chunk, current_length = [], [], 0
+    for sentence in sentences:
+        sentence_length = len(tokenizer.encode(sentence))
+        if current_length + sentence_length > chunk_size and current_chunk:
+            chunks.append(" ".join(current_chunk))
+            current_chunk, current_length = [], 0
+        current_chunk.append(sentence)
+        current_length += sentence_length
+    if current_chunk:
+        chunks.append(" ".join(current_chunk))
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sentences", type=int, default=20000)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 40))).capitalize() + rng.choice(".!?")
+                 for _ in range(args.sentences)]
+    paragraphs = [" ".join(sentences[i:i + 12]) for i in range(0, len(sentences), 12)]
+    text = "\n\n".join(paragraphs)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+
+    timings = {"legacy": [], "offsets": []}
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        legacy = legacy_create_chunks(tokenizer, text, args.chunk_size)
+        timings["legacy"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        chunks = list(iter_chunks(text, tokenizer, args.chunk_size))
+        timings["offsets"].append(time.perf_counter() - start)
+        # the legacy chunker counts [CLS]/[SEP] per sentence, so its chunks hold fewer sentences
+        assert " ".join(legacy).split() == " ".join(chunks).split(), "chunks lost or reordered words"
+
+    legacy_time, offsets_time = min(timings["legacy"]), min(timings["offsets"])
+    print(f"{args.sentences} sentences ({len(text) / 1e6:.1f}M chars), chunks of {args.chunk_size} tokens, "
+          f"{len(legacy)} legacy / {len(chunks)} offset chunks")
+    print(f"legacy:  {legacy_time * 1000:8.1f} ms")
+    print(f"offsets: {offsets_time * 1000:8.1f} ms  ({legacy_time / offsets_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""End-to-end benchmark of /api/chat, /api/step, ScholarQA.run_qa_pipeline and MCTS.run, fully offline.
+
+The LLM is replaced by the scripted FakeLLM (benchmarks/fake_llm.py) and Semantic Scholar by a local stub server
+(benchmarks/s2_stub.py), both with configurable latency, so runs are reproducible on a laptop without network or
+api keys. Per scenario it reports throughput, p50/p95 latency, CPU time and RSS, plus LLM calls and S2 requests
+per operation:
+
+    python benchmarks/bench_end_to_end.py --iterations 5
+    python benchmarks/bench_end_to_end.py --scenarios scholarqa --llm-latency 0.5 --s2-latency 0.1 --output e2e.json
+    python benchmarks/bench_end_to_end.py --fixtures benchmarks/fixtures/s2.json --mcts-iterations 3
+
+The agents and ScholarQA pace their calls with fixed time.sleep calls, which would dominate every number here;
+they are skipped unless --keep-pacing-sleeps is passed. The simulated LLM latency is kept either way.
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from uuid import uuid4
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "src" / "retrieval_api"))
+sys.path.insert(0, str(Path(__file__).parent))
+from fake_llm import FakeLLM
+from s2_stub import S2Stub, load_fixtures, tokens
+
+STEP_ACTIONS = ["judge", "review_and_refine", "retrieve_and_refine"]
+# topical words of the synthesized fixtures, so the fake LLM's keyword queries find papers
+RESEARCH_GOALS = ["Reduce hallucination in abstractive summarization with preference optimization",
+                  "Sparse attention and curriculum training for chain of thought question answering",
+                  "Instruction tuning with active labeling for tool use and program synthesis",
+                  "Reward modeling from peer review scores for scientific discovery"]
+QUERIES = ["How does preference optimization affect hallucination in summarization?",
+           "What are the tradeoffs of sparse attention for long context language models?",
+           "Which methods combine dense retrieval with chain of thought question answering?",
+           "How robust is reward modeling to noisy labels?"]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest rank percentile."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Bench:
+    def __init__(self, llm: FakeLLM, stub: S2Stub):
+        self.llm = llm
+        self.stub = stub
+        self.results: List[Dict[str, Any]] = []
+
+    def measure(self, name: str, fn: Callable[[int], Any], iterations: int, warmup: int = 0,
+                setup: Optional[Callable[[int], Any]] = None) -> Dict[str, Any]:
+        """Run ``fn(i)`` ``warmup`` + ``iterations`` times, timing only the measured iterations and not ``setup(i)``."""
+        for i in range(warmup):
+            if setup:
+                setup(i)
+            fn(i)
+        latencies, cpu, llm_calls, s2_requests = [], 0.0, 0, 0
+        for i in range(iterations):
+            if setup:
+                setup(warmup + i)
+            calls, requests = sum(self.llm.calls.values()), sum(self.stub.requests.values())
+            cpu_start, start = time.process_time(), time.perf_counter()
+            fn(warmup + i)
+            latencies.append(time.perf_counter() - start)
+            cpu += time.process_time() - cpu_start
+            llm_calls += sum(self.llm.calls.values()) - calls
+            s2_requests += sum(self.stub.requests.values()) - requests
+        wall = sum(latencies)
+        result = {
+            "scenario": name,
+            "iterations": iterations,
+            "throughput_ops": iterations / wall if wall else 0.0,
+            "mean_s": wall / iterations,
+            "p50_s": percentile(latencies, 0.50),
+            "p95_s": percentile(latencies, 0.95),
+            "cpu_s_per_op": cpu / iterations,
+            "cpu_util": cpu / wall if wall else 0.0,
+            "rss_mb": rss_mb(),
+            "peak_rss_mb": peak_rss_mb(),
+            "llm_calls_per_op": llm_calls / iterations,
+            "s2_requests_per_op": s2_requests / iterations,
+        }
+        self.results.append(result)
+        print(f"  {name}: {result['mean_s']:.3f}s mean, {result['p95_s']:.3f}s p95", flush=True)
+        return result
+
+    def report(self) -> None:
+        header = f"{'scenario':<32} {'ops/s':>8} {'p50 s':>8} {'p95 s':>8} {'cpu s/op':>9} {'cpu %':>6} " \
+                 f"{'rss MB':>8} {'peak MB':>8} {'llm/op':>7} {'s2/op':>6}"
+        print(header)
+        print("-" * len(header))
+        for r in self.results:
+            print(f"{r['scenario']:<32} {r['throughput_ops']:8.2f} {r['p50_s']:8.3f} {r['p95_s']:8.3f} "
+                  f"{r['cpu_s_per_op']:9.3f} {100 * r['cpu_util']:6.1f} {r['rss_mb']:8.1f} {r['peak_rss_mb']:8.1f} "
+                  f"{r['llm_calls_per_op']:7.1f} {r['s2_requests_per_op']:6.1f}")
+
+
+class LexicalReranker:
+    """Token overlap scores standing in for the cross encoder, which would need the model weights."""
+
+    def get_scores(self, query: str, documents: List[str]) -> List[float]:
+        query_tokens = tokens(query)
+        return [len(query_tokens & tokens(doc)) / (len(query_tokens) or 1) for doc in documents]
+
+
+def build_scholar_qa(args, log_dir: str):
+    from scholarqa import ScholarQA
+    from scholarqa.config.config_setup import LogsConfig
+    from scholarqa.rag.retrieval import PaperFinderWithReranker
+    from scholarqa.rag.retriever_base import FullTextRetriever
+    from scholarqa.stage_cache import StageCache
+
+    logs_config = LogsConfig(log_dir=log_dir)
+    logs_config.init_formatter()
+    paper_finder = PaperFinderWithReranker(FullTextRetriever(n_retrieval=args.n_retrieval, n_keyword_srch=20),
+                                           reranker=LexicalReranker(), n_rerank=50, context_threshold=0.0)
+    return ScholarQA(paper_finder=paper_finder, llm_model="gemini/gemini-2.0-flash-lite", logs_config=logs_config,
+                     stage_cache=StageCache() if args.qa_cache else None)
+
+
+def run_app_scenarios(bench: Bench, args, scholar_qa) -> None:
+    import app as app_module
+
+    # retrieve_and_refine goes through the app's ScholarQA, built here on the offline retriever
+    app_module.scholar_qa = scholar_qa
+    client = app_module.app.test_client()
+
+    def post(path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        response = client.post(path, json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(as_text=True)[:500]}")
+        return response.get_json()
+
+    def reset(i: int) -> None:
+        app_module.current_root = None
+        app_module.current_node = None
+        app_module.chat_messages.clear()
+        app_module.speculator.reset()
+
+    def first_message(i: int) -> None:
+        post("/api/chat", {"content": RESEARCH_GOALS[i % len(RESEARCH_GOALS)]})
+
+    if "chat" in args.scenarios:
+        bench.measure("chat_first", first_message, args.iterations, args.warmup, setup=reset)
+
+        def fresh_idea(i: int) -> None:
+            reset(i)
+            first_message(i)
+
+        bench.measure("chat_feedback", lambda i: post("/api/chat", {"content": "Make the evaluation more concrete "
+                                                                               "and add a human study."}),
+                      args.iterations, args.warmup, setup=fresh_idea)
+
+    if "step" in args.scenarios:
+        reset(0)
+        first_message(0)
+        root, node = app_module.current_root, app_module.current_node
+
+        def restore(i: int) -> None:
+            # every step starts from the same first idea, not from the previous step's result
+            app_module.current_root, app_module.current_node = root, node
+            node.clear_children()
+
+        for action in args.step_actions:
+            bench.measure(f"step:{action}", lambda i, action=action: post("/api/step", {"action": action}),
+                          args.iterations, args.warmup, setup=restore)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default="chat,step,scholarqa,mcts",
+                        help="comma separated subset of chat, step, scholarqa and mcts")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--mcts-iterations", type=int, default=2, help="rollouts per MCTS.run")
+    parser.add_argument("--step-actions", default=",".join(STEP_ACTIONS))
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per simulated LLM call")
+    parser.add_argument("--llm-jitter", type=float, default=0.25, help="+/- fraction of the LLM latency")
+    parser.add_argument("--s2-latency", type=float, default=0.05, help="seconds per stub S2 request")
+    parser.add_argument("--fixtures", help="S2 fixtures json, synthesized when not given")
+    parser.add_argument("--n-retrieval", type=int, default=64)
+    parser.add_argument("--qa-cache", action="store_true", help="keep the ScholarQA stage cache on")
+    parser.add_argument("--keep-pacing-sleeps", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the results as json")
+    args = parser.parse_args()
+    args.scenarios = set(args.scenarios.split(","))
+    args.step_actions = args.step_actions.split(",")
+
+    stub = S2Stub(load_fixtures(args.fixtures), latency=args.s2_latency).start()
+    # read at import time by the app, ScholarQA and MCTS
+    os.environ.update({"S2_API_BASE_URL": stub.base_url, "IRIS_WARMUP": "0", "DEPLOY": "false"})
+    for key in ("SEMANTIC_SCHOLAR_API_KEY", "GEMINI_API_KEY", "GROQ_API_KEY", "HUGGINGFACE_API_KEY"):
+        os.environ.setdefault(key, "offline-benchmark")
+    os.chdir(ROOT)
+
+    llm = FakeLLM(latency=args.llm_latency, jitter=args.llm_jitter, seed=args.seed)
+    if not args.keep_pacing_sleeps:
+        time.sleep = lambda seconds: None
+    bench = Bench(llm, stub)
+    print(f"S2 stub at {stub.base_url}, LLM latency {args.llm_latency}s +/- {100 * args.llm_jitter:.0f}%")
+
+    try:
+        with llm.installed(), tempfile.TemporaryDirectory() as log_dir:
+            scholar_qa = build_scholar_qa(args, log_dir)
+            if "scholarqa" in args.scenarios:
+                from scholarqa.models import ToolRequest
+
+                bench.measure("scholarqa.run_qa_pipeline",
+                              lambda i: scholar_qa.run_qa_pipeline(
+                                  ToolRequest(task_id=str(uuid4()), query=QUERIES[i % len(QUERIES)],
+                                              user_id="bench")),
+                              args.iterations, args.warmup)
+            if args.scenarios & {"chat", "step"}:
+                run_app_scenarios(bench, args, scholar_qa)
+            if "mcts" in args.scenarios:
+                from src.mcts.node import MCTSState
+                from src.mcts.tree import MCTS
+
+                mcts = MCTS("config/config.yaml")
+
+                def rollouts(i: int) -> None:
+                    goal = RESEARCH_GOALS[i % len(RESEARCH_GOALS)]
+                    mcts.run(MCTSState(research_goal=goal, current_idea=goal, depth=0, reward=0.0,
+                                       retrieved_knowledge=[], feedback={}), args.mcts_iterations)
+
+                try:
+                    bench.measure(f"mcts.run[{args.mcts_iterations}]", rollouts, args.iterations, args.warmup)
+                finally:
+                    mcts.close()
+    finally:
+        stub.stop()
+
+    print()
+    bench.report()
+    print(f"\nLLM calls by route: {dict(llm.calls)}")
+    print(f"S2 requests by endpoint: {dict(stub.requests)}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": {k: sorted(v) if isinstance(v, set) else v for k, v in vars(args).items()
+                                  if k != "output"},
+                       "results": bench.results, "llm": llm.snapshot(), "s2": dict(stub.requests)},
+                      f, indent=2, default=str)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
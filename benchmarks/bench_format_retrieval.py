@@ -0,0 +1,122 @@
+"""Micro-benchmark PaperFinder.format_retrieval_response against its previous pandas apply/groupby version.
+
+Both versions run on the same synthetic aggregated candidates and the resulting frames are checked for equality.
+
+    python benchmarks/bench_format_retrieval.py --papers 200 --snippets 8
+"""
+import argparse
+import copy
+import random
+import string
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pandas as pd
+from anyascii import anyascii
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "retrieval_api"))
+from scholarqa.rag.retrieval import PaperFinder
+from scholarqa.utils import make_int, get_ref_author_str
+
+SECTIONS = ["abstract", "Introduction", "Related Work", "Method", "Experiments", "title", None]
+
+
+def legacy_format_retrieval_response(context_threshold: float,
+                                     agg_reranked_candidates: List[Dict[str, Any]]) -> pd.DataFrame:
+    def format_sections_to_markdown(row: List[Dict[str, Any]]) -> str:
+        sentences_df = pd.DataFrame(row)
+        if sentences_df.empty:
+            return ""
+        sentences_df.sort_values(by="char_start_offset", inplace=True)
+        grouped = sentences_df.groupby("section_title", sort=False)["text"].apply("\n...\n".join)
+        grouped = grouped[(grouped.index != "abstract") & (grouped.index != "title")]
+        return "\n\n".join(f"## {title}\n{text}" for title, text in grouped.items())
+
+    df = pd.DataFrame(agg_reranked_candidates)
+    try:
+        df = df.drop(["text", "section_title", "ref_mentions", "score", "stype", "rerank_score"], axis=1)
+    except Exception:
+        pass
+    df = df[~df.sentences.isna() & ~df.year.isna()] if not df.empty else df
+    if df.empty:
+        return df
+    df["corpus_id"] = df["corpus_id"].astype(int)
+    df = df[df["relevance_judgement"] > context_threshold]
+    if df.empty:
+        return df
+    df["year"] = df["year"].apply(make_int)
+    df["authors"] = df["authors"].fillna(value="")
+    df.rename(columns={"citationCount": "citation_count", "referenceCount": "reference_count",
+                       "influentialCitationCount": "influential_citation_count"}, inplace=True)
+    df = df.drop(columns=["corpusId", "paperId"])
+    prepend_text = df.apply(
+        lambda row: f"# Title: {row['title']}\n# Venue: {row['venue']}\n"
+                    f"# Authors: {', '.join([a['name'] for a in row['authors']])}\n## Abstract\n{row['abstract']}\n",
+        axis=1,
+    )
+    section_text = df["sentences"].apply(format_sections_to_markdown)
+    df.loc[:, "relevance_judgment_input_expanded"] = prepend_text + section_text
+    df["reference_string"] = df.apply(
+        lambda row: anyascii(f"[{make_int(row.corpus_id)} | {get_ref_author_str(row.authors)} | "
+                             f"{make_int(row['year'])} | Citations: {make_int(row['citation_count'])}]"),
+        axis=1,
+    )
+    return df
+
+
+def words(rng: random.Random, n: int) -> str:
+    return " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(n))
+
+
+def build_candidates(n_papers: int, n_snippets: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    candidates = []
+    for pidx in range(n_papers):
+        corpus_id = str(10 ** 6 + pidx)
+        # distinct offsets: the previous implementation sorted with an unstable sort, so ties had no defined order
+        offsets = rng.sample(range(0, 50000), n_snippets)
+        sentences = [{"corpus_id": corpus_id, "text": words(rng, 40), "section_title": rng.choice(SECTIONS),
+                      "char_start_offset": offset, "score": rng.random(), "stype": "vespa", "ref_mentions": []}
+                     for offset in offsets]
+        candidates.append({
+            "corpusId": int(corpus_id), "paperId": f"p{pidx}", "corpus_id": corpus_id, "title": words(rng, 8),
+            "abstract": words(rng, 60), "venue": rng.choice(["ACL", "NeurIPS", ""]), "year": rng.randint(2000, 2024),
+            "authors": [{"name": words(rng, 2)} for _ in range(rng.randint(1, 6))],
+            "citationCount": rng.randint(0, 5000), "referenceCount": rng.randint(0, 80),
+            "influentialCitationCount": rng.randint(0, 50), "isOpenAccess": True, "openAccessPdf": None,
+            "sentences": sentences, "relevance_judgement": rng.random(),
+        })
+    return candidates
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--papers", type=int, default=200)
+    parser.add_argument("--snippets", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    candidates = build_candidates(args.papers, args.snippets)
+    finder = PaperFinder(retriever=None, context_threshold=0.1)
+
+    timings = {"legacy": [], "columnar": []}
+    for _ in range(args.repeat):
+        legacy_input, columnar_input = copy.deepcopy(candidates), copy.deepcopy(candidates)
+        start = time.perf_counter()
+        legacy_df = legacy_format_retrieval_response(finder.context_threshold, legacy_input)
+        timings["legacy"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        columnar_df = finder.format_retrieval_response(columnar_input)
+        timings["columnar"].append(time.perf_counter() - start)
+        pd.testing.assert_frame_equal(legacy_df, columnar_df)
+
+    legacy, columnar = min(timings["legacy"]), min(timings["columnar"])
+    print(f"{args.papers} papers x {args.snippets} snippets")
+    print(f"legacy:   {legacy * 1000:8.1f} ms")
+    print(f"columnar: {columnar * 1000:8.1f} ms  ({legacy / columnar:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
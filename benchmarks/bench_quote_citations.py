@@ -0,0 +1,140 @@
+"""Benchmark MultiStepQAPipeline.get_quote_citations on a large synthetic reranked set.
+
+Compares the indexed matcher against the previous row-by-row, sentence-by-sentence scan (kept below as the
+reference implementation) and checks that both produce the same inline citations and rewritten quotes.
+
+    python benchmarks/bench_quote_citations.py --papers 300 --sentences 60 --quotes 8
+"""
+import argparse
+import copy
+import random
+import re
+import string
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "retrieval_api"))
+from scholarqa.rag.multi_step_qa_pipeline import MultiStepQAPipeline, CLOSE_BRACKET_PATTERN, OPEN_BRACKET_PATTERN
+
+
+def legacy_get_quote_citations(retrieval_df: pd.DataFrame, per_paper_summaries: Dict[str, str],
+                               plan_json: Dict[str, List[int]]) -> Dict[str, List[str]]:
+    per_paper_inline_cites = dict()
+    ref_str_list = [k for k in per_paper_summaries]
+    req_ref_strs = {ref_str_list[item] for sublist in plan_json.values() for item in sublist if
+                    item < len(ref_str_list)}
+    if req_ref_strs:
+        reqd_paper_summaries = {k: v for k, v in per_paper_summaries.items() if k in req_ref_strs}
+        reqd_ref_df = retrieval_df[retrieval_df["reference_string"].apply(lambda x: x in req_ref_strs)].copy()
+        reqd_ref_df["sentence_alpha"] = reqd_ref_df["sentences"].apply(
+            lambda x: [re.sub(r'[^a-zA-Z]', '', sentence["text"]).lower() for sentence in x])
+        for row_idx, row in reqd_ref_df.iterrows():
+            ref_str = row["reference_string"]
+            curr_reqd_quotes = reqd_paper_summaries[ref_str].split("...")
+            new_quotes = []
+            sentences = row["sentences"]
+            sent_alpa = row["sentence_alpha"]
+            curr_inline_citations = set()
+            curr_reqd_quotes_reg = [re.sub(r'[^a-zA-Z]', '', quote).lower() for quote in curr_reqd_quotes]
+            for quote, quote_reg in zip(curr_reqd_quotes, curr_reqd_quotes_reg):
+                new_quote = quote.strip()
+                shift = 0
+                for sidx, sentence in enumerate(sentences):
+                    if sentence.get("ref_mentions"):
+                        lookup_idx = sentence["text"].lower().find(quote.lower().strip())
+                        raw_match = lookup_idx >= 0
+                        if not raw_match:
+                            lookup_idx = sent_alpa[sidx].find(quote_reg)
+                        if lookup_idx >= 0:
+                            lookup_end = lookup_idx + len(quote)
+                            for sref in sentence["ref_mentions"]:
+                                if sref.get("start") >= lookup_idx and sref.get("end") <= lookup_end:
+                                    curr_inline_citations.add(sref["matchedPaperCorpusId"])
+                                    if raw_match:
+                                        new_start, new_end = sref["start"] - lookup_idx, sref["end"] - lookup_idx
+                                        cite_str = f"({sref['matchedPaperCorpusId']})"
+                                        new_quote = new_quote[:new_start + shift] + cite_str + new_quote[
+                                                                                               new_end + shift:]
+                                        shift += (len(cite_str) - sref["end"] + sref["start"])
+                            break
+                new_quotes.append(new_quote)
+            per_paper_inline_cites[ref_str] = list(sorted(curr_inline_citations))
+            new_quotes = "... ".join(new_quotes)
+            new_quotes = re.sub(CLOSE_BRACKET_PATTERN, r'[\1', new_quotes)
+            new_quotes = re.sub(OPEN_BRACKET_PATTERN, r'\1]', new_quotes)
+            per_paper_summaries[ref_str] = new_quotes
+    return per_paper_inline_cites
+
+
+def random_sentence(rng: random.Random, n_words: int) -> Dict[str, Any]:
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(n_words)]
+    text, ref_mentions = "", []
+    for word in words:
+        if rng.random() < 0.05:
+            start = len(text)
+            text += f"[{rng.randint(1, 60)}] "
+            ref_mentions.append({"start": start, "end": len(text) - 1,
+                                 "matchedPaperCorpusId": str(rng.randint(10 ** 6, 10 ** 7))})
+        else:
+            text += word + " "
+    return {"text": text.strip(), "ref_mentions": ref_mentions}
+
+
+def build_inputs(n_papers: int, n_sentences: int, n_quotes: int, seed: int = 0):
+    rng = random.Random(seed)
+    rows, summaries = [], dict()
+    for pidx in range(n_papers):
+        ref_str = f"[{10 ** 6 + pidx} | Doe et al. | 2024 | Citations: {pidx}]"
+        sentences = [random_sentence(rng, rng.randint(20, 60)) for _ in range(n_sentences)]
+        quotes = []
+        for _ in range(n_quotes):
+            text = rng.choice(sentences)["text"]
+            start = rng.randint(0, len(text) // 2)
+            quote = text[start:start + rng.randint(40, 200)]
+            roll = rng.random()
+            if roll < 0.2:
+                quote = quote.upper().replace(" ", "  ")  # only matches alphabet-only
+            elif roll < 0.3:
+                quote = "unmatched " + quote[::-1]
+            quotes.append(quote)
+        rows.append({"reference_string": ref_str, "sentences": sentences})
+        summaries[ref_str] = "...".join(quotes)
+    plan_json = {"dim": list(range(n_papers))}
+    return pd.DataFrame(rows), summaries, plan_json
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--papers", type=int, default=300)
+    parser.add_argument("--sentences", type=int, default=60)
+    parser.add_argument("--quotes", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df, summaries, plan_json = build_inputs(args.papers, args.sentences, args.quotes)
+    pipeline = object.__new__(MultiStepQAPipeline)  # get_quote_citations needs no llm configuration
+
+    timings = {"legacy": [], "indexed": []}
+    for _ in range(args.repeat):
+        legacy_summaries, indexed_summaries = copy.deepcopy(summaries), copy.deepcopy(summaries)
+        start = time.perf_counter()
+        legacy_cites = legacy_get_quote_citations(df, legacy_summaries, plan_json)
+        timings["legacy"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        indexed_cites = pipeline.get_quote_citations(df, indexed_summaries, plan_json)
+        timings["indexed"].append(time.perf_counter() - start)
+        assert legacy_cites == indexed_cites, "inline citations differ"
+        assert legacy_summaries == indexed_summaries, "rewritten quotes differ"
+
+    legacy, indexed = min(timings["legacy"]), min(timings["indexed"])
+    print(f"{args.papers} papers x {args.sentences} sentences x {args.quotes} quotes")
+    print(f"legacy:  {legacy * 1000:8.1f} ms")
+    print(f"indexed: {indexed * 1000:8.1f} ms  ({legacy / indexed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Micro-benchmark MCTS selection over ChildStats (numpy arrays from VECTORIZED_MIN_CHILDREN children on)
+against the previous per-child loop.
+
+Two copies of the same synthetic tree (~10^5 nodes by default) are built, one with plain node objects as
+the previous mcts_select walked them and one of MCTSNode with ChildStats. Both run the same rollouts
+(select a leaf, backpropagate a random reward) and are checked to select the same leaves.
+
+    python benchmarks/bench_uct_select.py --branching 316 --depth 2
+    python benchmarks/bench_uct_select.py --branching 4 --depth 8
+"""
+import argparse
+import math
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.mcts.node import MCTSNode, MCTSState
+
+C = 1.414
+DISCOUNT = 0.9
+
+
+class LegacyNode:
+    def __init__(self, depth: int, parent: Optional["LegacyNode"] = None, index: int = 0):
+        self.depth = depth
+        self.parent = parent
+        self.index = index
+        self.children: List["LegacyNode"] = []
+        self.visits = 0
+        self.value = 0.0
+
+
+def legacy_select(root: LegacyNode, max_depth: int) -> LegacyNode:
+    current = root
+    while True:
+        unvisited_children = [child for child in current.children if child.visits == 0]
+        if unvisited_children:
+            return random.choice(unvisited_children)
+        if not current.children:
+            return current
+        best_child, best_uct = None, float("-inf")
+        for child in current.children:
+            if child.visits == 0:
+                uct_value = float("inf")
+            else:
+                exploration = math.sqrt(math.log(max(current.visits, 1)) / child.visits)
+                uct_value = child.value + (C * exploration)
+            if uct_value > best_uct:
+                best_uct, best_child = uct_value, child
+        if best_child is None:
+            return current
+        current = best_child
+        if not current.children or current.depth >= max_depth:
+            return current
+
+
+def legacy_backpropagate(node: LegacyNode, reward: float) -> None:
+    while node is not None:
+        node.visits += 1
+        node.value += (reward - node.value) / node.visits
+        reward *= DISCOUNT
+        node = node.parent
+
+
+def array_select(root: MCTSNode, max_depth: int) -> MCTSNode:
+    # mcts_select in app.py
+    current = root
+    while True:
+        unvisited_children = current.child_stats.unvisited()
+        if len(unvisited_children):
+            return current.children[random.choice(unvisited_children)]
+        if not current.children:
+            return current
+        current = current.children[current.child_stats.select(current.visits, C)]
+        if not current.children or current.state.depth >= max_depth:
+            return current
+
+
+def array_backpropagate(node: MCTSNode, reward: float) -> None:
+    while node is not None:
+        node.update(reward)
+        reward *= DISCOUNT
+        node = node.parent
+
+
+def build_trees(branching: int, depth: int, seed: int):
+    """The same tree twice; every node starts with 1-50 visits and a random mean value."""
+    rng = random.Random(seed)
+    legacy_root, array_root = LegacyNode(0), MCTSNode(MCTSState())
+    level = [(legacy_root, array_root)]
+    n_nodes = 1
+    for d in range(1, depth + 1):
+        next_level = []
+        for legacy_parent, array_parent in level:
+            for i in range(branching):
+                legacy_child = LegacyNode(d, legacy_parent, i)
+                legacy_parent.children.append(legacy_child)
+                array_child = array_parent.add_child(MCTSState(depth=d))
+                legacy_child.visits = array_child.visits = rng.randint(1, 50)
+                legacy_child.value = array_child.value = rng.random()
+                next_level.append((legacy_child, array_child))
+        n_nodes += len(next_level)
+        level = next_level
+    for legacy_node, array_node in reversed(_all_pairs(legacy_root, array_root)):
+        if legacy_node.children:
+            legacy_node.visits = array_node.visits = sum(child.visits for child in legacy_node.children)
+    return legacy_root, array_root, n_nodes
+
+
+def _all_pairs(legacy_root: LegacyNode, array_root: MCTSNode):
+    pairs, stack = [], [(legacy_root, array_root)]
+    while stack:
+        legacy_node, array_node = stack.pop()
+        pairs.append((legacy_node, array_node))
+        stack.extend(zip(legacy_node.children, array_node.children))
+    return pairs
+
+
+def legacy_path(node: LegacyNode) -> List[int]:
+    path = []
+    while node.parent is not None:
+        path.append(node.index)
+        node = node.parent
+    return path[::-1]
+
+
+def array_path(node: MCTSNode) -> List[int]:
+    path = []
+    while node.parent is not None:
+        path.append(node.parent.children.index(node))
+        node = node.parent
+    return path[::-1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--branching", type=int, default=316)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--rollouts", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    legacy_root, array_root, n_nodes = build_trees(args.branching, args.depth, args.seed)
+    print(f"{n_nodes} nodes (branching {args.branching}, depth {args.depth}) built in "
+          f"{time.perf_counter() - start:.1f} s")
+
+    rng = random.Random(args.seed + 1)
+    rewards = [rng.random() for _ in range(args.rollouts)]
+    legacy_leaves, array_leaves = [], []
+    start = time.perf_counter()
+    for reward in rewards:
+        leaf = legacy_select(legacy_root, args.depth)
+        legacy_backpropagate(leaf, reward)
+        legacy_leaves.append(leaf)
+    legacy_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for reward in rewards:
+        leaf = array_select(array_root, args.depth)
+        array_backpropagate(leaf, reward)
+        array_leaves.append(leaf)
+    array_time = time.perf_counter() - start
+
+    assert [legacy_path(leaf) for leaf in legacy_leaves] == [array_path(leaf) for leaf in array_leaves], \
+        "selected leaves differ"
+    print(f"{args.rollouts} select + backpropagate rollouts")
+    print(f"legacy: {legacy_time / args.rollouts * 1e6:8.1f} us/rollout")
+    print(f"arrays: {array_time / args.rollouts * 1e6:8.1f} us/rollout  ({legacy_time / array_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
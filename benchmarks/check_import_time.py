@@ -0,0 +1,89 @@
+"""Measure the import time of app.py with `python -X importtime` and check it against a budget.
+
+The heavy ML/cloud stacks are loaded lazily, on the first request that needs them, so they must not show up
+while importing the app. Record a baseline on a given machine once, then compare later runs against it:
+
+    python benchmarks/check_import_time.py --write-baseline
+    python benchmarks/check_import_time.py --tolerance 0.25
+
+No baseline is checked in: import times depend on the machine and the installed packages.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).parent.parent
+DEFAULT_BASELINE = Path(__file__).parent / "import_time_baseline.json"
+# must stay out of the startup path
+LAZY_MODULES = ["torch", "sentence_transformers", "transformers", "litellm", "modal", "pandas", "pymupdf",
+                "langsmith", "scholarqa.scholar_qa"]
+LINE_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure(module: str) -> Tuple[float, Dict[str, float]]:
+    """(cumulative seconds for `module`, cumulative seconds per imported module)"""
+    # the app's background warm-up would race the measurement, it loads the lazy stacks on purpose
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1", "IRIS_WARMUP": "0"}
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                          capture_output=True, text=True, env=env)
+    if proc.returncode != 0:
+        sys.exit(f"importing {module} failed:\n{proc.stderr[-2000:]}")
+    per_module = dict()
+    for line in proc.stderr.splitlines():
+        match = LINE_PATTERN.match(line)
+        if match:
+            per_module[match.group(4)] = int(match.group(2)) / 1e6
+    return per_module.get(module, 0.0), per_module
+
+
+def top_level(per_module: Dict[str, float], n: int) -> List[Tuple[str, float]]:
+    roots = dict()
+    for name, cumulative in per_module.items():
+        root = name.split(".")[0]
+        roots[root] = max(roots.get(root, 0.0), cumulative)
+    return sorted(roots.items(), key=lambda x: -x[1])[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--repeat", type=int, default=3, help="runs to take the fastest of")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--write-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown over the baseline")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.repeat)]
+    total, per_module = min(runs, key=lambda run: run[0])
+    print(f"import {args.module}: {total:.3f}s (fastest of {args.repeat})")
+    for name, cumulative in top_level(per_module, args.top):
+        print(f"  {name:<32} {cumulative:8.3f}s")
+
+    failures = [f"{name} is imported at startup" for name in LAZY_MODULES if name in per_module]
+    if args.write_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"module": args.module, "seconds": total, "python": sys.version.split()[0]}, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+    elif args.baseline.exists():
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        budget = baseline["seconds"] * (1 + args.tolerance)
+        print(f"baseline: {baseline['seconds']:.3f}s, budget: {budget:.3f}s")
+        if total > budget:
+            failures.append(f"import took {total:.3f}s, over the {budget:.3f}s budget")
+    else:
+        print(f"no baseline at {args.baseline}, run with --write-baseline to record one")
+
+    if failures:
+        print("\n".join(["FAILED:"] + [f"  {failure}" for failure in failures]))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Scripted stand-in for litellm.completion so the IRIS agents and ScholarQA run without any LLM provider.
+
+Each request is routed on its prompts to a canned response in the format the caller parses: decomposed queries,
+quotes copied from the paper text, cluster plans, answer sections with citations, ideas, unified and single aspect
+reviews and search queries. Responses are deterministic and every call can be delayed by a configurable latency.
+
+    fake = FakeLLM(latency=0.2, jitter=0.25)
+    with fake.installed():
+        ...  # litellm.completion / litellm.batch_completion now answer from the script
+"""
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "src" / "retrieval_api"))
+from scholarqa.llms.prompts import PROMPT_ASSEMBLE_NO_QUOTES_SUMMARY, QUERY_DECOMPOSER_PROMPT, \
+    SYSTEM_PROMPT_QUOTE_CLUSTER, SYSTEM_PROMPT_QUOTE_PER_PAPER
+from src.agents import prompts as agent_prompts
+from src.agents.prompts import IDEATION_GENERATE_QUERY_PROMPT, REVIEW_SINGLE_ASPECT_PROMPT, REVIEW_SYSTEM_PROMPT
+
+ASPECTS = ["novelty", "clarity", "feasibility", "effectiveness", "impact"]
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z-]{3,}")
+# words of the agents' own prompt templates, so keywords come from the research goal and idea instead
+STOP_WORDS = {word.lower() for value in vars(agent_prompts).values() if isinstance(value, str)
+              for word in WORD_PATTERN.findall(value)} | {"adaptive", "combine", "input", "output"}
+
+
+def _prefix(template: str) -> str:
+    """The fixed text a prompt template starts with, up to its first placeholder."""
+    return template.split("{")[0].strip()[:60]
+
+
+def _keywords(text: str, n: int = 6) -> List[str]:
+    seen = []
+    for word in WORD_PATTERN.findall(text):
+        word = word.lower()
+        if word not in STOP_WORDS and word not in seen:
+            seen.append(word)
+        if len(seen) == n:
+            break
+    return seen or ["research"]
+
+
+def _between(text: str, start: str, end: str) -> str:
+    match = re.search(re.escape(start) + r"(.*?)" + re.escape(end), text, re.DOTALL)
+    return match.group(1).strip() if match else ""
+
+
+class FakeLLM:
+    """Deterministic scripted LLM. ``latency`` seconds (+/- ``jitter`` as a fraction) are slept per call."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        # kept so skipping the app's own pacing sleeps (see bench_end_to_end.py) does not remove the latency
+        self._sleep = time.sleep
+        self.calls = Counter()
+        self.tokens = Counter()
+        self.routes: List[Tuple[str, Callable[[str, str, Dict[str, Any]], bool], Callable[[str, str], str]]] = [
+            ("decompose", lambda system, user, kw: system.startswith(_prefix(QUERY_DECOMPOSER_PROMPT)),
+             self.decomposition),
+            ("cluster", lambda system, user, kw: system.startswith(_prefix(SYSTEM_PROMPT_QUOTE_CLUSTER)),
+             self.cluster_plan),
+            ("quote", lambda system, user, kw: system.startswith(_prefix(SYSTEM_PROMPT_QUOTE_PER_PAPER)),
+             self.quote),
+            ("section", lambda system, user, kw: "<section_name>" in user or
+                                                 user.startswith(_prefix(PROMPT_ASSEMBLE_NO_QUOTES_SUMMARY)),
+             self.section),
+            ("aspect_review", lambda system, user, kw: system.startswith(_prefix(REVIEW_SINGLE_ASPECT_PROMPT)),
+             self.aspect_review),
+            ("review", lambda system, user, kw: system.startswith(_prefix(REVIEW_SYSTEM_PROMPT)),
+             self.unified_review),
+            ("query", lambda system, user, kw: user.startswith(_prefix(IDEATION_GENERATE_QUERY_PROMPT)),
+             self.search_queries),
+            ("idea", lambda system, user, kw: True, self.idea),
+        ]
+
+    # canned responses, each in the format its caller parses
+
+    @staticmethod
+    def decomposition(system: str, user: str) -> str:
+        keywords = " ".join(_keywords(user))
+        return json.dumps({"earliest_search_year": "", "latest_search_year": "", "venues": "", "authors": [],
+                           "field_of_study": "", "rewritten_query": user.strip(),
+                           "rewritten_query_for_keyword_search": keywords})
+
+    @staticmethod
+    def quote(system: str, user: str) -> str:
+        paper = _between(user, "<paper_with_snippets>", "</paper_with_snippets>")
+        sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", paper) if len(s.split()) > 6]
+        if not sentences:
+            return "None"
+        return " ... ".join(sentences[:2])
+
+    @staticmethod
+    def cluster_plan(system: str, user: str) -> str:
+        n_quotes = len(re.findall(r"^\[\d+\]\t", user, re.MULTILINE))
+        indices = list(range(n_quotes))
+        dimensions = [{"name": "Background", "format": "synthesis", "quotes": indices[0::2]},
+                      {"name": "Approaches", "format": "list", "quotes": indices[1::2]}]
+        if n_quotes > 4:
+            dimensions.append({"name": "Open challenges", "format": "synthesis", "quotes": indices[:2]})
+        return json.dumps({"cot": "Group the quotes by background and approach.", "dimensions": dimensions})
+
+    @staticmethod
+    def section(system: str, user: str) -> str:
+        name = _between(user, "<section_name>", "</section_name>") or "Summary"
+        references = re.findall(r"^(\[[^\]\n]+\]):", _between(user, "<section_references>", "</section_references>"),
+                                re.MULTILINE)
+        citations = " ".join(references[:3])
+        return (f"{name}\nTLDR: Prior work covers {name.lower()} from several angles.\n"
+                f"Several studies address this aspect of the query {citations}. "
+                f"They report complementary findings that together outline the current state of the field.")
+
+    @staticmethod
+    def unified_review(system: str, user: str) -> str:
+        seed = sum(map(ord, user)) % 5
+        return json.dumps({"scores": {aspect: 5 + (seed + i) % 4 for i, aspect in enumerate(ASPECTS)},
+                           "reviews": {aspect: f"The {aspect} of the idea is adequate but could be sharpened."
+                                       for aspect in ASPECTS}})
+
+    @staticmethod
+    def aspect_review(system: str, user: str) -> str:
+        aspect = _between(system, "research idea on:", ".") or "clarity"
+        idea = user.split(":", 1)[-1]
+        words = idea.split()
+        return json.dumps({"aspect": aspect, "score": 6,
+                           "summary": f"The {aspect} could be improved.",
+                           "highlight": {"text": " ".join(words[:8]), "category": aspect,
+                                         "review": f"Make the {aspect} of this part explicit."}})
+
+    @staticmethod
+    def search_queries(system: str, user: str) -> str:
+        keywords = _keywords(user, 9)
+        queries = [" ".join(keywords[i:i + 3]) for i in range(0, len(keywords), 3)]
+        return json.dumps({"query": queries[0], "queries": queries})
+
+    @staticmethod
+    def idea(system: str, user: str) -> str:
+        topic = " ".join(_keywords(user, 4))
+        return json.dumps({
+            "title": f"Adaptive {topic}",
+            "proposed_method": f"Combine {topic} with retrieval of prior work and iterative self-critique.",
+            "experiment_plan": "Compare against two strong baselines on three public benchmarks with human raters.",
+            "test_case_examples": f"Input: a short description of {topic}. Output: a refined, grounded proposal.",
+        })
+
+    # litellm entry points
+
+    def respond(self, messages: List[Dict[str, str]], **kwargs) -> Tuple[str, str]:
+        """(route name, response text) for a chat request."""
+        system = "\n".join(m["content"] for m in messages if m.get("role") == "system" and m.get("content"))
+        user = "\n".join(m["content"] for m in messages if m.get("role") != "system" and m.get("content"))
+        for name, matches, respond in self.routes:
+            if matches(system, user, kwargs):
+                return name, respond(system, user)
+        raise AssertionError("the idea route matches every request")
+
+    def _delay(self) -> None:
+        if not self.latency:
+            return
+        with self._lock:
+            factor = 1 + self._rng.uniform(-self.jitter, self.jitter)
+        self._sleep(max(self.latency * factor, 0.0))
+
+    def completion(self, messages: List[Dict[str, str]], model: str = "fake", **kwargs) -> Any:
+        from litellm.types.utils import Choices, Message, ModelResponse, Usage
+
+        route, content = self.respond(messages, **kwargs)
+        self._delay()
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+        completion_tokens = len(content) // 4
+        with self._lock:
+            self.calls[route] += 1
+            self.tokens["input"] += prompt_tokens
+            self.tokens["output"] += completion_tokens
+        return ModelResponse(model=model, choices=[Choices(index=0, finish_reason="stop",
+                                                           message=Message(role="assistant", content=content))],
+                             usage=Usage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                         total_tokens=prompt_tokens + completion_tokens))
+
+    def batch_completion(self, messages: List[List[Dict[str, str]]], model: str = "fake", **kwargs) -> List[Any]:
+        return [self.completion(msgs, model=model, **kwargs) for msgs in messages]
+
+    @contextmanager
+    def installed(self) -> Iterator["FakeLLM"]:
+        import litellm
+
+        # resolve a lazily imported litellm first, loading it later would put the real functions back
+        originals = {"completion": litellm.completion, "batch_completion": litellm.batch_completion}
+        litellm.completion = self.completion
+        litellm.batch_completion = self.batch_completion
+        try:
+            yield self
+        finally:
+            for name, fn in originals.items():
+                setattr(litellm, name, fn)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"calls": dict(self.calls), "tokens": dict(self.tokens)}
@@ -0,0 +1,281 @@
+"""Local stand-in for the Semantic Scholar graph api: snippet/search, paper/search and paper/batch served from fixtures.
+
+Point the app at it with S2_API_BASE_URL. Fixtures are a json file of papers and snippets; they can be recorded from
+the live api once (needs network and SEMANTIC_SCHOLAR_API_KEY) or synthesized deterministically:
+
+    python benchmarks/s2_stub.py record --out benchmarks/fixtures/s2.json "llm hallucination" "retrieval augmentation"
+    python benchmarks/s2_stub.py synthesize --out benchmarks/fixtures/s2.json --papers 300
+    python benchmarks/s2_stub.py serve --fixtures benchmarks/fixtures/s2.json --port 8089
+    S2_API_BASE_URL=http://127.0.0.1:8089/graph/v1/ python app.py
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+LIVE_API_URL = "https://api.semanticscholar.org/graph/v1/"
+PAPER_FIELDS = "paperId,corpusId,title,abstract,authors,venue,year,citationCount,referenceCount," \
+               "influentialCitationCount,isOpenAccess,openAccessPdf"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+TOPICS = ["language models", "retrieval augmentation", "hallucination", "instruction tuning", "reward modeling",
+          "long context", "code generation", "scientific discovery", "human evaluation", "tool use",
+          "chain of thought", "knowledge graphs", "summarization", "question answering", "peer review"]
+METHODS = ["contrastive pretraining", "reinforcement learning from human feedback", "sparse attention",
+           "curriculum learning", "self-consistency decoding", "mixture of experts", "dense retrieval",
+           "preference optimization", "program synthesis", "active learning"]
+FINDINGS = ["improves factual accuracy", "reduces annotation cost", "generalizes to unseen domains",
+            "degrades under distribution shift", "scales log-linearly with data", "is robust to noisy labels",
+            "matches expert judgments", "halves inference latency"]
+VENUES = ["ACL", "EMNLP", "NeurIPS", "ICLR", "CHI", "NAACL", "ICML", "TACL"]
+SURNAMES = ["Smith", "Chen", "Garcia", "Kumar", "Müller", "Okafor", "Tanaka", "Rossi", "Novak", "Silva"]
+
+
+def tokens(text: str) -> set:
+    return set(TOKEN_PATTERN.findall(text.lower()))
+
+
+def synthesize_fixtures(n_papers: int = 200, snippets_per_paper: int = 4, seed: int = 0) -> Dict[str, Any]:
+    """Deterministic papers and full text snippets with enough topical overlap for searches to rank them."""
+    rng = random.Random(seed)
+    papers, snippets = [], []
+    for i in range(n_papers):
+        topic, method = rng.choice(TOPICS), rng.choice(METHODS)
+        corpus_id = 100000 + i
+        authors = [{"authorId": str(rng.randint(1, 10 ** 6)), "name": f"{rng.choice('ABCDEFGHJKLMNPRS')}. "
+                                                                     f"{rng.choice(SURNAMES)}"}
+                   for _ in range(rng.randint(1, 4))]
+        sentences = [f"We study {topic} with {method}.",
+                     f"Our experiments show that {method} {rng.choice(FINDINGS)} for {topic}.",
+                     f"Compared to prior work on {rng.choice(TOPICS)}, the approach {rng.choice(FINDINGS)}.",
+                     f"We release code and data to support further research on {topic} and {rng.choice(TOPICS)}."]
+        papers.append({
+            "paperId": f"{corpus_id:040x}",
+            "corpusId": corpus_id,
+            "title": f"{method.capitalize()} for {topic}: {rng.choice(['a study', 'revisited', 'at scale', 'in practice'])}",
+            "abstract": " ".join(sentences),
+            "authors": authors,
+            "venue": rng.choice(VENUES),
+            "year": rng.randint(2015, 2025),
+            "citationCount": int(rng.paretovariate(1.2) * 5),
+            "referenceCount": rng.randint(10, 80),
+            "influentialCitationCount": rng.randint(0, 20),
+            "isOpenAccess": False,
+            "openAccessPdf": None,
+        })
+        for j in range(snippets_per_paper):
+            body = " ".join(rng.sample(sentences, len(sentences)) +
+                            [f"Section {j + 1} details how {rng.choice(METHODS)} interacts with {topic} across "
+                             f"{rng.randint(3, 12)} benchmarks and {rng.randint(2, 9)} model sizes."])
+            snippets.append({"corpusId": corpus_id, "text": body,
+                             "section": rng.choice(["Introduction", "Method", "Experiments", "Discussion"]),
+                             "kind": "body"})
+    return {"papers": papers, "snippets": snippets}
+
+
+def record_fixtures(queries: List[str], limit: int = 20, api_key: Optional[str] = None) -> Dict[str, Any]:
+    """Query the live api for each query and keep the returned snippets and the metadata of every paper seen."""
+    import requests
+
+    headers = {"x-api-key": api_key or os.getenv("SEMANTIC_SCHOLAR_API_KEY", "")}
+    session = requests.Session()
+    corpus_ids, snippets, papers = set(), [], dict()
+    for query in queries:
+        res = session.get(LIVE_API_URL + "snippet/search", headers=headers, params={"query": query, "limit": limit})
+        res.raise_for_status()
+        for hit in res.json().get("data") or []:
+            corpus_ids.add(int(hit["paper"]["corpusId"]))
+            snippets.append({"corpusId": int(hit["paper"]["corpusId"]), "text": hit["snippet"]["text"],
+                             "section": hit.get("section", "body"), "kind": hit["snippet"].get("snippetKind", "body")})
+        res = session.get(LIVE_API_URL + "paper/search", headers=headers,
+                          params={"query": query, "limit": limit, "fields": PAPER_FIELDS})
+        res.raise_for_status()
+        for paper in res.json().get("data") or []:
+            if paper.get("corpusId"):
+                papers[paper["corpusId"]] = paper
+        time.sleep(1)  # stay under the api rate limit
+    missing = [cid for cid in corpus_ids if cid not in papers]
+    for start in range(0, len(missing), 500):
+        res = session.post(LIVE_API_URL + "paper/batch", headers=headers, params={"fields": PAPER_FIELDS},
+                           json={"ids": [f"CorpusId:{cid}" for cid in missing[start:start + 500]]})
+        res.raise_for_status()
+        for paper in res.json():
+            if paper and paper.get("corpusId"):
+                papers[paper["corpusId"]] = paper
+    return {"papers": list(papers.values()), "snippets": snippets}
+
+
+def load_fixtures(path: Optional[str]) -> Dict[str, Any]:
+    if not path:
+        return synthesize_fixtures()
+    with open(path) as f:
+        return json.load(f)
+
+
+class S2Stub:
+    """Serves the fixtures over http on a background thread; results are ranked by token overlap with the query.
+
+    ``latency`` seconds are added to every response to stand in for the network round trip.
+    """
+
+    def __init__(self, fixtures: Dict[str, Any], host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.papers = {int(paper["corpusId"]): paper for paper in fixtures["papers"]}
+        self.snippets = fixtures["snippets"]
+        self._paper_tokens = {cid: tokens(f"{paper.get('title', '')} {paper.get('abstract') or ''}")
+                              for cid, paper in self.papers.items()}
+        self._snippet_tokens = [tokens(snippet["text"]) for snippet in self.snippets]
+        self.latency = latency
+        # see FakeLLM._sleep, the benchmark may replace time.sleep
+        self._sleep = time.sleep
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/graph/v1/"
+
+    def start(self) -> "S2Stub":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="s2-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, endpoint: str) -> None:
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    @staticmethod
+    def _rank(query: str, candidates: List[set], limit: int) -> List[int]:
+        query_tokens = tokens(query)
+        scored = [(len(query_tokens & cand), -idx) for idx, cand in enumerate(candidates)]
+        return [-neg_idx for overlap, neg_idx in sorted(scored, reverse=True)[:limit] if overlap]
+
+    def snippet_search(self, query: str, limit: int) -> Dict[str, Any]:
+        data = []
+        for idx in self._rank(query, self._snippet_tokens, limit):
+            snippet = self.snippets[idx]
+            paper = self.papers.get(int(snippet["corpusId"]), {})
+            sentence_offsets, start = [], 0
+            for sentence in re.split(r"(?<=\.) ", snippet["text"]):
+                sentence_offsets.append({"start": start, "end": start + len(sentence)})
+                start += len(sentence) + 1
+            data.append({
+                "score": len(tokens(query) & self._snippet_tokens[idx]) / max(len(tokens(query)), 1),
+                "paper": {"corpusId": str(snippet["corpusId"]), "title": paper.get("title", "")},
+                "section": snippet.get("section", "body"),
+                "snippet": {"text": snippet["text"], "snippetKind": snippet.get("kind", "body"),
+                            "snippetOffset": {"start": 0, "end": len(snippet["text"])},
+                            "annotations": {"sentences": sentence_offsets, "refMentions": []}},
+            })
+        return {"data": data}
+
+    def paper_search(self, query: str, limit: int) -> Dict[str, Any]:
+        corpus_ids = list(self._paper_tokens)
+        ranked = self._rank(query, list(self._paper_tokens.values()), limit)
+        data = [self.papers[corpus_ids[idx]] for idx in ranked]
+        return {"total": len(data), "offset": 0, "data": data}
+
+    def paper_batch(self, ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        return [self.papers.get(int(pid.split(":")[-1])) if pid.split(":")[-1].isdigit() else None for pid in ids]
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status: int, body: Any = None) -> None:
+                payload = json.dumps(body).encode() if body is not None else b""
+                if stub.latency:
+                    stub._sleep(stub.latency)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_HEAD(self):
+                stub._count("HEAD")
+                self._reply(200)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                limit = int(params.get("limit", 10))
+                if url.path.endswith("/snippet/search"):
+                    stub._count("snippet/search")
+                    self._reply(200, stub.snippet_search(params.get("query", ""), limit))
+                elif url.path.endswith("/paper/search"):
+                    stub._count("paper/search")
+                    self._reply(200, stub.paper_search(params.get("query", ""), limit))
+                else:
+                    self._reply(404, {"error": f"not stubbed: {url.path}"})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if url.path.endswith("/paper/batch"):
+                    stub._count("paper/batch")
+                    self._reply(200, stub.paper_batch(body.get("ids", [])))
+                else:
+                    self._reply(404, {"error": f"not stubbed: {url.path}"})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="serve fixtures (synthetic ones if none are given)")
+    serve.add_argument("--fixtures")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8089)
+    serve.add_argument("--latency", type=float, default=0.0)
+    synthesize = commands.add_parser("synthesize", help="write deterministic synthetic fixtures")
+    synthesize.add_argument("--out", required=True)
+    synthesize.add_argument("--papers", type=int, default=200)
+    synthesize.add_argument("--snippets", type=int, default=4, help="snippets per paper")
+    synthesize.add_argument("--seed", type=int, default=0)
+    record = commands.add_parser("record", help="record fixtures from the live api")
+    record.add_argument("--out", required=True)
+    record.add_argument("--limit", type=int, default=20)
+    record.add_argument("queries", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        stub = S2Stub(load_fixtures(args.fixtures), host=args.host, port=args.port, latency=args.latency).start()
+        print(f"serving {len(stub.papers)} papers and {len(stub.snippets)} snippets at {stub.base_url}")
+        try:
+            stub._thread.join()
+        except KeyboardInterrupt:
+            stub.stop()
+        return
+    fixtures = synthesize_fixtures(args.papers, args.snippets, args.seed) if args.command == "synthesize" \
+        else record_fixtures(args.queries, args.limit)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(fixtures, f)
+    print(f"wrote {len(fixtures['papers'])} papers and {len(fixtures['snippets'])} snippets to {args.out}",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
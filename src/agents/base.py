@@ -1,13 +1,14 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any, List, Optional
 import os
-import yaml
 import json
 import re
 from pathlib import Path
 from loguru import logger
 import retry
 
+from .registry import load_config
+
 
 class BaseAgent(ABC):
     """Base class for all agents."""
@@ -19,9 +20,8 @@ class BaseAgent(ABC):
         self.messages = []
 
     def load_config(self, config_path: str) -> None:
-        """Load configuration from YAML file."""
-        with open(config_path) as f:
-            self.config = yaml.safe_load(f)
+        """Load configuration from YAML file, parsed once per process."""
+        self.config = load_config(config_path)
 
     def _get_api_key(self, provider: str) -> Optional[str]:
         """Get API key for the specified provider."""
@@ -1,4 +1,3 @@
-import yaml
 from pathlib import Path
 from loguru import logger
 import json
@@ -9,6 +8,7 @@ from typing import Dict, Any, Optional, List, Tuple
 import os
 # from google import genai
 from .base import BaseAgent
+from ..utils.cancellation import CancellationToken, llm_timeout_params
 from .prompts import (
     IDEATION_SYSTEM_PROMPT,
     IDEATION_GENERATE_PROMPT,
@@ -18,7 +18,11 @@ from .prompts import (
     IDEATION_IMPROVE_WITH_FEEDBACK_PROMPT,
     IDEATION_DIRECT_FEEDBACK_PROMPT,
 )
-import litellm
+from ..utils import metrics
+from ..utils.lazy_import import lazy_import
+from ..utils.prompt_budget import PromptBudget
+
+litellm = lazy_import("litellm")
 
 
 class IdeationAgent(BaseAgent):
@@ -27,8 +31,6 @@ class IdeationAgent(BaseAgent):
     def __init__(self, config_path: str):
         """Initialize the ideation agent."""
         super().__init__(config_path)
-        with open(config_path) as f:
-            self.config = yaml.safe_load(f)
 
         # Get model configuration
         # self.model = self.config["ideation_agent"].get("model", "gemini/gemini-2.0-flash-lite")
@@ -41,6 +43,9 @@ class IdeationAgent(BaseAgent):
         self.recent_approaches = []  # Memory of recent approaches
         self.memory_size = 3  # Keep last 3 items
 
+        # Bounds the input tokens of every prompt built by _get_action_prompt
+        self.prompt_budget = PromptBudget.from_config(self.config)
+
     def record_brief(self, brief: str):
         """Record a generated brief in memory"""
         self.generated_briefs.append(brief[:200])  # Store first 200 chars
@@ -59,10 +64,14 @@ class IdeationAgent(BaseAgent):
         return context
 
     @retry.retry(tries=3, delay=2)
-    def chat(self, model: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
-        """Send a chat request to the model."""
+    def chat(self, model: str, messages: List[Dict[str, str]],
+             cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """Send a chat request to the model, bounded by the token's remaining time."""
+        llm_params = llm_timeout_params(cancel_token)
         try:
-            response = litellm.completion(messages=messages, model=model)
+            with metrics.agent_call("ideation"):
+                response = litellm.completion(messages=messages, model=model, **llm_params)
+            metrics.record_usage("ideation", response, model)
             import time as t
             t.sleep(2)
             return response
@@ -84,7 +93,8 @@ class IdeationAgent(BaseAgent):
             {"role": "assistant", "content": action_result.get("content", "")}
         )
 
-    def execute_action(self, action: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    def execute_action(self, action: str, state: Dict[str, Any],
+                       cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
         """Execute a specific ideation action based on the current state."""
         try:
             # Add memory context to state
@@ -99,7 +109,7 @@ class IdeationAgent(BaseAgent):
                 {"role": "user", "content": prompt},
             ]
             # if action != "generate_query":
-            response = self.chat(model=self.model, messages=messages)
+            response = self.chat(model=self.model, messages=messages, cancel_token=cancel_token)
             content = response.choices[0].message.content
 
             # For debugging: print the raw LLM output to the terminal
@@ -379,8 +389,36 @@ class IdeationAgent(BaseAgent):
         # If all methods fail, return None
         return None
 
+    def _fit_prompt(self, template: str, query: Optional[str] = None, **components) -> Dict[str, Any]:
+        """Trim the prompt components (idea, knowledge, history) to the input token budget of the prompts."""
+        return self.prompt_budget.fit(fixed=IDEATION_SYSTEM_PROMPT + template, query=query, **components)
+
+    @staticmethod
+    def _format_section(section: Dict[str, Any]) -> str:
+        """A ScholarQA answer section with its references, as one passage of retrieved knowledge."""
+        section_text = f"## {section.get('title', 'Untitled')}\n\n{section.get('text', '')}\n\n"
+        if section.get("citations"):
+            section_text += "### References:\n"
+            for citation in section.get("citations", []):
+                paper = citation.get("paper", {})
+                authors = ", ".join([author.get("name", "") for author in paper.get("authors", [])[:3]])
+                if len(paper.get("authors", [])) > 3:
+                    authors += " et al."
+                section_text += f"- {paper.get('title', 'Untitled')} ({authors}, {paper.get('year', 'n.d.')})\n"
+        return section_text.strip()
+
+    def _knowledge_units(self, retrieved: Any) -> List[str]:
+        """Retrieved knowledge as a list of passages: ScholarQA results, context chunks or plain text."""
+        if not retrieved:
+            return []
+        if isinstance(retrieved, str):
+            return [retrieved]
+        if isinstance(retrieved, dict):
+            return [self._format_section(section) for section in retrieved.get("sections", [])]
+        return [item.get("text", "") if isinstance(item, dict) else str(item) for item in retrieved]
+
     def _get_action_prompt(self, action: str, state: Dict[str, Any]) -> str:
-        """Get the appropriate prompt for the given action."""
+        """Get the appropriate prompt for the given action, within the prompt token budget."""
         research_goal = state.get("research_goal", "")  # Get research_goal directly
         current_idea = state.get("current_idea", "")
         abstract = state.get("abstract", "")
@@ -388,9 +426,13 @@ class IdeationAgent(BaseAgent):
         if action == "generate":
             # Add memory context to avoid redundancy
             memory_context = self.get_memory_context()
-            prompt = IDEATION_GENERATE_PROMPT.format(research_topic=research_goal or current_idea, abstract_section=abstract)
-            if memory_context:
-                prompt += f"\n\nMemory context (avoid these approaches):\n{memory_context}"
+            research_topic = research_goal or current_idea
+            fitted = self._fit_prompt(IDEATION_GENERATE_PROMPT, query=research_topic,
+                                      knowledge=abstract, history=memory_context)
+            prompt = IDEATION_GENERATE_PROMPT.format(research_topic=research_topic,
+                                                     abstract_section=fitted["knowledge"])
+            if fitted["history"]:
+                prompt += f"\n\nMemory context (avoid these approaches):\n{fitted['history']}"
             return prompt
         
         elif action == "generate_query":
@@ -401,17 +443,20 @@ class IdeationAgent(BaseAgent):
                 last_query = memory_context.get('last_query')
                 if last_query:
                     memory_prompt = f"\n\nPrevious query: {last_query}\nGenerate a different query focusing on other aspects."
-            return IDEATION_GENERATE_QUERY_PROMPT.format(research_idea=current_idea) + memory_prompt
+            fitted = self._fit_prompt(IDEATION_GENERATE_QUERY_PROMPT + memory_prompt, idea=current_idea)
+            return IDEATION_GENERATE_QUERY_PROMPT.format(research_idea=fitted["idea"]) + memory_prompt
         elif action == "refresh_idea":
             # Add memory context to ensure fresh approach
             memory_context = self.get_memory_context()
+            fitted = self._fit_prompt(IDEATION_REFRESH_APPROACH_PROMPT + (research_goal or ""), query=research_goal,
+                                      idea=current_idea, knowledge=abstract, history=memory_context)
             memory_prompt = ""
-            if memory_context:
-                memory_prompt = f"\n\n{memory_context}\n\nGenerate a completely different approach that avoids the above patterns."
+            if fitted["history"]:
+                memory_prompt = f"\n\n{fitted['history']}\n\nGenerate a completely different approach that avoids the above patterns."
             return IDEATION_REFRESH_APPROACH_PROMPT.format(
                 research_topic=research_goal,
-                current_idea=current_idea,
-                abstract_section=abstract
+                current_idea=fitted["idea"],
+                abstract_section=fitted["knowledge"]
             ) + memory_prompt
         elif action == "review_and_refine":
             # Handle review feedback from state
@@ -438,9 +483,6 @@ class IdeationAgent(BaseAgent):
                 
                 review_feedback.append(feedback_item)
             
-            # Join all feedback into a single string
-            formatted_feedback = "\n".join(review_feedback)
-
             # Add memory context to avoid redundant refinements
             memory_prompt = ""
             if memory_context:
@@ -450,6 +492,12 @@ class IdeationAgent(BaseAgent):
             
             # Determine which version of the idea to use
             idea_to_improve = original_raw_output if original_raw_output else current_idea
+
+            # Review items are ordered by priority, keep the first ones when over budget
+            fitted = self._fit_prompt(IDEATION_IMPROVE_WITH_FEEDBACK_PROMPT + memory_prompt, recent=(),
+                                      idea=idea_to_improve, history=review_feedback)
+            idea_to_improve = fitted["idea"]
+            formatted_feedback = "\n".join(fitted["history"])
             
             # Custom prompt when using original raw output
             if original_raw_output:
@@ -478,19 +526,22 @@ class IdeationAgent(BaseAgent):
                 last_query = memory_context.get('last_query')
                 if last_query:
                     memory_prompt = f"\n\nPrevious query (try different approach): {last_query}"
-            # Handle both formats: direct retrieved_content parameter or context_chunks 
-            if "retrieved_content" in state:
-                # Direct content from API endpoint
-                retrieved_content = state.get("retrieved_content", "")
-                            
+            # Handle both formats: direct retrieved_content parameter or context_chunks,
+            # the passages most relevant to the idea are kept when they exceed the budget
+            knowledge = self._knowledge_units(state.get("retrieved_content") or state.get("context_chunks"))
+            fitted = self._fit_prompt(IDEATION_REFINE_WITH_RETRIEVAL_PROMPT + abstract + memory_prompt,
+                                      query=current_idea, idea=current_idea, knowledge=knowledge)
+
             return IDEATION_REFINE_WITH_RETRIEVAL_PROMPT.format(
-                current_idea=current_idea, retrieved_content=retrieved_content, abstract_section=abstract
+                current_idea=fitted["idea"], retrieved_content="\n\n".join(fitted["knowledge"]),
+                abstract_section=abstract
             ) + memory_prompt
         elif action == "process_feedback":
             # Handle user feedback from chat
             user_feedback = state.get("user_feedback", "")
+            fitted = self._fit_prompt(IDEATION_DIRECT_FEEDBACK_PROMPT + user_feedback, idea=current_idea)
             return IDEATION_DIRECT_FEEDBACK_PROMPT.format(
-                current_idea=current_idea, user_feedback=user_feedback
+                current_idea=fitted["idea"], user_feedback=user_feedback
             )
         else:
             raise ValueError(f"Unknown action: {action}")
@@ -0,0 +1,30 @@
+import os
+import threading
+from typing import Any, Dict, Tuple, Type, TypeVar
+
+import yaml
+
+T = TypeVar("T")
+
+_lock = threading.RLock()
+_configs: Dict[str, Dict[str, Any]] = {}
+_agents: Dict[Tuple[type, str], Any] = {}
+
+
+def load_config(config_path: str = "config/config.yaml") -> Dict[str, Any]:
+    """Parse a config file once per process; every caller shares the same dict."""
+    path = os.path.abspath(config_path)
+    with _lock:
+        if path not in _configs:
+            with open(path) as f:
+                _configs[path] = yaml.safe_load(f)
+        return _configs[path]
+
+
+def get_agent(agent_cls: Type[T], config_path: str = "config/config.yaml") -> T:
+    """Shared agent instance per (agent class, config file), so the app and MCTS use the same agents."""
+    key = (agent_cls, os.path.abspath(config_path))
+    with _lock:
+        if key not in _agents:
+            _agents[key] = agent_cls(config_path)
+        return _agents[key]
@@ -4,11 +4,15 @@ import yaml
 import logging
 from typing import Dict, Any, List, Optional, Tuple
 from .base import BaseAgent
+from ..utils.cancellation import CancellationToken, llm_timeout_params
 import numpy as np
 import retry
-import litellm
+from ..utils import metrics
+from ..utils.lazy_import import lazy_import
 from .prompts import REVIEW_SYSTEM_PROMPT, REVIEW_SINGLE_ASPECT_PROMPT, UNIFIED_REVIEW_PROMPT
 
+litellm = lazy_import("litellm")
+
 logger = logging.getLogger(__name__)
 
 class ReviewAgent(BaseAgent):
@@ -90,10 +94,14 @@ class ReviewAgent(BaseAgent):
         self.aspect_weights = weights
     
     @retry.retry(tries=3, delay=2)
-    def chat(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
-        """Send a chat request to the model."""
+    def chat(self, messages: List[Dict[str, str]],
+             cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """Send a chat request to the model, bounded by the token's remaining time."""
+        llm_params = llm_timeout_params(cancel_token)
         try:
-            response = litellm.completion(messages=messages, model=self.model)
+            with metrics.agent_call("review"):
+                response = litellm.completion(messages=messages, model=self.model, **llm_params)
+            metrics.record_usage("review", response, self.model)
             import time
             time.sleep(2)
             return response
@@ -112,7 +120,7 @@ class ReviewAgent(BaseAgent):
         }
         return descriptions.get(aspect, "")
     
-    def unified_review(self, idea: str) -> Dict[str, Any]:
+    def unified_review(self, idea: str, cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
         """Review all aspects of an idea in a single call and compute the weighted average score."""
         try:
             # Get memory context
@@ -137,7 +145,7 @@ class ReviewAgent(BaseAgent):
             ]
             
             # Execute the chat
-            response = self.chat(messages)
+            response = self.chat(messages, cancel_token=cancel_token)
             content = response.choices[0].message.content
             
             # Parse the response
@@ -1,4 +1,3 @@
-import yaml
 from pathlib import Path
 from loguru import logger
 import json
@@ -7,8 +6,12 @@ import time
 from typing import Dict, Any, Optional, List, Tuple
 import os
 import retry
-import litellm
 from .prompts import REVIEW_SINGLE_ASPECT_PROMPT
+from .registry import load_config
+from ..utils import metrics
+from ..utils.lazy_import import lazy_import
+
+litellm = lazy_import("litellm")
 
 
 class StructuredReviewAgent:
@@ -16,8 +19,7 @@ class StructuredReviewAgent:
 
     def __init__(self, config_path: str):
         """Initialize the structured review agent."""
-        with open(config_path) as f:
-            self.config = yaml.safe_load(f)
+        self.config = load_config(config_path)
 
         # Get model configuration 
         # self.model = self.config["ideation_agent"].get("model", "gemini/gemini-2.0-flash")
@@ -64,7 +66,9 @@ class StructuredReviewAgent:
     def chat(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         """Send a chat request to the model."""
         try:
-            response = litellm.completion(messages=messages, model=self.model)
+            with metrics.agent_call("structured_review"):
+                response = litellm.completion(messages=messages, model=self.model)
+            metrics.record_usage("structured_review", response, self.model)
             import time as t
             t.sleep(2)
             return response
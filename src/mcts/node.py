@@ -1,4 +1,4 @@
-from typing import List, Dict, Any, Optional, Set, Tuple
+from typing import List, Dict, Any, Optional, Sequence, Set, Tuple
 import math
 import numpy as np
 from pathlib import Path
@@ -116,6 +116,139 @@ class MCTSState:
         return state
 
 
+# below this many children, looping over the child nodes beats numpy's per-call overhead
+VECTORIZED_MIN_CHILDREN = 32
+
+
+class ChildStats:
+    """
+    Statistics of a node's children, indexed like ``node.children``: visit counts, mean values
+    and priors. While the node has few children (the common case, one child per action) they
+    stay on the child nodes and selection loops over them. From VECTORIZED_MIN_CHILDREN children
+    on they move into numpy arrays and selection is a single vectorized argmax.
+    """
+    def __init__(self, children: List['MCTSNode']):
+        self.children = children
+        self.vectorized = False
+        self.size = 0
+        self.visits = self.values = self.priors = None
+        self._log_visits = (1, 0.0)  # (parent visits, log of them), recomputed when the visits change
+
+    def attach(self, child: 'MCTSNode', prior: float = 1.0) -> None:
+        """Take over the statistics of child, which was just appended to the children."""
+        child._prior = prior
+        if not self.vectorized:
+            if len(self.children) >= VECTORIZED_MIN_CHILDREN:
+                self._vectorize()
+            return
+        if self.size == len(self.visits):
+            capacity = 2 * len(self.visits)
+            self.visits = np.resize(self.visits, capacity)
+            self.values = np.resize(self.values, capacity)
+            self.priors = np.resize(self.priors, capacity)
+        index = self.size
+        self.visits[index], self.values[index], self.priors[index] = child._visits, child._value, prior
+        child._slot = index
+        self.size += 1
+
+    def _vectorize(self) -> None:
+        capacity = 2 * len(self.children)
+        self.visits = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.priors = np.ones(capacity, dtype=np.float64)
+        for index, child in enumerate(self.children):
+            self.visits[index], self.values[index], self.priors[index] = child._visits, child._value, child._prior
+            child._slot = index
+        self.size = len(self.children)
+        self.vectorized = True
+
+    def clear(self) -> None:
+        """Hand the statistics back to the child nodes, before they are removed."""
+        if self.vectorized:
+            for child in self.children:
+                child._visits, child._value, child._prior = child.visits, child.value, float(self.priors[child._slot])
+                child._slot = None
+        self.vectorized = False
+        self.size = 0
+        self.visits = self.values = self.priors = None
+
+    def update(self, index: int, reward: float) -> None:
+        """Count a visit of child index and fold reward into its mean value (vectorized statistics only)."""
+        visits, value = int(self.visits[index]) + 1, float(self.values[index])
+        self.visits[index] = visits
+        self.values[index] = value + (reward - value) / visits
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(visits, values, priors) of the children as numpy arrays."""
+        if self.vectorized:
+            return self.visits[:self.size], self.values[:self.size], self.priors[:self.size]
+        return (np.array([child._visits for child in self.children], dtype=np.int64),
+                np.array([child._value for child in self.children], dtype=np.float64),
+                np.array([child._prior for child in self.children], dtype=np.float64))
+
+    def unvisited(self) -> Sequence[int]:
+        """Indices of the children that were never visited."""
+        if not self.vectorized:
+            return [i for i, child in enumerate(self.children) if child._visits == 0]
+        return np.flatnonzero(self.visits[:self.size] == 0)
+
+    def log_visits(self, parent_visits: int) -> float:
+        parent_visits = max(parent_visits, 1)
+        if self._log_visits[0] != parent_visits:
+            self._log_visits = (parent_visits, math.log(parent_visits))
+        return self._log_visits[1]
+
+    def uct_scores(self, parent_visits: int, c: float, unvisited: float = np.inf) -> np.ndarray:
+        """Q(n)/N(n) + c * sqrt(ln N(parent) / N(n)) of each child; ``unvisited`` for children without visits."""
+        visits, values, _ = self.arrays()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = values + c * np.sqrt(self.log_visits(parent_visits) / visits)
+        scores[visits == 0] = unvisited
+        return scores
+
+    def puct_scores(self, parent_visits: int, c: float) -> np.ndarray:
+        """Q(n)/N(n) + c * P(n) * sqrt(N(parent)) / (1 + N(n)) of each child, priors normalized to sum to 1."""
+        visits, values, priors = self.arrays()
+        return values + c * priors / priors.sum() * math.sqrt(parent_visits) / (1 + visits)
+
+    def select(self, parent_visits: int, c: float, rule: str = "uct") -> Optional[int]:
+        """Index of the child with the highest UCT (or PUCT) score, the first one on ties; None without children."""
+        if not self.children:
+            return None
+        if self.vectorized:
+            scores = self.puct_scores(parent_visits, c) if rule == "puct" else self.uct_scores(parent_visits, c)
+            return int(np.argmax(scores))
+        best, best_score = None, -math.inf
+        if rule == "puct":
+            scale = c / sum(child._prior for child in self.children) * math.sqrt(parent_visits)
+            for i, child in enumerate(self.children):
+                score = child._value + child._prior * scale / (1 + child._visits)
+                if score > best_score:
+                    best, best_score = i, score
+            return best
+        log_visits = self.log_visits(parent_visits)
+        for i, child in enumerate(self.children):
+            if child._visits == 0:
+                return i
+            score = child._value + c * math.sqrt(log_visits / child._visits)
+            if score > best_score:
+                best, best_score = i, score
+        return best
+
+    def best_value(self) -> Optional[int]:
+        """Index of the visited child with the highest mean value, None if no child was visited."""
+        if not self.vectorized:
+            best = None
+            for i, child in enumerate(self.children):
+                if child._visits and (best is None or child._value > self.children[best]._value):
+                    best = i
+            return best
+        visits = self.visits[:self.size]
+        if not visits.any():
+            return None
+        return int(np.argmax(np.where(visits > 0, self.values[:self.size], -np.inf)))
+
+
 class MCTSNode:
     """
     Node in the MCTS tree.
@@ -133,8 +266,13 @@ class MCTSNode:
         self.action = action
         self.parent = parent
         self.children = []
-        self.visits = 0
-        self.value = 0
+        # visits and value are kept on the node, or in the parent's child_stats arrays (at _slot) once the
+        # parent has VECTORIZED_MIN_CHILDREN children, see the properties below
+        self.child_stats = ChildStats(self.children)
+        self._slot = None
+        self._visits = 0
+        self._value = 0
+        self._prior = 1.0
         self.exploration_weight = exploration_weight
         self.actions = ["generate", "reflect_and_reframe", "review_and_refine", "retrieve_and_refine"]
 
@@ -145,17 +283,58 @@ class MCTSNode:
             "average_score": 0.0
         }
 
-    def add_child(self, state: MCTSState, action: str = None) -> 'MCTSNode':
+    @property
+    def visits(self) -> int:
+        if self._slot is None:
+            return self._visits
+        return int(self.parent.child_stats.visits[self._slot])
+
+    @visits.setter
+    def visits(self, visits: int) -> None:
+        if self._slot is None:
+            self._visits = visits
+        else:
+            self.parent.child_stats.visits[self._slot] = visits
+
+    @property
+    def value(self) -> float:
+        if self._slot is None:
+            return self._value
+        return float(self.parent.child_stats.values[self._slot])
+
+    @value.setter
+    def value(self, value: float) -> None:
+        if self._slot is None:
+            self._value = value
+        else:
+            self.parent.child_stats.values[self._slot] = value
+
+    def add_child(self, state: MCTSState, action: str = None, prior: float = 1.0) -> 'MCTSNode':
         """Add a child node with the given state and action."""
         child_node = MCTSNode(state=state, action=action, parent=self)
-        self.children.append(child_node)
-        return child_node
+        return self.attach_child(child_node, prior)
+
+    def attach_child(self, child: 'MCTSNode', prior: float = 1.0) -> 'MCTSNode':
+        """Make an existing node the last child of this node, moving its statistics into child_stats."""
+        child._visits, child._value, child._slot = child.visits, child.value, None
+        child.parent = self
+        self.children.append(child)
+        self.child_stats.attach(child, prior)
+        return child
+
+    def clear_children(self) -> None:
+        """Remove all children; they keep their statistics as detached nodes."""
+        self.child_stats.clear()
+        self.children.clear()
 
     def update(self, reward: float) -> None:
         """Update node statistics."""
-        self.visits += 1
-        # Incremental update of value
-        self.value += (reward - self.value) / self.visits
+        if self._slot is None:
+            self._visits += 1
+            # Incremental update of value
+            self._value += (reward - self._value) / self._visits
+        else:
+            self.parent.child_stats.update(self._slot, reward)
 
     def fully_expanded(self) -> bool:
         """Check if all possible actions have been explored."""
@@ -166,21 +345,16 @@ class MCTSNode:
         """Select best child node according to UCB formula."""
         if exploration_weight is None:
             exploration_weight = self.exploration_weight
-
-        # UCB formula: value + exploration_weight * sqrt(ln(parent visits) / child visits)
-        def ucb_score(child):
-            exploitation = child.value
-            exploration = math.sqrt(2 * math.log(self.visits) / child.visits)
-            return exploitation + exploration_weight * exploration
-
-        # Filter out children with zero visits (should not happen in practice)
-        valid_children = [child for child in self.children if child.visits > 0]
-        if not valid_children:
+        if not self.children:
+            return None
+        if not any(child.visits for child in self.children):
             # If no visits yet, select randomly among all children
-            return np.random.choice(self.children) if self.children else None
+            return np.random.choice(self.children)
 
-        # Return the child with the highest UCB score
-        return max(valid_children, key=ucb_score)
+        # UCB formula: value + exploration_weight * sqrt(2 * ln(parent visits) / child visits),
+        # children with zero visits are left out
+        scores = self.child_stats.uct_scores(self.visits, exploration_weight * math.sqrt(2), unvisited=-np.inf)
+        return self.children[int(np.argmax(scores))]
 
     def to_json(self) -> Dict[str, Any]:
         """Serialize node to JSON."""
@@ -248,8 +422,7 @@ class MCTSNode:
         # Recursively build children
         for child_data in data.get("children", []):
             child = cls.build_tree_from_json(child_data)
-            child.parent = node
-            node.add_child(child)
+            node.attach_child(child)
             
         return node
 
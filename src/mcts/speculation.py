@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from .node import MCTSNode
+from ..utils import metrics
+from ..utils.cancellation import CancellationToken, OperationCancelled
+
+
+class SpeculativeExpander:
+    """Pre-compute likely next actions for the node the user is currently looking at.
+
+    Speculations run on a small background pool and are keyed by (node id, action) in an
+    LRU cache. When the user picks an action, the finished (or already running) result is
+    adopted instead of being computed from scratch. Each session may launch at most
+    ``budget`` speculations; evicted and superseded speculations are cancelled.
+    """
+
+    def __init__(
+        self,
+        compute_fn: Callable[[MCTSNode, str, CancellationToken], Any],
+        actions: Sequence[str],
+        budget: int = 6,
+        cache_size: int = 8,
+        max_workers: int = 1,
+        timeout: Optional[float] = None,
+        enabled: bool = False,
+    ):
+        self.compute_fn = compute_fn
+        self.actions = list(actions)
+        self.budget = budget
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self.enabled = enabled
+        self.launched = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculation")
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Future, CancellationToken]]" = OrderedDict()
+
+    def reset(self) -> None:
+        """Start a new session: drop every speculation and restore the budget."""
+        with self._lock:
+            for future, token in self._entries.values():
+                token.cancel("session reset")
+                future.cancel()
+            self._entries.clear()
+            self.launched = 0
+
+    def speculate(self, node: MCTSNode) -> List[str]:
+        """Schedule background expansion of node for every configured action; returns the actions scheduled."""
+        if not self.enabled:
+            return []
+        scheduled = []
+        with self._lock:
+            # Unfinished work for nodes the user navigated away from is unlikely to be adopted
+            for key, (future, token) in list(self._entries.items()):
+                if key[0] != node.id and not future.done():
+                    token.cancel("superseded")
+                    future.cancel()
+                    del self._entries[key]
+
+            for action in self.actions:
+                key = (node.id, action)
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    continue
+                if self.launched >= self.budget:
+                    logger.info(f"Speculation budget of {self.budget} exhausted for this session")
+                    break
+                token = CancellationToken(timeout=self.timeout)
+                self._entries[key] = (self._executor.submit(self._run, node, action, token), token)
+                self.launched += 1
+                scheduled.append(action)
+
+            while len(self._entries) > self.cache_size:
+                _, (future, token) = self._entries.popitem(last=False)
+                token.cancel("evicted")
+                future.cancel()
+        return scheduled
+
+    def adopt(self, node: MCTSNode, action: str) -> Optional[Any]:
+        """Take the speculative result for (node, action), waiting for it if it is already running.
+
+        Returns None when there is nothing to adopt, so the caller computes the action itself.
+        """
+        with self._lock:
+            entry = self._entries.pop((node.id, action), None)
+        if self.enabled:
+            metrics.record_cache("speculation", entry is not None)
+        if entry is None:
+            return None
+        future, token = entry
+        # Still queued behind another speculation: computing in the request is just as fast
+        if future.cancel():
+            return None
+        try:
+            result = future.result()
+        except (Exception, OperationCancelled) as e:
+            logger.warning(f"Discarding failed speculation of {action} for node {node.id}: {e}")
+            return None
+        logger.info(f"Adopted speculative {action} for node {node.id}")
+        return result
+
+    def _run(self, node: MCTSNode, action: str, token: CancellationToken) -> Any:
+        logger.debug(f"Speculatively running {action} for node {node.id}")
+        return self.compute_fn(node, action, token)
@@ -1,20 +1,47 @@
 import random
 from typing import List, Dict, Any, Optional, Tuple, Set
 from pathlib import Path
+import hashlib
 import json
 import yaml
 from loguru import logger
-from collections import defaultdict
+from collections import Counter
 import math
 from .node import MCTSNode, MCTSState
 import numpy as np
 import re
 import requests
+from requests.adapters import HTTPAdapter
 import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from functools import lru_cache
 from tqdm import tqdm
 import subprocess
 from ..agents.ideation import IdeationAgent
 from ..agents.review import ReviewAgent
+from ..agents.registry import load_config, get_agent
+from ..utils import metrics
+from ..utils.cancellation import CancellationToken, OperationCancelled
+from ..utils.chunking import iter_chunks
+from ..utils.prompt_budget import count_tokens, get_encoding
+from ..utils.text_relevance import rank_diverse, terms
+
+# headings and JSON keys of a formatted idea, not search terms
+IDEA_SECTION_WORDS = {"title", "proposed", "method", "experiment", "plan", "test", "case", "examples", "research",
+                      "idea", "content"}
+
+
+@lru_cache(maxsize=None)
+def _doc2json_processor():
+    """s2orc-doc2json's PDF converter when importable, else None and it is run as a module in a subprocess."""
+    try:
+        from doc2json.grobid2json.process_pdf import process_pdf_file
+    except ImportError:
+        return None
+    return process_pdf_file
 
 
 class MCTS:
@@ -22,12 +49,11 @@ class MCTS:
 
     def __init__(self, config_path: str):
         """Initialize MCTS with configuration."""
-        with open(config_path) as f:
-            self.config = yaml.safe_load(f)
+        self.config = load_config(config_path)
 
-        # Initialize agents
-        self.ideation_agent = IdeationAgent(config_path)
-        self.review_agent = ReviewAgent(config_path)
+        # Agents are shared with the rest of the app through the registry
+        self.ideation_agent = get_agent(IdeationAgent, config_path)
+        self.review_agent = get_agent(ReviewAgent, config_path)
 
         self.load_prompts()
 
@@ -37,14 +63,13 @@ class MCTS:
         self.results_dir = Path(self.config["experiment"]["results_dir"])
         self.results_dir.mkdir(parents=True, exist_ok=True)
 
-        # MCTS specific parameters
-        self.Q = defaultdict(float)  # total reward of each node
-        self.N = defaultdict(int)  # visit count for each node
+        # MCTS specific parameters; visit counts and mean rewards live in the nodes (MCTSNode.child_stats)
         self.parent2children = {}  # children of each node
         self.explored_nodes = set()  # tracked explored nodes
 
         # Parameters from config
         self.exploration_weight = self.config["mcts"]["exploration_constant"]
+        self.selection_rule = self.config["mcts"].get("selection", "uct")
         self.num_rollouts = self.config["experiment"]["n_rollouts"]
         self.discount_factor = self.config["mcts"]["discount_factor"]
 
@@ -56,7 +81,7 @@ class MCTS:
         self.grobid_dir.mkdir(parents=True, exist_ok=True)
 
         # Semantic Scholar API settings
-        self.s2_api_url = "https://api.semanticscholar.org/graph/v1"
+        self.s2_api_url = os.getenv("S2_API_BASE_URL", "https://api.semanticscholar.org/graph/v1").rstrip("/")
         s2_api_key = os.getenv("SEMANTIC_SCHOLAR_API_KEY")
         if not s2_api_key:
             logger.warning("SEMANTIC_SCHOLAR_API_KEY environment variable is not set. Semantic Scholar API features will be disabled.")
@@ -66,27 +91,67 @@ class MCTS:
                 "x-api-key": s2_api_key
             }
 
+        # Concurrent paper acquisition for retrieve_and_refine, see _retrieve_and_process_papers
+        acquisition_config = self.config.get("paper_acquisition", {})
+        self.download_timeout = acquisition_config.get("download_timeout", 30)
+        self.max_pdf_bytes = int(acquisition_config.get("max_pdf_mb", 25) * 1024 * 1024)
+        self._oversized_pdfs: Set[str] = set()  # urls not to download again
+        self.grobid_timeout = acquisition_config.get("grobid_timeout", 180)
+        self.search_dir = self.retrieved_dir / "search"
+        self.search_dir.mkdir(parents=True, exist_ok=True)
+        self.search_cache_ttl = acquisition_config.get("search_cache_ttl", 7 * 24 * 3600)
+        self.search_cache_max_entries = acquisition_config.get("search_cache_max_entries", 5000)
+        self._prune_search_cache()
+        (self.grobid_dir / "tmp").mkdir(parents=True, exist_ok=True)
+        self._search_pool = ThreadPoolExecutor(max_workers=acquisition_config.get("search_workers", 4),
+                                               thread_name_prefix="s2-search")
+        self._download_pool = ThreadPoolExecutor(max_workers=acquisition_config.get("download_workers", 8),
+                                                 thread_name_prefix="pdf-download")
+        # grobid does the heavy lifting server side, a few conversions at a time keep it from queueing up
+        self._grobid_pool = ThreadPoolExecutor(max_workers=acquisition_config.get("grobid_workers", 2),
+                                               thread_name_prefix="grobid")
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=acquisition_config.get("download_workers", 8) +
+                              acquisition_config.get("search_workers", 4))
+        self._http.mount("https://", adapter)
+        self._http.mount("http://", adapter)
+
+    def prime_s2_session(self, timeout: float = 10) -> None:
+        """Open a pooled connection to the S2 api ahead of the first search; the response itself is ignored."""
+        self._http.head(self.s2_api_url, headers=self.s2_headers, timeout=timeout)
+
+    def close(self) -> None:
+        """Stop the paper acquisition pools and close the HTTP session; queued downloads are dropped."""
+        for pool in (self._search_pool, self._download_pool, self._grobid_pool):
+            pool.shutdown(wait=True, cancel_futures=True)
+        self._http.close()
+
     def load_prompts(self) -> None:
         """Load prompts from configuration."""
         prompts_path = Path(self.config["experiment"]["prompts_path"])
         with open(prompts_path) as f:
             self.prompts = yaml.safe_load(f)
 
-    def do_rollout(self, root_node: MCTSNode, rollout_id: int) -> MCTSNode:
+    def do_rollout(self, root_node: MCTSNode, rollout_id: int,
+                   cancel_token: Optional[CancellationToken] = None) -> MCTSNode:
         """Perform one iteration of MCTS."""
         self.current_rollout_id = rollout_id
         logger.debug("Starting selection phase...")
-        path = self._select(root_node)
+        with metrics.timed_phase("select"):
+            path = self._select(root_node)
         leaf = path[-1]
 
         logger.debug(f"Expanding node {leaf.id}...")
-        self._expand(leaf)
+        with metrics.timed_phase("expand"):
+            self._expand(leaf, cancel_token)
 
         logger.debug(f"Simulating from node {leaf.id}...")
-        simulation_path = self._simulate(leaf)
+        with metrics.timed_phase("evaluate"):
+            simulation_path = self._simulate(leaf, cancel_token)
 
         logger.debug("Backpropagating results...")
-        self._backpropagate(path + simulation_path)
+        with metrics.timed_phase("backprop"):
+            self._backpropagate(path + simulation_path)
 
         return simulation_path[-1] if simulation_path else path[-1]
 
@@ -123,7 +188,7 @@ class MCTS:
                 f"Selected UCT node {node.id} with action '{node.action_taken}'"
             )
 
-    def _expand(self, node: MCTSNode) -> None:
+    def _expand(self, node: MCTSNode, cancel_token: Optional[CancellationToken] = None) -> None:
         """Expand node by generating all possible children."""
         if node in self.explored_nodes:
             return
@@ -136,17 +201,21 @@ class MCTS:
         self.parent2children[node] = []
         for action in node.get_valid_actions():
             if action not in node.explored_actions:
-                new_state = self.execute_action(node.state, action)
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                new_state = self.execute_action(node.state, action, cancel_token)
                 child = node.add_child(new_state, action)
                 self.parent2children[node].append(child)
 
-    def _simulate(self, node: MCTSNode) -> List[MCTSNode]:
+    def _simulate(self, node: MCTSNode, cancel_token: Optional[CancellationToken] = None) -> List[MCTSNode]:
         """Simulate from node until terminal state."""
         path = []
         current = node
 
         logger.debug(f"Starting simulation from node with depth {current.state.depth}")
         while not current.is_terminal(self.config["experiment"]["max_depth"]):
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
             if current not in self.parent2children:
                 actions = current.get_valid_actions()
                 logger.debug(f"Available actions for simulation: {actions}")
@@ -155,7 +224,7 @@ class MCTS:
 
                 action = random.choice(actions)
                 logger.debug(f"Selected action for simulation: {action}")
-                new_state = self.execute_action(current.state, action)
+                new_state = self.execute_action(current.state, action, cancel_token)
                 current = current.add_child(new_state, action)
 
             else:
@@ -170,29 +239,22 @@ class MCTS:
     def _backpropagate(self, path: List[MCTSNode], reward: float) -> None:
         """Backpropagate rewards through the path."""
         for node in reversed(path):
-            self.Q[node] += reward
-            self.N[node] += 1
+            node.update(reward)
             self.explored_nodes.add(node)
             reward *= self.discount_factor
 
     def _uct_select(self, node: MCTSNode) -> MCTSNode:
-        """Select child node using UCT formula."""
-        assert all(n in self.explored_nodes for n in self.parent2children[node])
+        """Select child node using UCT formula (or PUCT with mcts.selection: puct) over the node's child_stats."""
+        return node.children[node.child_stats.select(node.visits, self.exploration_weight, self.selection_rule)]
 
-        def uct_value(n: MCTSNode) -> float:
-            if self.N[n] == 0:
-                return float("inf")
-
-            exploitation = self.Q[n] / self.N[n]
-            exploration = self.exploration_weight * math.sqrt(
-                math.log(self.N[node]) / self.N[n]
-            )
-            return exploitation + exploration
+    def execute_action(self, state: MCTSState, action: str,
+                       cancel_token: Optional[CancellationToken] = None) -> MCTSState:
+        """Execute an action and return the new state.
 
-        return max(self.parent2children[node], key=uct_value)
-
-    def execute_action(self, state: MCTSState, action: str) -> MCTSState:
-        """Execute an action and return the new state."""
+        A cancelled ``cancel_token`` raises OperationCancelled instead of producing a fallback state.
+        """
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
         try:
             # Convert MCTSState to dict for agent
             state_dict = {
@@ -223,23 +285,22 @@ class MCTS:
             if action == "retrieve_and_refine":
                 
                 # Execute with memory context
-                context_chunks = self._execute_retrieve_and_refine_with_memory(state, state_dict)
-                state_dict["context_chunks"] = context_chunks
+                return self._execute_retrieve_and_refine_with_memory(state, state_dict, cancel_token)
 
             if action == "review_and_refine":
                 
                 # Execute with memory context
-                return self._execute_review_and_refine_with_memory(state, state_dict)
+                return self._execute_review_and_refine_with_memory(state, state_dict, cancel_token)
 
             # Add abstract to state_dict if available
             if hasattr(state, "abstract") and state.abstract:
                 state_dict["abstract"] = state.abstract
 
             # Delegate action execution to ideation agent
-            response = self.ideation_agent.execute_action(action, state_dict)
+            response = self.ideation_agent.execute_action(action, state_dict, cancel_token)
 
             # Get review from review agent using unified review (all aspects in one call)
-            review_data = self.review_agent.unified_review(response["content"])
+            review_data = self.review_agent.unified_review(response["content"], cancel_token)
 
             reward = review_data["average_score"]
 
@@ -279,7 +340,8 @@ class MCTS:
             return self._create_fallback_state(state)
     
     
-    def _execute_retrieve_and_refine_with_memory(self, state: MCTSState, state_dict: Dict) -> MCTSState:
+    def _execute_retrieve_and_refine_with_memory(self, state: MCTSState, state_dict: Dict,
+                                                 cancel_token: Optional[CancellationToken] = None) -> MCTSState:
         """Execute retrieve_and_refine with memory using existing functions."""
         try:
             # Generate search query using existing retrieval logic
@@ -292,17 +354,17 @@ class MCTS:
                 search_query = f"{search_query} methodology approach"
             
             # Use existing retrieval function
-            context_chunks = self._retrieve_and_process_papers([search_query])
+            context_chunks = self._retrieve_and_process_papers([search_query], cancel_token)
             
             if context_chunks:
-                # Add retrieved context to state using existing pattern
-                state_dict["context_chunks"] = context_chunks
+                # Add the retrieved chunks most relevant to the idea to state using existing pattern
+                state_dict["context_chunks"] = self._select_context_chunks(context_chunks, idea=state.current_idea)
                 
                 # Use existing retrieve_and_refine action
-                response = self.ideation_agent.execute_action("retrieve_and_refine", state_dict)
+                response = self.ideation_agent.execute_action("retrieve_and_refine", state_dict, cancel_token)
                 
                 # Create new state using existing function
-                new_state = self._create_new_state_from_response(state, response, "retrieve_and_refine")
+                new_state = self._create_new_state_from_response(state, response, "retrieve_and_refine", cancel_token)
                 new_state.record_action("retrieve_and_refine", query=search_query)
                 
                 return new_state
@@ -313,11 +375,12 @@ class MCTS:
             logger.error(f"Error in retrieve_and_refine with memory: {e}")
             return self._create_fallback_state(state)
     
-    def _execute_review_and_refine_with_memory(self, state: MCTSState, state_dict: Dict) -> MCTSState:
+    def _execute_review_and_refine_with_memory(self, state: MCTSState, state_dict: Dict,
+                                               cancel_token: Optional[CancellationToken] = None) -> MCTSState:
         """Execute review_and_refine with memory using existing functions."""
         try:
             # Use existing unified review
-            review_data = self.review_agent.unified_review(state.current_idea)
+            review_data = self.review_agent.unified_review(state.current_idea, cancel_token)
             
             if review_data:
                 # Identify low-scoring aspects for memory
@@ -342,10 +405,10 @@ class MCTS:
                     state_dict["memory_context"] = f"Previously problematic aspects: {', '.join(state.problematic_aspects[-3:])}"
                 
                 # Use existing review_and_refine action
-                response = self.ideation_agent.execute_action("review_and_refine", state_dict)
+                response = self.ideation_agent.execute_action("review_and_refine", state_dict, cancel_token)
                 
                 # Create new state using existing function
-                new_state = self._create_new_state_from_response(state, response, "review_and_refine")
+                new_state = self._create_new_state_from_response(state, response, "review_and_refine", cancel_token)
                 new_state.record_action("review_and_refine", low_scoring_aspects=low_scoring)
                 
                 return new_state
@@ -356,7 +419,8 @@ class MCTS:
             logger.error(f"Error in review_and_refine with memory: {e}")
             return self._create_fallback_state(state)
     
-    def _create_new_state_from_response(self, old_state: MCTSState, response: Dict, action: str) -> MCTSState:
+    def _create_new_state_from_response(self, old_state: MCTSState, response: Dict, action: str,
+                                        cancel_token: Optional[CancellationToken] = None) -> MCTSState:
         """Create new state from response - using existing pattern."""
         new_state = MCTSState(
             research_goal=old_state.research_goal,
@@ -374,7 +438,7 @@ class MCTS:
         new_state.action_count = getattr(old_state, 'action_count', {}).copy()
         
         # Use existing review function
-        review_data = self.review_agent.unified_review(response["content"])
+        review_data = self.review_agent.unified_review(response["content"], cancel_token)
         if review_data:
             new_state.review_scores = review_data.get("scores", {})
             new_state.review_feedback = review_data.get("reviews", {})
@@ -402,12 +466,16 @@ class MCTS:
         
         return fallback_state
     
+    def _extract_search_terms(self, idea: str, n_terms: int = 8) -> str:
+        """Search query made of the most frequent content words of the idea."""
+        counts = Counter(term for term in terms(idea) if term not in IDEA_SECTION_WORDS and not term.isdigit())
+        return " ".join(term for term, _ in counts.most_common(n_terms))
+
     def _retrieve_relevant_chunks(self, idea: str) -> List[str]:
         """Retrieve relevant text chunks for a given idea."""
-        # Placeholder implementation - in a real system, this would use a retrieval system
         try:
-            # For now, return empty list which is handled gracefully by the agent
-            return []
+            chunks = self._retrieve_and_process_papers([self._extract_search_terms(idea)])
+            return self._select_context_chunks(chunks, idea=idea)
         except Exception as e:
             logger.error(f"Error retrieving chunks: {e}")
             return []
@@ -590,23 +658,29 @@ class MCTS:
         review_criteria: List[Tuple[str, str]] = None,
         context_chunks: List[str] = None,
     ) -> str:
-        """Get the prompt for a given action."""
+        """Get the prompt for a given action, within the ideation agent's prompt token budget."""
+        budget = self.ideation_agent.prompt_budget
         if action == "retrieve_and_refine":
+            template = self.prompts["ideation_agent"]["refine_with_retrieval"]
+            # the excerpts most relevant to the idea are kept when they exceed the budget
+            fitted = budget.fit(fixed=template, query=state.current_idea,
+                                idea=state.current_idea, knowledge=list(context_chunks or []))
             context_str = "\n\n".join(
                 [
                     f"Excerpt {i+1}:\n{chunk}"
-                    for i, chunk in enumerate(context_chunks or [])
+                    for i, chunk in enumerate(fitted["knowledge"])
                 ]
             )
-            return self.prompts["ideation_agent"]["refine_with_retrieval"].format(
-                current_idea=state.current_idea, retrieved_content=context_str
+            return template.format(
+                current_idea=fitted["idea"], retrieved_content=context_str
             )
         elif action == "review_and_refine":
-            feedback_str = "\n".join(
-                [f"- {crit}: {feedback}" for crit, feedback in review_criteria]
-            )
-            return self.prompts["ideation_agent"]["refine_with_review"].format(
-                current_idea=state.current_idea, review_feedback=feedback_str
+            template = self.prompts["ideation_agent"]["refine_with_review"]
+            fitted = budget.fit(fixed=template, recent=(), idea=state.current_idea,
+                                history=[f"- {crit}: {feedback}" for crit, feedback in review_criteria])
+            feedback_str = "\n".join(fitted["history"])
+            return template.format(
+                current_idea=fitted["idea"], review_feedback=feedback_str
             )
         elif action == "generate":
             return self.prompts["ideation_agent"]["generate"].format(
@@ -628,37 +702,54 @@ class MCTS:
         return 1.0 / (state.depth + 1)
 
     def run(
-        self, initial_state: MCTSState, num_iterations: int, callback=None
+        self, initial_state: MCTSState, num_iterations: int, callback=None,
+        cancel_token: Optional[CancellationToken] = None,
     ) -> MCTSNode:
-        """Run MCTS for given number of iterations."""
+        """Run MCTS for given number of iterations.
+
+        If ``cancel_token`` is cancelled or its deadline passes, the current iteration is
+        abandoned and the tree built by the completed iterations is returned.
+        """
         root = MCTSNode(state=initial_state)
 
         for i in range(num_iterations):
             self.current_rollout_id = i
-            if callback:
-                callback(f"Starting iteration {i+1}/{num_iterations}")
-
-            # Selection
-            path = self._select(root)
-            node = path[-1]  # Get the last node from the path
-            if callback:
-                callback(f"Selected node with idea: {node.state.current_idea}")
-
-            # Expansion
-            self._expand(node)  # _expand modifies node in place
-            if callback:
-                callback(f"Expanded with action: {node.action_taken}")
-
-            # Simulation
-            simulation_path = self._simulate(node)
-            reward = self.calculate_reward(
-                simulation_path[-1].state if simulation_path else node.state
-            )
-            if callback:
-                callback(f"Simulation complete. Reward: {reward}")
+            try:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                if callback:
+                    callback(f"Starting iteration {i+1}/{num_iterations}")
+
+                # Selection
+                with metrics.timed_phase("select"):
+                    path = self._select(root)
+                node = path[-1]  # Get the last node from the path
+                if callback:
+                    callback(f"Selected node with idea: {node.state.current_idea}")
+
+                # Expansion
+                with metrics.timed_phase("expand"):
+                    self._expand(node, cancel_token)  # _expand modifies node in place
+                if callback:
+                    callback(f"Expanded with action: {node.action_taken}")
+
+                # Simulation
+                with metrics.timed_phase("evaluate"):
+                    simulation_path = self._simulate(node, cancel_token)
+                    reward = self.calculate_reward(
+                        simulation_path[-1].state if simulation_path else node.state
+                    )
+                if callback:
+                    callback(f"Simulation complete. Reward: {reward}")
+            except OperationCancelled as e:
+                logger.info(f"MCTS run stopped during iteration {i+1}: {e}")
+                if callback:
+                    callback(f"Exploration stopped ({e}) after {i} completed iterations")
+                break
 
             # Backpropagation
-            self._backpropagate(path + simulation_path, reward)
+            with metrics.timed_phase("backprop"):
+                self._backpropagate(path + simulation_path, reward)
             if callback:
                 callback(f"Backpropagation complete for iteration {i+1}")
 
@@ -713,129 +804,226 @@ class MCTS:
             logger.error(f"Error generating queries: {e}")
             return None
 
-    def _retrieve_and_process_papers(self, queries: List[str]) -> List[Dict]:
-        """Retrieve and process papers for each query."""
-        all_chunks = []
+    def _retrieve_and_process_papers(self, queries: List[str],
+                                     cancel_token: Optional[CancellationToken] = None) -> List[Dict]:
+        """Retrieve and process papers for the queries as a staged concurrent pipeline.
+
+        The searches run in parallel; every open access paper then goes through the download pool and the
+        bounded grobid pool and is chunked as soon as its json is ready. Papers without full text fall back
+        to their abstract. Chunks are returned in search result order.
+        """
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        searches = [self._search_pool.submit(self._search_semantic_scholar, query) for query in queries]
+        papers = []
         seen_papers: Set[str] = set()
-
-        for query in queries:
-            try:
-                # Search S2 API
-                papers = self._search_semantic_scholar(query)
-
-                for paper in papers:
-                    paper_id = paper["paperId"]
-                    if paper_id in seen_papers:
+        try:
+            for search in searches:
+                for paper in self._await(search, cancel_token):
+                    if paper["paperId"] not in seen_papers:
+                        seen_papers.add(paper["paperId"])
+                        papers.append(paper)
+        except BaseException:
+            for search in searches:
+                search.cancel()
+            raise
+
+        # future -> (paper index, stage); a finished download is handed to the grobid pool
+        pending = {}
+        for i, paper in enumerate(papers):
+            pdf_url = (paper.get("openAccessPdf") or {}).get("url")
+            if paper.get("isOpenAccess") and pdf_url:
+                pending[self._download_pool.submit(self._download_pdf, paper["paperId"], pdf_url)] = (i, "download")
+        full_text_chunks: Dict[int, List[Dict]] = {}
+        try:
+            while pending:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i, stage = pending.pop(future)
+                    path = future.result()
+                    if path is None:
                         continue
-                    seen_papers.add(paper_id)
-
-                    # Try to get PDF if available
-                    if paper.get("isOpenAccess"):
-                        pdf_path = self._download_pdf(
-                            paper_id, paper.get("openAccessPdf", {}).get("url")
-                        )
-                        if pdf_path:
-                            # Process PDF with Grobid
-                            json_path = self._process_with_grobid(pdf_path)
-                            if json_path:
-                                chunks = self._chunk_paper(json_path)
-                                all_chunks.extend(chunks)
-                                continue
-
-                    # Fallback to using abstract
-                    if paper.get("abstract"):
-                        all_chunks.append(
-                            {
-                                "text": paper["abstract"],
-                                "paper_id": paper_id,
-                                "section": "abstract",
-                            }
-                        )
-
-            except Exception as e:
-                logger.error(f"Error processing query '{query}': {e}")
-                continue
+                    if stage == "download":
+                        pending[self._grobid_pool.submit(self._process_with_grobid, path)] = (i, "grobid")
+                    else:
+                        full_text_chunks[i] = self._chunk_paper(path)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
 
+        all_chunks = []
+        for i, paper in enumerate(papers):
+            if full_text_chunks.get(i):
+                all_chunks.extend(full_text_chunks[i])
+            # Fallback to using abstract
+            elif paper.get("abstract"):
+                all_chunks.append(
+                    {
+                        "text": paper["abstract"],
+                        "paper_id": paper["paperId"],
+                        "section": "abstract",
+                    }
+                )
         return all_chunks
 
+    @staticmethod
+    def _await(future: Future, cancel_token: Optional[CancellationToken] = None) -> Any:
+        """Result of a future, checking the token while waiting."""
+        while True:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            try:
+                return future.result(timeout=0.5)
+            except FutureTimeoutError:
+                continue
+
     def _search_semantic_scholar(self, query: str, limit: int = 5) -> List[Dict]:
-        """Search Semantic Scholar API."""
+        """Search Semantic Scholar API; results are cached on disk per query for search_cache_ttl seconds."""
+        cache_key = hashlib.sha1(f"{query}\n{limit}".encode()).hexdigest()
+        cache_path = self.search_dir / f"{cache_key}.json"
+        try:
+            if time.time() - cache_path.stat().st_mtime < self.search_cache_ttl:
+                with open(cache_path) as f:
+                    return json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable search cache {cache_path}: {e}")
         try:
             params = {
                 "query": query,
                 "limit": limit,
                 "fields": "paperId,title,abstract,isOpenAccess,openAccessPdf",
             }
-            response = requests.get(
+            response = self._http.get(
                 f"{self.s2_api_url}/paper/search",
                 headers=self.s2_headers,
                 params=params,
+                timeout=self.download_timeout,
             )
             response.raise_for_status()
-            return response.json().get("data", [])
+            papers = response.json().get("data", [])
         except Exception as e:
             logger.error(f"Semantic Scholar API error: {e}")
             return []
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(papers, f)
+        os.replace(tmp_path, cache_path)
+        self._prune_search_cache()
+        return papers
+
+    def _prune_search_cache(self) -> None:
+        """Delete expired search results and the oldest ones beyond search_cache_max_entries."""
+        entries = []
+        now = time.time()
+        for entry in os.scandir(self.search_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+                if now - mtime >= self.search_cache_ttl:
+                    os.remove(entry.path)
+                else:
+                    entries.append((mtime, entry.path))
+            except OSError:
+                continue
+        if len(entries) > self.search_cache_max_entries:
+            entries.sort()
+            for _, path in entries[:len(entries) - self.search_cache_max_entries]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
 
     def _download_pdf(self, paper_id: str, pdf_url: Optional[str]) -> Optional[Path]:
-        """Download PDF if available."""
+        """Download PDF if available, within download_timeout and max_pdf_mb."""
         if not pdf_url:
             return None
 
+        pdf_path = self.retrieved_dir / f"{paper_id}.pdf"
+        if pdf_path.exists():
+            return pdf_path
+        if pdf_url in self._oversized_pdfs:
+            return None
+        # written next to the cache entry and renamed once complete, so a failed download is never cached
+        partial_path = pdf_path.with_name(f"{pdf_path.name}.{threading.get_ident()}.part")
         try:
-            pdf_path = self.retrieved_dir / f"{paper_id}.pdf"
-            if pdf_path.exists():
-                return pdf_path
-
-            response = requests.get(pdf_url, stream=True)
-            response.raise_for_status()
-
-            with open(pdf_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-
+            deadline = time.monotonic() + self.download_timeout
+            with self._http.get(pdf_url, stream=True, timeout=self.download_timeout) as response:
+                response.raise_for_status()
+                size = int(response.headers.get("Content-Length") or 0)
+                if size > self.max_pdf_bytes:
+                    self._oversized_pdfs.add(pdf_url)
+                    raise ValueError(f"PDF larger than {self.max_pdf_bytes} bytes")
+                size = 0
+                with open(partial_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        size += len(chunk)
+                        if size > self.max_pdf_bytes:
+                            self._oversized_pdfs.add(pdf_url)
+                            raise ValueError(f"PDF larger than {self.max_pdf_bytes} bytes")
+                        if time.monotonic() > deadline:
+                            raise TimeoutError(f"download took over {self.download_timeout}s")
+                        f.write(chunk)
+            os.replace(partial_path, pdf_path)
             return pdf_path
 
         except Exception as e:
-            logger.error(f"Error downloading PDF: {e}")
+            logger.error(f"Error downloading PDF for {paper_id}: {e}")
             return None
+        finally:
+            partial_path.unlink(missing_ok=True)
 
     def _process_with_grobid(self, pdf_path: Path) -> Optional[Path]:
-        """Process PDF with Grobid."""
+        """Process PDF with Grobid through s2orc-doc2json."""
         try:
             output_path = self.grobid_dir / f"{pdf_path.stem}.json"
             if output_path.exists():
                 return output_path
 
-            # Call s2orc-doc2json (assuming it's installed and in PATH)
-            subprocess.run(
-                [
-                    "python",
-                    "-m",
-                    "doc2json.grobid2json.process_pdf",
-                    str(pdf_path),
-                    str(self.grobid_dir),
-                ],
-                check=True,
-            )
+            process_pdf_file = _doc2json_processor()
+            if process_pdf_file is not None:
+                # in process, instead of starting a Python interpreter per PDF
+                process_pdf_file(str(pdf_path), temp_dir=str(self.grobid_dir / "tmp"),
+                                 output_dir=str(self.grobid_dir))
+            else:
+                subprocess.run(
+                    [
+                        sys.executable,
+                        "-m",
+                        "doc2json.grobid2json.process_pdf",
+                        "-i",
+                        str(pdf_path),
+                        "-t",
+                        str(self.grobid_dir / "tmp"),
+                        "-o",
+                        str(self.grobid_dir),
+                    ],
+                    check=True,
+                    timeout=self.grobid_timeout,
+                    capture_output=True,
+                )
 
-            return output_path
+            return output_path if output_path.exists() else None
 
         except Exception as e:
             logger.error(f"Error processing with Grobid: {e}")
             return None
 
     def _chunk_paper(self, json_path: Path, chunk_size: int = 250) -> List[Dict]:
-        """Chunk processed paper into sections."""
+        """Chunk each section of a processed paper into sentences of at most chunk_size tokens, counted with
+        the prompt budget's tokenizer so chunk sizes match what they cost in the prompt."""
         try:
             with open(json_path) as f:
                 paper_data = json.load(f)
 
             chunks = []
             for section in paper_data.get("body_text", []):
-                words = section["text"].split()
-                for i in range(0, len(words), chunk_size):
-                    chunk = " ".join(words[i : i + chunk_size])
+                for chunk in iter_chunks(section["text"], get_encoding(), chunk_size):
                     chunks.append(
                         {
                             "text": chunk,
@@ -851,10 +1039,29 @@ class MCTS:
             return []
 
     def _select_context_chunks(
-        self, chunks: List[Dict], n_chunks: int = 5
+        self, chunks: List[Dict], n_chunks: Optional[int] = None, idea: Optional[str] = None,
+        max_tokens: Optional[int] = None,
     ) -> List[str]:
-        """Select chunks to use as context (simple random selection for now)."""
+        """Select the chunks to use as context: ranked by BM25 relevance to the idea with near-duplicates
+        (MinHash) dropped, then taken greedily until n_chunks or max_tokens, by default the knowledge share
+        of the prompt budget."""
         if not chunks:
             return []
-        selected = random.sample(chunks, min(n_chunks, len(chunks)))
-        return [chunk["text"] for chunk in selected]
+        if n_chunks is None:
+            n_chunks = self.config.get("retrieval_agent", {}).get("rerank_top_k", 5)
+        if max_tokens is None:
+            budget = self.ideation_agent.prompt_budget
+            max_tokens = int(budget.max_tokens * budget.weights.get("knowledge", 0.0))
+        texts = [chunk["text"] for chunk in chunks]
+        order = rank_diverse(idea, texts) if idea else range(len(texts))
+
+        selected, n_tokens = [], 0
+        for i in order:
+            chunk_tokens = count_tokens(texts[i])
+            if n_tokens + chunk_tokens > max_tokens:
+                continue
+            selected.append(texts[i])
+            n_tokens += chunk_tokens
+            if len(selected) == n_chunks:
+                break
+        return selected
@@ -1,9 +1,32 @@
-from .scholar_qa import ScholarQA
-from .rag.retrieval import PaperFinderWithReranker, PaperFinder
-from .rag.retriever_base import FullTextRetriever, AbstractRetriever
-from .rag.reranker.modal_engine import ModalReranker
-from .rag.reranker.modal_engine import HuggingFaceReranker
+import importlib
 
-__all__ = ["ScholarQA", "PaperFinderWithReranker", "PaperFinder", "FullTextRetriever", "AbstractRetriever",
+# Exports are imported on first access (PEP 562), so importing a light submodule such as scholarqa.stage_cache
+# does not pull in pandas, litellm, torch and sentence_transformers.
+_LAZY_EXPORTS = {
+    "ScholarQA": ".scholar_qa",
+    "PaperFinderWithReranker": ".rag.retrieval",
+    "PaperFinder": ".rag.retrieval",
+    "FullTextRetriever": ".rag.retriever_base",
+    "AbstractRetriever": ".rag.retriever_base",
+    "LocalHybridRetriever": ".rag.local_retriever",
+    "ModalReranker": ".rag.reranker.modal_engine",
+    "HuggingFaceReranker": ".rag.reranker.modal_engine",
+}
+
+__all__ = ["ScholarQA", "PaperFinderWithReranker", "PaperFinder", "FullTextRetriever", "AbstractRetriever", "LocalHybridRetriever",
            "ModalReranker", "HuggingFaceReranker", "llms", "postprocess", "preprocess",
            "utils", "models", "rag", "state_mgmt"]
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        value = getattr(importlib.import_module(_LAZY_EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,15 +1,24 @@
 import logging
 import multiprocessing
+import multiprocessing.util
 import os
+import tempfile
+import threading
 from json import JSONDecodeError
 from time import time
 from typing import Union
 from uuid import uuid4, uuid5, UUID
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from nora_lib.tasks.models import TASK_STATUSES, AsyncTaskState
 from nora_lib.tasks.state import NoSuchTaskException
 
+# Tasks run in the worker pool, so their metrics only reach /metrics through prometheus_client's multiprocess
+# mode, which is picked when prometheus_client is imported: default its directory before scholarqa.metrics loads
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="scholarqa-metrics-")
+
+from scholarqa import metrics
 from scholarqa.config.config_setup import read_json_config
 from scholarqa.models import (
     AsyncToolResponse,
@@ -34,6 +43,12 @@ async_context = multiprocessing.get_context("fork")
 
 started_task_step = None
 
+# ScholarQA instance built once per worker process by _init_worker and reused for the worker's tasks
+_worker_scholarqa = None
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+_tasks_in_flight = 0
+
 T = TypeVar("T", bound=ScholarQA)
 
 
@@ -76,10 +91,27 @@ def _do_task(tool_request: ToolRequest, task_id: str) -> TaskResult:
     use `task_state_manager.read_state(task_id)` to retrieve, and `.write_state()`
     to write back.
     """
-    scholar_qa = app_config.load_scholarqa(task_id)
+    if _worker_scholarqa is not None:
+        scholar_qa = _worker_scholarqa
+        scholar_qa.task_id = task_id
+    else:
+        scholar_qa = app_config.load_scholarqa(task_id)
     return scholar_qa.run_qa_pipeline(tool_request)
 
 
+def _init_worker():
+    """Runs once in every worker process, so the retriever, reranker and llm clients are reused across tasks."""
+    global _worker_scholarqa
+    # runs when the worker exits, including after max_tasks_per_worker tasks
+    multiprocessing.util.Finalize(None, metrics.mark_process_dead, args=(os.getpid(),), exitpriority=0)
+    if not app_config.worker_pool.warm_start:
+        return
+    try:
+        _worker_scholarqa = app_config.load_scholarqa(None)
+    except Exception as e:
+        logger.warning(f"Could not warm start the ScholarQA worker, loading it per task instead: {e}")
+
+
 def _estimate_task_length(tool_request: ToolRequest) -> str:
     """
 
@@ -108,6 +140,11 @@ def create_app() -> FastAPI:
     def health():
         return "OK"
 
+    @app.get("/metrics")
+    def prometheus_metrics():
+        body, content_type = metrics.render_latest()
+        return Response(content=body, media_type=content_type)
+
     @app.post("/query_corpusqa")
     def use_tool(
             tool_request: ToolRequest,
@@ -119,11 +156,18 @@ def create_app() -> FastAPI:
             return _handle_async_task_check_in(tool_request)
 
         # New task
+        if not _acquire_task_slot():
+            raise HTTPException(status_code=429, headers={"Retry-After": "30"},
+                                detail="Too many queries in progress, please retry shortly.")
         task_id = str(uuid4())
         logs_config.task_id = task_id
         logger.info("New task")
-        app_config.state_mgr_client.init_task(task_id, tool_request)
-        estimated_time = _start_async_task(task_id, tool_request)
+        try:
+            app_config.state_mgr_client.init_task(task_id, tool_request)
+            estimated_time = _start_async_task(task_id, tool_request)
+        except Exception:
+            _release_task_slot()
+            raise
 
         return AsyncToolResponse(
             task_id=task_id,
@@ -154,33 +198,63 @@ def _start_async_task(task_id: str, tool_request: ToolRequest) -> str:
     )
     task_state_manager.write_state(task_state)
 
-    def _do_task_and_write_result():
-        extra_state = {}
-        try:
-            task_result = _do_task(tool_request, task_id)
-            task_status = TASK_STATUSES["COMPLETED"]
-            extra_state["end"] = time()
-        except Exception as e:
-            task_result = None
-            task_status = TASK_STATUSES["FAILED"]
-            extra_state["error"] = str(e)
-
-        state = task_state_manager.read_state(task_id)
-        state.task_result = task_result
-        state.task_status = task_status
-        state.extra_state.update(extra_state)
-        state.estimated_time = "--"
-        task_state_manager.write_state(state)
-
-    async_context.Process(
-        target=_do_task_and_write_result,
-        name=f"Async Task {task_id}",
-        args=(),
-    ).start()
+    _get_worker_pool().apply_async(_do_task_and_write_result, args=(tool_request, task_id),
+                                   callback=_release_task_slot, error_callback=_release_task_slot)
 
     return estimated_time
 
 
+def _do_task_and_write_result(tool_request: ToolRequest, task_id: str) -> None:
+    """Runs in a pool worker."""
+    logs_config.task_id = task_id
+    task_state_manager = app_config.state_mgr_client.get_state_mgr(tool_request)
+    extra_state = {}
+    try:
+        task_result = _do_task(tool_request, task_id)
+        task_status = TASK_STATUSES["COMPLETED"]
+        extra_state["end"] = time()
+    except Exception as e:
+        task_result = None
+        task_status = TASK_STATUSES["FAILED"]
+        extra_state["error"] = str(e)
+
+    state = task_state_manager.read_state(task_id)
+    state.task_result = task_result
+    state.task_status = task_status
+    state.extra_state.update(extra_state)
+    state.estimated_time = "--"
+    task_state_manager.write_state(state)
+
+
+def _get_worker_pool():
+    """Long-lived workers, started on the first task once the state manager client exists so they inherit it.
+    Each worker is replaced after max_tasks_per_worker tasks."""
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            pool_config = app_config.worker_pool
+            _worker_pool = async_context.Pool(processes=pool_config.num_workers, initializer=_init_worker,
+                                              maxtasksperchild=pool_config.max_tasks_per_worker)
+        return _worker_pool
+
+
+def _acquire_task_slot() -> bool:
+    """Admission control: at most num_workers running and max_queued_tasks waiting tasks per server process."""
+    global _tasks_in_flight
+    pool_config = app_config.worker_pool
+    with _worker_pool_lock:
+        if _tasks_in_flight >= pool_config.num_workers + pool_config.max_queued_tasks:
+            return False
+        _tasks_in_flight += 1
+        return True
+
+
+def _release_task_slot(_=None) -> None:
+    global _tasks_in_flight
+    with _worker_pool_lock:
+        _tasks_in_flight = max(_tasks_in_flight - 1, 0)
+
+
 def _handle_async_task_check_in(
         tool_req: ToolRequest,
 ) -> Union[ToolResponse | AsyncToolResponse]:
@@ -19,6 +19,10 @@ class LogsConfig(BaseModel):
                                                                          "OR the GCS bucket name")
     tracing_mode: Literal["local", "gcs"] = Field(default="local",
                                                   description="Mode to store event traces (local or gcs)")
+    trace_queue_size: int = Field(default=1024, description="Max event traces waiting to be written locally, "
+                                                            "traces are dropped when the writer can't keep up")
+    trace_segment_bytes: int = Field(default=64 * 1024 * 1024,
+                                     description="Size after which local traces roll over to a new jsonl segment")
     tid_log_formatter: TaskIdAwareLogFormatter = Field(default=None,
                                                        description="Task Id aware log formatter which prepends the current task id to every log message")
 
@@ -47,9 +51,21 @@ class RunConfig(BaseModel):
     pipeline_args: dict = Field(default=None, description="Arguments for the Scholar QA pipeline service")
 
 
+class WorkerPoolConfig(BaseModel):
+    num_workers: int = Field(default=2, description="Long-lived worker processes running ScholarQA tasks")
+    max_tasks_per_worker: int = Field(default=50,
+                                      description="Tasks after which a worker is replaced by a fresh process")
+    max_queued_tasks: int = Field(default=8, description="Tasks allowed to wait for a free worker, "
+                                                         "new tasks are rejected with a 429 beyond that")
+    warm_start: bool = Field(default=True, description="Build the ScholarQA pipeline (retriever, reranker, llm "
+                                                       "clients) when a worker starts rather than per task")
+
+
 class AppConfig(BaseModel):
     logs: LogsConfig = Field(default=None, description="Configuration for logs and event traces")
     run_config: RunConfig = Field(default=None, description="Configuration for components of the ScholarQA pipeline")
+    worker_pool: WorkerPoolConfig = Field(default_factory=WorkerPoolConfig,
+                                          description="Worker processes that run the async ScholarQA tasks")
     state_mgr_client: AbsStateMgrClient = Field(default=None,
                                                 description="State manager client for managing async task states and cost reporting of llm calls")
     load_scholarqa: Callable = Field(default=None,
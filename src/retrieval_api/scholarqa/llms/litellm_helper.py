@@ -1,7 +1,8 @@
 import logging
 import os
+import threading
 from scholarqa.llms.constants import *
-from typing import List, Any, Callable, Tuple, Iterator, Union, Generator
+from typing import List, Any, Callable, Dict, Tuple, Iterator, Union, Generator
 
 import litellm
 from litellm.caching import Cache
@@ -19,6 +20,7 @@ except ImportError:
 litellm.drop_params=True
 # os.environ['LITELLM_LOG'] = 'DEBUG'
 
+from scholarqa import metrics
 from scholarqa.state_mgmt.local_state_mgr import AbsStateMgrClient
 
 logger = logging.getLogger(__name__)
@@ -60,6 +62,7 @@ class CostAwareLLMCaller:
         import time as t 
         t.sleep(2)
         result, completion_costs, completion_models = self.parse_result_args(method_result)
+        metrics.record_completions(completion_costs)
         total_cost = self.state_mgr.report_llm_usage(completion_costs=completion_costs, cost_args=cost_args)
         return CostAwareLLMResult(result=result, tot_cost=total_cost, models=completion_models)
 
@@ -72,6 +75,7 @@ class CostAwareLLMCaller:
             all_completion_models.extend(completion_models)
             all_results.append(result)
             yield result
+        metrics.record_completions(all_completion_costs)
         total_cost = self.state_mgr.report_llm_usage(completion_costs=all_completion_costs, cost_args=cost_args)
         return CostAwareLLMResult(result=all_results, tot_cost=total_cost, models=all_completion_models)
 
@@ -84,6 +88,50 @@ def success_callback(kwargs, completion_response, start_time, end_time):
 litellm.success_callback = [success_callback]
 
 
+def bind_cancel_token(cancel_token: Any, llm_lite_params: Dict[str, Any]) -> None:
+    """Fail fast if the caller's cancellation token has fired and cap the request timeout at its
+    remaining time. Any object exposing raise_if_cancelled() and remaining() can be used as a token."""
+    if cancel_token is None:
+        return
+    cancel_token.raise_if_cancelled()
+    remaining = cancel_token.remaining()
+    if remaining is not None:
+        llm_lite_params["timeout"] = min(remaining, llm_lite_params.get("timeout", remaining))
+
+
+class CallsCancelled(BaseException):
+    """Raised by a call whose ChildCancelToken was cancelled; a BaseException like the callers' own
+    cancellation, so retries and ``except Exception`` fallbacks do not swallow it."""
+
+
+class ChildCancelToken:
+    """Cancellation token of a group of calls within a request, e.g. the quote extraction calls past the quote
+    budget: cancelled by cancel() or whenever the parent token (if any) is. remaining() is the parent's."""
+
+    def __init__(self, parent: Any = None):
+        self.parent = parent
+        self.reason = None
+        self._event = threading.Event()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self.parent is not None:
+            self.parent.raise_if_cancelled()
+        if self._event.is_set():
+            raise CallsCancelled(self.reason)
+
+    def remaining(self):
+        return None if self.parent is None else self.parent.remaining()
+
+
 def setup_llm_cache(cache_type: str = "s3", **cache_args):
     logger.info("Setting up LLM cache...")
     litellm.cache = Cache(type=cache_type, **cache_args)
@@ -201,8 +249,9 @@ def _azure_single_completion(user_prompt: str, system_prompt: str = None, model:
 
 @traceable(run_type="llm", name="batch completion")
 def batch_llm_completion(model: str, messages: List[str], system_prompt: str = None, fallback=GPT_4o,
-                         **llm_lite_params) -> List[CompletionResult]:
+                         cancel_token: Any = None, **llm_lite_params) -> List[CompletionResult]:
     """returns the result from the llm chat completion api with cost and tokens used"""
+    bind_cancel_token(cancel_token, llm_lite_params)
     
     if DEPLOY_MODE and azure_client:
         logger.debug(f"Using Azure OpenAI for batch completion with model: {model}")
@@ -234,8 +283,10 @@ def batch_llm_completion(model: str, messages: List[str], system_prompt: str = N
 
 
 @traceable(run_type="llm", name="completion")
-def llm_completion(user_prompt: str, system_prompt: str = None, fallback=GPT_4o, **llm_lite_params) -> CompletionResult:
+def llm_completion(user_prompt: str, system_prompt: str = None, fallback=GPT_4o, cancel_token: Any = None,
+                   **llm_lite_params) -> CompletionResult:
     """returns the result from the llm chat completion api with cost and tokens used"""
+    bind_cancel_token(cancel_token, llm_lite_params)
     
     if DEPLOY_MODE and azure_client:
         logger.debug(f"Using Azure OpenAI for completion")
@@ -258,14 +309,35 @@ def llm_completion(user_prompt: str, system_prompt: str = None, fallback=GPT_4o,
         # except Exception as e:
             # logger.warning(f"Error calculating cost: {e}")
         res_cost = 0.0
+        return _completion_result(response, res_cost)
 
-        res_usage = response.usage
-        res_str = response["choices"][0]["message"]["content"]
-        if res_str is None:
-            logger.warning("Content returned as None, checking for response in tool_calls...")
-            res_str = response["choices"][0]["message"]["tool_calls"][0].function.arguments
-        cost_tuple = CompletionResult(content=res_str.strip(), model=response.model,
-                                      cost=res_cost if not response.get("cache_hit") else 0.0,
-                                      input_tokens=res_usage.prompt_tokens,
-                                      output_tokens=res_usage.completion_tokens, total_tokens=res_usage.total_tokens)
-        return cost_tuple
+
+@traceable(run_type="llm", name="completion")
+def trimmed_llm_completion(user_prompt: str, system_prompt: str = None, fallback=GPT_4o, cancel_token: Any = None,
+                           **llm_lite_params) -> CompletionResult:
+    """A single prompt sent the way batch_llm_completion sends each of its prompts: trimmed to the model's context
+    window and with the fallback model, for callers that issue the prompts of a batch one at a time"""
+    bind_cancel_token(cancel_token, llm_lite_params)
+    model = llm_lite_params.pop("model")
+
+    if DEPLOY_MODE and azure_client:
+        logger.debug(f"Using Azure OpenAI for completion with model: {model}")
+        return _azure_single_completion(user_prompt, system_prompt, model, **llm_lite_params)
+    logger.debug(f"Using LiteLLM for completion with model: {model}")
+    fallbacks = [fallback] if fallback else []
+    messages = trim_messages([{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
+                             model)
+    response = litellm.completion(messages=messages, model=model, fallbacks=fallbacks, **llm_lite_params)
+    return _completion_result(response, 0.0)
+
+
+def _completion_result(response: Any, res_cost: float) -> CompletionResult:
+    res_usage = response.usage
+    res_str = response["choices"][0]["message"]["content"]
+    if res_str is None:
+        logger.warning("Content returned as None, checking for response in tool_calls...")
+        res_str = response["choices"][0]["message"]["tool_calls"][0].function.arguments
+    return CompletionResult(content=res_str.strip(), model=response.model,
+                            cost=res_cost if not response.get("cache_hit") else 0.0,
+                            input_tokens=res_usage.prompt_tokens,
+                            output_tokens=res_usage.completion_tokens, total_tokens=res_usage.total_tokens)
@@ -0,0 +1,61 @@
+import os
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Iterable, Iterator, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+from scholarqa.llms.constants import CompletionResult
+
+# pipeline stages run from a few hundred ms (metadata) to minutes (quotes for a large paper set)
+STAGE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 90, 120, 180, 300, 600)
+
+STAGE_SECONDS = Histogram("scholarqa_stage_seconds", "Wall time of a ScholarQA pipeline stage", ["stage"],
+                          buckets=STAGE_BUCKETS)
+CACHE_REQUESTS = Counter("scholarqa_cache_requests_total", "Lookups in the ScholarQA caches", ["cache", "result"])
+LLM_TOKENS = Counter("scholarqa_llm_tokens_total", "Tokens used by ScholarQA LLM calls", ["model", "kind"])
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Observe the wall time of a block under the given stage; a block that raises is not observed."""
+    start = perf_counter()
+    yield
+    STAGE_SECONDS.labels(stage=stage).observe(perf_counter() - start)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage=stage).observe(seconds)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def record_completions(completion_costs: Iterable[CompletionResult]) -> None:
+    for completion in completion_costs:
+        if not (completion.input_tokens or completion.output_tokens):
+            # served from a cache or the rules based fast path
+            continue
+        LLM_TOKENS.labels(model=completion.model, kind="input").inc(completion.input_tokens or 0)
+        LLM_TOKENS.labels(model=completion.model, kind="output").inc(completion.output_tokens or 0)
+
+
+def mark_process_dead(pid: int) -> None:
+    """Remove the live gauge files of an exited process in multiprocess mode; its counters and histograms stay."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+
+def render_latest() -> Tuple[bytes, str]:
+    """(body, content type) of the /metrics response. With PROMETHEUS_MULTIPROC_DIR set, the metrics of every
+    process writing to that directory (e.g. the task worker pool) are aggregated. The API server (app.py) sets
+    it to a temporary directory by default; in a process that imported prometheus_client without it, only that
+    process's own metrics are reported."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
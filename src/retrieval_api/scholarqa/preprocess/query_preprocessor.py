@@ -1,13 +1,15 @@
 import json
 import logging
 import re
-from collections import namedtuple
+import threading
+from collections import namedtuple, OrderedDict
 from multiprocessing import Queue
-from typing import Tuple, List
+from typing import Any, Tuple, List, Optional, Dict
 
 from litellm import moderation
 from pydantic import BaseModel, Field
 
+from scholarqa import metrics
 from scholarqa.llms.litellm_helper import llm_completion, CompletionResult
 from scholarqa.llms.prompts import QUERY_DECOMPOSER_PROMPT
 
@@ -58,13 +60,130 @@ def validate(query: str) -> None:
     logger.info(f"{query} is valid")
 
 
-def decompose_query(query: str, decomposer_llm_model: str) -> Tuple[LLMProcessedQuery, CompletionResult]:
+# Short keyword style queries (like those from the ideation agent's generate_query) are decomposed with rules
+FAST_PATH_MAX_WORDS = 12
+QUESTION_PATTERN = re.compile(r"\?|^(what|which|who|whom|whose|when|where|why|how|is|are|does|do|can|could|should|"
+                              r"compare|explain|summarize|list|find|give|show)\b", re.IGNORECASE)
+YEAR = r"((?:19|20)\d{2})"
+YEAR_RANGE_PATTERNS = [
+    (re.compile(rf"\b(?:from|between)?\s*{YEAR}\s*(?:-|–|to|and)\s*{YEAR}\b", re.IGNORECASE),
+     lambda m: f"{m.group(1)}-{m.group(2)}"),
+    (re.compile(rf"\b(?:since|from|after)\s+{YEAR}\b", re.IGNORECASE),
+     lambda m: f"{int(m.group(1)) + 1}-" if m.group(0).lower().startswith("after") else f"{m.group(1)}-"),
+    (re.compile(rf"\b(?:before|until|up to)\s+{YEAR}\b", re.IGNORECASE),
+     lambda m: f"-{int(m.group(1)) - 1}" if m.group(0).lower().startswith("before") else f"-{m.group(1)}"),
+    # a bare year is often part of a name (SemEval 2017, ImageNet 2012), so only "in <year>" is a filter
+    (re.compile(rf"\bin\s+{YEAR}\b", re.IGNORECASE), lambda m: f"{m.group(1)}-{m.group(1)}"),
+]
+VENUES = ["ACL", "EMNLP", "NAACL", "EACL", "COLING", "TACL", "NeurIPS", "NIPS", "ICML", "ICLR", "AAAI", "IJCAI", "CVPR",
+          "ICCV", "ECCV", "KDD", "SIGIR", "WWW", "WSDM", "CHI", "UIST", "CSCW", "arXiv", "Nature", "Science"]
+# a filter removed from the query leaves this marker behind, connectives are only dropped next to one
+REMOVED = "\x00"
+CONNECTIVES = r"(?:and|or|in|at|from|for|on|of|with|by)"
+# a whole word connective: not part of a hyphenated word ("in-context", "on-policy", "or-tools", "by-product")
+CONNECTIVE = rf"(?<![\w-]){CONNECTIVES}(?=\s|$)"
+REMOVED_RUN = rf"(?:[\s,;:]*(?:{REMOVED}|{CONNECTIVE}))*[\s,;:]*{REMOVED}(?:[\s,;:]*(?:{REMOVED}|{CONNECTIVE}))*"
+# removed filters with the connectives left dangling around them at the start or end of the query
+# ("... at ICLR and ICML" -> "... and", "2019-2021 and ..." -> "and ...")
+DANGLING_PATTERN = re.compile(rf"^{REMOVED_RUN}|{REMOVED_RUN}[\s,;:]*$", re.IGNORECASE)
+# venue names are matched case-sensitively and never inside hyphenated words ("chi-square"), and only as a filter
+# in an explicit context: "at/in <venues>" ending the phrase, or "<venues> papers". "materials Science education"
+# or "the Nature of ..." keep the word in the query
+VENUE = rf"(?<![\w-])(?:{'|'.join(VENUES)})(?![\w-])"
+VENUE_LIST = rf"{VENUE}(?:\s*(?:,|\band\b|\bor\b)\s*{VENUE})*"
+VENUE_END = r"(?=\s*(?:$|[,;.]|(?i:and|or|since|from|after|before|until|papers?)\b))"
+VENUE_PATTERN = re.compile(rf"\b(?i:at|in)\s+({VENUE_LIST}){VENUE_END}(?:\s+(?i:papers?)\b)?|"
+                           rf"({VENUE_LIST})\s+(?i:papers?)\b")
+VENUE_MENTION = re.compile(VENUE)
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().strip(".?!").lower()
+
+
+class DecompositionCache:
+    """Thread-safe LRU of decomposed queries keyed by (normalized query, decomposer model)."""
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], LLMProcessedQuery]" = OrderedDict()
+
+    def get(self, query: str, model: str) -> Optional[LLMProcessedQuery]:
+        with self._lock:
+            processed = self._entries.get((normalize_query(query), model))
+            if processed is None:
+                return None
+            self._entries.move_to_end((normalize_query(query), model))
+        # callers get their own filters dict
+        return processed._replace(search_filters=dict(processed.search_filters))
+
+    def put(self, query: str, model: str, processed: LLMProcessedQuery) -> None:
+        with self._lock:
+            self._entries[(normalize_query(query), model)] = processed._replace(
+                search_filters=dict(processed.search_filters))
+            self._entries.move_to_end((normalize_query(query), model))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+decomposition_cache = DecompositionCache()
+
+
+def fast_path_decompose(query: str) -> Optional[LLMProcessedQuery]:
+    """Rules based decomposition of short keyword style queries: pull out year ranges and well known venues, use
+    the remaining keywords as both the rewritten and the keyword query. Returns None for anything that looks like a
+    natural language question or names a venue ambiguously, which still goes to the LLM."""
+    query = re.sub(r"\s+", " ", query).strip()
+    if not query or len(query.split()) > FAST_PATH_MAX_WORDS or QUESTION_PATTERN.search(query):
+        return None
+    search_filters = dict()
+    for pattern, to_filter in YEAR_RANGE_PATTERNS:
+        match = pattern.search(query)
+        if match:
+            search_filters["year"] = to_filter(match)
+            query = pattern.sub(f" {REMOVED} ", query, count=1)
+            break
+    venues = [venue for match in VENUE_PATTERN.finditer(query)
+              for venue in VENUE_MENTION.findall(match.group(1) or match.group(2))]
+    query = VENUE_PATTERN.sub(f" {REMOVED} ", query)
+    if VENUE_MENTION.search(query):
+        # a venue name outside of an explicit filter context is ambiguous, the LLM decides
+        return None
+    if venues:
+        search_filters["venue"] = ",".join(dict.fromkeys(venues))
+    keywords = DANGLING_PATTERN.sub(" ", query).replace(REMOVED, " ")
+    keywords = re.sub(r"\s+", " ", keywords).strip(" ,;:-")
+    if not keywords:
+        return None
+    return LLMProcessedQuery(rewritten_query=keywords, keyword_query=keywords, search_filters=search_filters)
+
+
+def decompose_query(query: str, decomposer_llm_model: str, cancel_token: Any = None, use_cache: bool = True,
+                    fast_path: bool = True) -> Tuple[LLMProcessedQuery, CompletionResult]:
+    if use_cache:
+        cached = decomposition_cache.get(query, decomposer_llm_model)
+        metrics.record_cache("decomposition", cached is not None)
+        if cached is not None:
+            logger.info(f"Decomposed query served from cache: {cached}")
+            return cached, CompletionResult(content=json.dumps(cached._asdict()), model="decomposition-cache",
+                                            cost=0.0, input_tokens=0, output_tokens=0, total_tokens=0)
+    if fast_path:
+        processed = fast_path_decompose(query)
+        if processed is not None:
+            logger.info(f"Decomposed keyword query without the LLM: {processed}")
+            if use_cache:
+                decomposition_cache.put(query, decomposer_llm_model, processed)
+            return processed, CompletionResult(content=json.dumps(processed._asdict()), model="rules",
+                                               cost=0.0, input_tokens=0, output_tokens=0, total_tokens=0)
+
     search_filters = dict()
     decomp_query_res = None
     try:
         # decompose query to get llm re-written and keyword query with filters
         decomp_query_res = llm_completion(user_prompt=query, system_prompt=QUERY_DECOMPOSER_PROMPT,
-                                          model=decomposer_llm_model, max_tokens=4096, response_format=DecomposedQuery)
+                                          model=decomposer_llm_model, max_tokens=4096, response_format=DecomposedQuery,
+                                          cancel_token=cancel_token)
         decomposed_query = json.loads(decomp_query_res.content)
         decomposed_query = {k: str(v) if type(v) == int else v for k, v in decomposed_query.items()}
         decomposed_query = DecomposedQuery(**decomposed_query)
@@ -80,7 +199,13 @@ def decompose_query(query: str, decomposer_llm_model: str) -> Tuple[LLMProcessed
         logger.error(f"Error while decomposing query: {e}")
         rewritten_query = query
         keyword_query = ""
+        if decomp_query_res is None:
+            decomp_query_res = CompletionResult(content="", model=decomposer_llm_model, cost=0.0, input_tokens=0,
+                                                output_tokens=0, total_tokens=0)
         decomp_query_res = decomp_query_res._replace(model=f"error-{decomp_query_res.model}")
 
-    return LLMProcessedQuery(rewritten_query=rewritten_query, keyword_query=keyword_query,
-                             search_filters=search_filters), decomp_query_res
+    processed = LLMProcessedQuery(rewritten_query=rewritten_query, keyword_query=keyword_query,
+                                  search_filters=search_filters)
+    if use_cache and not decomp_query_res.model.startswith("error-"):
+        decomposition_cache.put(query, decomposer_llm_model, processed)
+    return processed, decomp_query_res
@@ -0,0 +1,237 @@
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import List, Any, Dict, Optional, Set, Iterable, Tuple
+
+from scholarqa.rag.retriever_base import AbstractRetriever
+from scholarqa.utils import make_int
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+STOPWORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on", "or",
+             "that", "the", "this", "to", "was", "were", "which", "with"}
+
+
+def tokenize(text: str) -> List[str]:
+    return [tok for tok in TOKEN_PATTERN.findall(text.lower()) if tok not in STOPWORDS]
+
+
+class BM25Index:
+    """Inverted index with BM25 term weights precomputed per posting, so a query is a sum of weights."""
+
+    def __init__(self, docs: List[str], k1: float = 1.2, b: float = 0.75):
+        self.num_docs = len(docs)
+        tokenized = [tokenize(doc) for doc in docs]
+        avg_len = (sum(len(toks) for toks in tokenized) / self.num_docs) if self.num_docs else 0.0
+        term_postings = defaultdict(list)
+        for doc_idx, toks in enumerate(tokenized):
+            for term, tf in Counter(toks).items():
+                term_postings[term].append((doc_idx, tf, len(toks)))
+
+        self.postings: Dict[str, List[Tuple[int, float]]] = dict()
+        for term, plist in term_postings.items():
+            idf = math.log(1 + (self.num_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            self.postings[term] = [
+                (doc_idx, idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len / avg_len)))
+                for doc_idx, tf, doc_len in plist
+            ]
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            for doc_idx, weight in self.postings.get(term, ()):
+                scores[doc_idx] += weight
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+
+
+class DenseIndex:
+    """Flat inner-product index over L2-normalised sentence embeddings."""
+
+    def __init__(self, docs: List[str], model_name: str, batch_size: int = 64):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.embeddings = self._encode(docs, batch_size)
+
+    def _encode(self, texts: List[str], batch_size: int = 64):
+        import numpy as np
+
+        return self.model.encode(texts, batch_size=batch_size, normalize_embeddings=True, convert_to_numpy=True,
+                                 show_progress_bar=False).astype(np.float32)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        import numpy as np
+
+        if not len(self.embeddings):
+            return []
+        scores = self.embeddings @ self._encode([query])[0]
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(idx), float(scores[idx])) for idx in top]
+
+
+def reciprocal_rank_fusion(ranked_lists: Iterable[List[Tuple[int, float]]], k: int = 60) -> List[Tuple[int, float]]:
+    fused = defaultdict(float)
+    for ranked in ranked_lists:
+        for rank, (doc_idx, _) in enumerate(ranked):
+            fused[doc_idx] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+
+class LocalHybridRetriever(AbstractRetriever):
+    """Offline stand-in for FullTextRetriever over a local corpus of S2ORC-style paper json.
+
+    Passages (one per body paragraph) are ranked with BM25 and, if an embedding model is given, a dense index;
+    the two rankings are merged with reciprocal rank fusion. Results follow the snippet schema of the S2 snippet
+    search api, and paper metadata is served from the corpus, so the whole pipeline can run without network access.
+    """
+
+    def __init__(self, papers: List[Dict[str, Any]], n_retrieval: int = 256, n_keyword_srch: int = 20,
+                 embedding_model: Optional[str] = "sentence-transformers/all-MiniLM-L6-v2", rrf_k: int = 60,
+                 min_words: int = 20):
+        self.n_retrieval = n_retrieval
+        self.n_keyword_srch = n_keyword_srch
+        self.rrf_k = rrf_k
+        self.metadata: Dict[str, Dict[str, Any]] = dict()
+        self.passages: List[Dict[str, Any]] = []
+        for paper in papers:
+            corpus_id, metadata, passages = self._parse_paper(paper)
+            self.metadata[corpus_id] = metadata
+            self.passages.extend(passage for passage in passages if len(passage["text"].split(" ")) > min_words)
+        self.paper_ids = [cid for cid, mdata in self.metadata.items() if mdata.get("abstract")]
+
+        passage_texts = [passage["text"] for passage in self.passages]
+        abstract_texts = [f"{self.metadata[cid]['title']} {self.metadata[cid]['abstract']}" for cid in self.paper_ids]
+        self.passage_bm25 = BM25Index(passage_texts)
+        self.paper_bm25 = BM25Index(abstract_texts)
+        self.passage_dense = DenseIndex(passage_texts, embedding_model) if embedding_model else None
+        logger.info(f"Local corpus loaded: {len(self.metadata)} papers, {len(self.passages)} passages")
+
+    @classmethod
+    def from_dir(cls, corpus_dir: str, **kwargs) -> "LocalHybridRetriever":
+        """Load every .json (one paper, e.g. grobid/doc2json output) and .jsonl (one paper per line) file in a dir."""
+        papers = []
+        for path in sorted(glob.glob(os.path.join(corpus_dir, "*.json*"))):
+            with open(path) as f:
+                if path.endswith(".jsonl"):
+                    papers.extend(json.loads(line) for line in f if line.strip())
+                else:
+                    papers.append(json.load(f))
+        return cls(papers, **kwargs)
+
+    @staticmethod
+    def _corpus_id(paper: Dict[str, Any]) -> str:
+        for key in ("corpus_id", "corpusId"):
+            if str(paper.get(key, "")).isdigit():
+                return str(paper[key])
+        # the pipeline expects integer corpus ids, derive a stable one from the paper id
+        paper_id = str(paper.get("paper_id") or paper.get("paperId") or paper.get("title"))
+        return str(int(hashlib.sha1(paper_id.encode()).hexdigest()[:12], 16))
+
+    def _parse_paper(self, paper: Dict[str, Any]) -> Tuple[str, Dict[str, Any], List[Dict[str, Any]]]:
+        corpus_id = self._corpus_id(paper)
+        parse = paper.get("pdf_parse") or paper
+        abstract = paper.get("abstract") or parse.get("abstract") or ""
+        if isinstance(abstract, list):
+            abstract = " ".join(para["text"] for para in abstract)
+        metadata = {
+            "corpusId": corpus_id,
+            "paperId": paper.get("paperId") or paper.get("paper_id") or corpus_id,
+            "title": paper.get("title") or "",
+            "abstract": abstract,
+            "authors": [{"name": a} if isinstance(a, str) else
+                        {"name": a.get("name") or " ".join(filter(None, [a.get("first"), a.get("last")]))}
+                        for a in paper.get("authors") or []],
+            "venue": paper.get("venue") or "",
+            "year": make_int(paper.get("year")),
+            "citationCount": make_int(paper.get("citationCount", 0)),
+            "referenceCount": make_int(paper.get("referenceCount", len(parse.get("bib_entries") or {}))),
+            "influentialCitationCount": make_int(paper.get("influentialCitationCount", 0)),
+            "isOpenAccess": paper.get("isOpenAccess", True),
+            "openAccessPdf": paper.get("openAccessPdf"),
+        }
+
+        bib_entries = parse.get("bib_entries") or {}
+        passages, offset = [], 0
+        for para in parse.get("body_text") or []:
+            ref_mentions = []
+            for span in para.get("cite_spans") or []:
+                linked_id = (bib_entries.get(span.get("ref_id")) or {}).get("link")
+                if str(linked_id or "").isdigit() and span.get("start") is not None:
+                    ref_mentions.append({"matchedPaperCorpusId": str(linked_id), "start": span["start"],
+                                         "end": span["end"]})
+            passages.append({
+                "corpus_id": corpus_id,
+                "title": metadata["title"],
+                "text": para["text"],
+                "section_title": para.get("section") or "body",
+                "char_start_offset": offset,
+                "sentence_offsets": [],
+                "ref_mentions": ref_mentions,
+                "stype": "local",
+            })
+            offset += len(para["text"]) + 1
+        return corpus_id, metadata, passages
+
+    @staticmethod
+    def _passes_filters(metadata: Dict[str, Any], filter_kwargs: Dict[str, Any]) -> bool:
+        """Apply the S2 search style filters produced by query decomposition: year ("2019", "2019-", "-2021",
+        "2019-2021") and venue (comma separated)."""
+        year_filter = filter_kwargs.get("year")
+        if year_filter:
+            year = metadata.get("year")
+            if not year:
+                return False
+            year_filter = str(year_filter)
+            start, end = year_filter.split("-", 1) if "-" in year_filter else (year_filter, year_filter)
+            if (start and year < int(start)) or (end and year > int(end)):
+                return False
+        venue_filter = filter_kwargs.get("venue")
+        if venue_filter:
+            venues = {v.strip().lower() for v in str(venue_filter).split(",") if v.strip()}
+            if (metadata.get("venue") or "").lower() not in venues:
+                return False
+        return True
+
+    def retrieve_passages(self, query: str, **filter_kwargs) -> List[Dict[str, Any]]:
+        if not self.n_retrieval or not self.passages:
+            return []
+        # over-fetch from each ranking so filtering still leaves n_retrieval candidates
+        depth = self.n_retrieval * 2
+        rankings = [self.passage_bm25.search(query, depth)]
+        if self.passage_dense:
+            rankings.append(self.passage_dense.search(query, depth))
+        snippets_list = []
+        for passage_idx, score in reciprocal_rank_fusion(rankings, self.rrf_k):
+            passage = self.passages[passage_idx]
+            if not self._passes_filters(self.metadata[passage["corpus_id"]], filter_kwargs):
+                continue
+            snippets_list.append({**passage, "score": score})
+            if len(snippets_list) == self.n_retrieval:
+                break
+        return snippets_list
+
+    def retrieve_additional_papers(self, query: str, **filter_kwargs) -> List[Dict[str, Any]]:
+        if not self.n_keyword_srch:
+            return []
+        paper_data = []
+        for paper_idx, _ in self.paper_bm25.search(query, len(self.paper_ids)):
+            metadata = self.metadata[self.paper_ids[paper_idx]]
+            if not self._passes_filters(metadata, filter_kwargs):
+                continue
+            paper_data.append({**metadata, "corpus_id": metadata["corpusId"], "text": metadata["abstract"],
+                               "section_title": "abstract", "char_start_offset": 0, "sentence_offsets": [],
+                               "ref_mentions": [], "score": 0.0, "stype": "public_api"})
+            if len(paper_data) == self.n_keyword_srch:
+                break
+        return paper_data
+
+    def get_paper_metadata(self, corpus_ids: Set[str]) -> Dict[str, Any]:
+        return {cid: dict(self.metadata[cid]) for cid in corpus_ids if cid in self.metadata}
@@ -2,17 +2,21 @@ import json
 import logging
 import re
 import os
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from bisect import bisect_right
 from enum import Enum
-from typing import Tuple, Dict, List, Any, Generator
+from typing import Tuple, Dict, List, Any, Generator, Callable, Set, Optional, Iterable
 
 import pandas as pd
 from pydantic import BaseModel, Field
 from tqdm import tqdm
 
 from scholarqa.llms.constants import GPT_4o
-from scholarqa.llms.litellm_helper import batch_llm_completion, llm_completion
+from scholarqa.llms.litellm_helper import batch_llm_completion, llm_completion, trimmed_llm_completion, \
+    ChildCancelToken
 from scholarqa.llms.prompts import USER_PROMPT_PAPER_LIST_FORMAT, USER_PROMPT_QUOTE_LIST_FORMAT, \
     PROMPT_ASSEMBLE_NO_QUOTES_SUMMARY
+from scholarqa.tokens import count_tokens
 from scholarqa.utils import CompletionResult, get_ref_author_str, make_int, get_paper_metadata
 from anyascii import anyascii
 
@@ -23,6 +27,71 @@ import litellm
 # Regular expressions to fix weird formatting issues cause after citation linking in the evidences
 CLOSE_BRACKET_PATTERN = r'(?<![\[|,\s*\d])(\d+\])'  # (Doe et al., 2024)10] --> (Doe et al., 2024)[10]
 OPEN_BRACKET_PATTERN = r"(\[[\d+,]+),(?=[^\[]*$)"  # [8,9,(Doe et al., 2024) --> [8,9](Doe et al., 2024)
+NON_ALPHA_PATTERN = re.compile(r'[^a-zA-Z]')
+
+
+class SentenceMatchIndex:
+    """
+    Substring index over the sentences of a paper that carry inline citations (ref_mentions).
+    The lowercased sentences and their alphabet-only versions are each joined into one string with a separator
+    that cannot occur in a quote, along with the start offset of every sentence. A quote is then located with two
+    C-level str.find calls and a bisect instead of a python loop over the sentences, with the same result as
+    scanning the sentences in order and trying a raw match before an alphabet-only match in each.
+    """
+    SEP = "\x00"
+
+    def __init__(self, sentences: List[Dict[str, Any]]):
+        self.sentences = [sentence for sentence in sentences if sentence.get("ref_mentions")]
+        lowered = [sentence["text"].lower() for sentence in self.sentences]
+        alpha = [NON_ALPHA_PATTERN.sub("", sentence["text"]).lower() for sentence in self.sentences]
+        self.raw_text, self.raw_offsets = self._concat(lowered)
+        self.alpha_text, self.alpha_offsets = self._concat(alpha)
+
+    @classmethod
+    def _concat(cls, texts: List[str]) -> Tuple[str, List[int]]:
+        offsets, pos = [], 0
+        for text in texts:
+            offsets.append(pos)
+            pos += len(text) + len(cls.SEP)
+        return cls.SEP.join(texts), offsets
+
+    @staticmethod
+    def _locate(text: str, offsets: List[int], query: str) -> Tuple[int, int]:
+        """(sentence index, offset within the sentence) of the first occurrence of query, sentence index is
+        len(offsets) if there is none."""
+        pos = text.find(query)
+        if pos < 0:
+            return len(offsets), -1
+        sidx = bisect_right(offsets, pos) - 1
+        return sidx, pos - offsets[sidx]
+
+    def find(self, quote: str) -> Tuple[Optional[Dict[str, Any]], int, bool]:
+        """Return (sentence, offset of the quote in it, whether it was a raw match) for the first sentence
+        containing the quote, or (None, -1, False)."""
+        if not self.sentences:
+            return None, -1, False
+        if self.SEP in quote:
+            return self._scan(quote)
+        raw_sidx, raw_idx = self._locate(self.raw_text, self.raw_offsets, quote.lower().strip())
+        alpha_sidx, alpha_idx = self._locate(self.alpha_text, self.alpha_offsets,
+                                             NON_ALPHA_PATTERN.sub("", quote).lower())
+        if raw_sidx <= alpha_sidx and raw_idx >= 0:
+            return self.sentences[raw_sidx], raw_idx, True
+        if alpha_idx >= 0:
+            return self.sentences[alpha_sidx], alpha_idx, False
+        return None, -1, False
+
+    def _scan(self, quote: str) -> Tuple[Optional[Dict[str, Any]], int, bool]:
+        # sentence by sentence fallback for the (degenerate) quotes containing the separator
+        quote_raw, quote_alpha = quote.lower().strip(), NON_ALPHA_PATTERN.sub("", quote).lower()
+        for sentence in self.sentences:
+            lookup_idx = sentence["text"].lower().find(quote_raw)
+            if lookup_idx >= 0:
+                return sentence, lookup_idx, True
+            lookup_idx = NON_ALPHA_PATTERN.sub("", sentence["text"]).lower().find(quote_alpha)
+            if lookup_idx >= 0:
+                return sentence, lookup_idx, False
+        return None, -1, False
 
 
 class DimFormat(str, Enum):
@@ -133,17 +202,33 @@ def is_openai_api_key_available():
 
 
 class MultiStepQAPipeline:
-    def __init__(self, llm_model: str, fallback_llm: str = GPT_4o, batch_workers: int=20):
+    def __init__(self, llm_model: str, fallback_llm: str = GPT_4o, batch_workers: int=20, min_quotes: int = None,
+                 quote_token_budget: int = None,
+                 already_written_token_budget: Optional[int] = 3000):
         # Validate API keys on initialization
         validate_api_keys()
         
         self.llm_model = llm_model
         self.fallback_llm = fallback_llm if is_openai_api_key_available() else None
         self.batch_workers = batch_workers
+        # budgeted quote extraction: stop once min_quotes papers yielded quotes or the token budget is spent
+        self.min_quotes = min_quotes
+        self.quote_token_budget = quote_token_budget
+        # bound on the previously written sections sent with each section prompt, None to send them all in full
+        self.already_written_token_budget = already_written_token_budget
+
+    @property
+    def quote_budgeted(self) -> bool:
+        return any(b is not None for b in (self.min_quotes, self.quote_token_budget))
 
-    def step_select_quotes(self, query: str, scored_df: pd.DataFrame, sys_prompt: str) -> Tuple[
+    def step_select_quotes(self, query: str, scored_df: pd.DataFrame, sys_prompt: str, cancel_token: Any = None) -> Tuple[
         Dict[str, str], List[CompletionResult]]:
 
+        if self.quote_budgeted:
+            # the dataframe is in relevance order, so the budget is spent on the most relevant papers
+            return self.select_quotes_streaming(query, zip(scored_df["reference_string"],
+                                                           scored_df["relevance_judgment_input_expanded"]),
+                                                sys_prompt, cancel_token=cancel_token)
         logger.info(f"Querying {self.llm_model} to extract quotes from these papers with {self.batch_workers} parallel workers")
         import time as t
         t.sleep(5)
@@ -151,19 +236,100 @@ class MultiStepQAPipeline:
                      zip(scored_df["reference_string"], scored_df["relevance_judgment_input_expanded"])}
         messages = [USER_PROMPT_PAPER_LIST_FORMAT.format(query, v) for k, v in tup_items.items()]
         completion_results = batch_llm_completion(self.llm_model, messages=messages, system_prompt=sys_prompt,
-                                                  max_workers=self.batch_workers, max_tokens=4096, fallback=self.fallback_llm)
+                                                  max_workers=self.batch_workers, max_tokens=4096, fallback=self.fallback_llm,
+                                                  cancel_token=cancel_token)
         import time as t
         t.sleep(5)
-        quotes = [
-            cr.content if cr.content != "None" and not cr.content.startswith("None\n") and not cr.content.startswith(
-                "None ")
-            else "" for cr in completion_results]
+        quotes = [self.parse_quote(cr.content) for cr in completion_results]
         per_paper_summaries = {t[0]: quote for t, quote in zip(tup_items.items(), quotes) if len(quote) > 10}
         per_paper_summaries = dict(sorted(per_paper_summaries.items(), key=lambda x: x[0]))
         return per_paper_summaries, completion_results
 
+    @staticmethod
+    def parse_quote(content: str) -> str:
+        return content if content != "None" and not content.startswith("None\n") and not content.startswith(
+            "None ") else ""
+
+    def select_quotes_streaming(self, query: str, papers: Iterable[Tuple[str, str]], sys_prompt: str,
+                                cancel_token: Any = None, max_pending: int = None) -> Tuple[
+        Dict[str, str], List[CompletionResult]]:
+        """
+        Same result as step_select_quotes, but consumes (reference string, paper markdown) pairs lazily and starts
+        each paper's quote extraction as soon as it is yielded. At most max_pending requests are queued or in flight;
+        beyond that pulling the next paper waits, which in turn holds back whatever produces the papers (reranking).
+
+        With a quote budget configured, extraction stops as soon as min_quotes papers have returned a quote or the
+        completed requests used up the token budget: no further papers are pulled, and the requests' own
+        cancellation token is fired so that those not sent yet are dropped. Requests already sent are billed
+        anyway, so they are waited for and their results kept, so the reported token usage covers them.
+        """
+        max_pending = max_pending or 2 * self.batch_workers
+        submitted: Dict[str, Future] = dict()
+        pending: Dict[Future, str] = dict()
+        results: Dict[str, CompletionResult] = dict()
+        n_quotes, n_tokens = 0, 0
+
+        def collect(done: Iterable[Future]) -> None:
+            nonlocal n_quotes, n_tokens
+            for future in done:
+                ref_str = pending.pop(future)
+                results[ref_str] = future.result()
+                n_quotes += len(self.parse_quote(results[ref_str].content)) > 10
+                n_tokens += results[ref_str].total_tokens
+
+        def budget_spent() -> bool:
+            return (self.min_quotes is not None and n_quotes >= self.min_quotes) or (
+                    self.quote_token_budget is not None and n_tokens >= self.quote_token_budget)
+
+        logger.info(f"Streaming quote extraction with {self.llm_model}, {self.batch_workers} parallel workers")
+        # fired at the budget cutoff (and on failure) so no further quote request is sent
+        calls_token = ChildCancelToken(cancel_token)
+        executor = ThreadPoolExecutor(max_workers=self.batch_workers)
+        try:
+            for ref_str, paper_text in papers:
+                if ref_str in submitted:
+                    continue
+                while len(pending) >= max_pending:
+                    collect(wait(pending, return_when=FIRST_COMPLETED).done)
+                collect([future for future in pending if future.done()])
+                if budget_spent():
+                    break
+                # each paper is sent like a batch_llm_completion prompt: trimmed, and with the fallback model
+                future = executor.submit(trimmed_llm_completion,
+                                         USER_PROMPT_PAPER_LIST_FORMAT.format(query, paper_text),
+                                         system_prompt=sys_prompt, fallback=self.fallback_llm,
+                                         cancel_token=calls_token, model=self.llm_model, max_tokens=4096)
+                submitted[ref_str] = future
+                pending[future] = ref_str
+            while pending and not budget_spent():
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+        except BaseException:
+            # cancelled or failed: don't send the requests that have not been sent yet
+            calls_token.cancel("quote extraction aborted")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            if hasattr(papers, "close"):
+                papers.close()
+        if pending:
+            calls_token.cancel("quote budget reached")
+            executor.shutdown(wait=False, cancel_futures=True)
+            # requests in flight are billed whether or not their quotes are used; keep them for cost reporting
+            in_flight = [future for future in wait(pending).done
+                         if not future.cancelled() and future.exception() is None]
+            logger.info(f"Quote budget reached ({n_quotes} quotes, {n_tokens} tokens), skipped "
+                        f"{len(pending) - len(in_flight)} lower ranked papers, {len(in_flight)} already requested")
+            collect(in_flight)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        completion_results = [results[ref_str] for ref_str in submitted if ref_str in results]
+        quotes = {ref_str: self.parse_quote(cr.content) for ref_str, cr in results.items()}
+        per_paper_summaries = {ref_str: quote for ref_str, quote in quotes.items() if len(quote) > 10}
+        per_paper_summaries = dict(sorted(per_paper_summaries.items(), key=lambda x: x[0]))
+        return per_paper_summaries, completion_results
+
     def step_clustering(self, query: str, per_paper_summaries: Dict[str, str],
-                        sys_prompt: str) -> Tuple[Dict[str, Any], CompletionResult]:
+                        sys_prompt: str, cancel_token: Any = None) -> Tuple[Dict[str, Any], CompletionResult]:
         def make_prompt(query: str, paper_paper_quotes_dict: Dict[str, str]) -> str:
             # paper_paper_quotes_dict is a dictionary with keys being the paper titles and values being the quotes
             # need to make a single string with all of the quotes
@@ -185,7 +351,8 @@ class MultiStepQAPipeline:
                 response = llm_completion(user_prompt=user_prompt,
                                           system_prompt=sys_prompt, fallback=None, model=self.llm_model,
                                           max_tokens=4096,
-                                          response_format={"response_schema": ClusterPlan.get_gemini_schema()}
+                                          response_format={"response_schema": ClusterPlan.get_gemini_schema()},
+                                          cancel_token=cancel_token
                                           )
             else:
                 # For other models like GPT-4, use the standard Pydantic schema
@@ -193,7 +360,8 @@ class MultiStepQAPipeline:
                                           system_prompt=sys_prompt, fallback=None, model=self.llm_model,
                                           max_tokens=4096,
                                           response_format={"response_schema": ClusterPlan.model_json_schema(
-                                              ref_template="/$defs/{model}")}
+                                              ref_template="/$defs/{model}")},
+                                          cancel_token=cancel_token
                                           )
             t.sleep(2)
         except Exception as e:
@@ -206,7 +374,8 @@ class MultiStepQAPipeline:
                     response = llm_completion(user_prompt=user_prompt,
                                              system_prompt=sys_prompt, fallback=None, model=self.fallback_llm,
                                              max_tokens=4096,
-                                             response_format=ClusterPlan
+                                             response_format=ClusterPlan,
+                                             cancel_token=cancel_token
                                              )
                 except Exception as fallback_e:
                     logger.error(f"Fallback also failed: {fallback_e}")
@@ -270,43 +439,29 @@ class MultiStepQAPipeline:
             # filter the quotes according to the plan
             reqd_paper_summaries = {k: v for k, v in per_paper_summaries.items() if k in req_ref_strs}
             # filter the dataframe according to the plan
-            reqd_ref_df = retrieval_df[retrieval_df["reference_string"].apply(lambda x: x in req_ref_strs)].copy()
-            reqd_ref_df["sentence_alpha"] = reqd_ref_df["sentences"].apply(
-                lambda x: [re.sub(r'[^a-zA-Z]', '', sentence["text"]).lower() for sentence in x])
+            reqd_ref_df = retrieval_df[retrieval_df["reference_string"].isin(req_ref_strs)]
             # iterate over the reqd_ref_df and get the snippets for each row from reqd_paper_summaries
-            for row_idx, row in reqd_ref_df.iterrows():
-                ref_str = row["reference_string"]
+            for ref_str, sentences in zip(reqd_ref_df["reference_string"], reqd_ref_df["sentences"]):
                 curr_reqd_quotes = reqd_paper_summaries[ref_str].split("...")
                 new_quotes = []
-                sentences = row["sentences"]
-                sent_alpa = row["sentence_alpha"]
+                match_index = SentenceMatchIndex(sentences)
                 curr_inline_citations = set()
-                curr_reqd_quotes_reg = [re.sub(r'[^a-zA-Z]', '', quote).lower() for quote in curr_reqd_quotes]
-                for quote, quote_reg in zip(curr_reqd_quotes, curr_reqd_quotes_reg):
+                for quote in curr_reqd_quotes:
                     new_quote = quote.strip()
                     shift = 0  # keep track of changes to the offsets when the evidence is modified
-                    for sidx, sentence in enumerate(sentences):
-                        # can lookup exact string now since we prompt the llm to include the citations in the quotes
-                        if sentence.get("ref_mentions"):
-                            lookup_idx = sentence["text"].lower().find(quote.lower().strip())
-                            raw_match = lookup_idx >= 0
-                            if not raw_match:
-                                lookup_idx = sent_alpa[sidx].find(quote_reg)
-                            if lookup_idx >= 0:
-                                lookup_end = lookup_idx + len(quote)
-                                for sref in sentence["ref_mentions"]:
-                                    if sref.get("start") >= lookup_idx and sref.get("end") <= lookup_end:
-                                        curr_inline_citations.add(sref["matchedPaperCorpusId"])
-                                        if raw_match:
-                                            new_start, new_end = sref["start"] - lookup_idx, sref["end"] - lookup_idx
-                                            cite_str = f"({sref['matchedPaperCorpusId']})"
-                                            new_quote = new_quote[:new_start + shift] + cite_str + new_quote[
-                                                                                                   new_end + shift:]
-                                            shift += (len(cite_str) - sref["end"] + sref["start"])
-                                curr_inline_citations.update(
-                                    [sref["matchedPaperCorpusId"] for sref in sentence["ref_mentions"] if
-                                     sref.get("start") >= lookup_idx and sref.get("end") <= lookup_end])
-                                break
+                    # can lookup exact string now since we prompt the llm to include the citations in the quotes
+                    sentence, lookup_idx, raw_match = match_index.find(quote)
+                    if sentence is not None:
+                        lookup_end = lookup_idx + len(quote)
+                        for sref in sentence["ref_mentions"]:
+                            if sref.get("start") >= lookup_idx and sref.get("end") <= lookup_end:
+                                curr_inline_citations.add(sref["matchedPaperCorpusId"])
+                                if raw_match:
+                                    new_start, new_end = sref["start"] - lookup_idx, sref["end"] - lookup_idx
+                                    cite_str = f"({sref['matchedPaperCorpusId']})"
+                                    new_quote = new_quote[:new_start + shift] + cite_str + new_quote[
+                                                                                           new_end + shift:]
+                                    shift += (len(cite_str) - sref["end"] + sref["start"])
 
                     new_quotes.append(new_quote)
                 per_paper_inline_cites[ref_str] = list(sorted(curr_inline_citations))
@@ -322,7 +477,9 @@ class MultiStepQAPipeline:
 
     def populate_citations_metadata(self, avl_paper_metadata: Dict[str, Dict[str, Any]],
                                     paper_inline_cites: Dict[str, List],
-                                    per_paper_summaries: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+                                    per_paper_summaries: Dict[str, Any],
+                                    metadata_fn: Callable[[Set[str]], Dict[str, Any]] = get_paper_metadata) -> \
+            Dict[str, Dict[str, Any]]:
         """
         retrieve the metadata of the quote inline citations if not already present and update the quotes from string,
         to a dict of {"quote": quote, "inline_citations": {ref_str: abstract, ... }}.
@@ -333,7 +490,7 @@ class MultiStepQAPipeline:
                                    item not in avl_paper_metadata}
         if additional_citation_ids:
             logger.info(f"Fetching metadata for {len(additional_citation_ids)} additional inline citations")
-            additional_metadata = get_paper_metadata(additional_citation_ids)
+            additional_metadata = metadata_fn(additional_citation_ids)
         else:
             additional_metadata = dict()
         per_paper_summaries = {k: {"quote": quote, "inline_citations": dict()} for k, quote in
@@ -365,15 +522,33 @@ class MultiStepQAPipeline:
         return per_paper_summaries
 
     def extend_quote_citations(self, score_df: pd.DataFrame, per_paper_summaries: Dict[str, str],
-                               plan_json: Dict[str, List[int]], paper_metadata: Dict[str, Any]):
+                               plan_json: Dict[str, List[int]], paper_metadata: Dict[str, Any],
+                               metadata_fn: Callable[[Set[str]], Dict[str, Any]] = get_paper_metadata):
         per_paper_inline_cites = self.get_quote_citations(score_df, per_paper_summaries, plan_json)
         per_paper_summaries_extd = self.populate_citations_metadata(paper_metadata, per_paper_inline_cites,
-                                                                    per_paper_summaries)
+                                                                    per_paper_summaries, metadata_fn)
         return per_paper_summaries_extd
 
+    def fit_already_written(self, sections: List[str]) -> str:
+        """The sections written so far, as context for the next one. Within already_written_token_budget the
+        latest sections are kept whole; older ones are cut down to their name and TLDR lines."""
+        kept, n_tokens = [], 0
+        for section in reversed(sections):
+            # existing sections should have their summaries removed because they are confusing.
+            # remove anything in []
+            text = re.sub(r"\[.*?\]", "", section)
+            section_tokens = count_tokens(text)
+            if self.already_written_token_budget is not None and \
+                    n_tokens + section_tokens > self.already_written_token_budget:
+                text = "\n".join(text.strip().split("\n")[:2])
+                section_tokens = count_tokens(text)
+            kept.append(text)
+            n_tokens += section_tokens
+        return "\n\n".join(reversed(kept))
+
     def generate_iterative_summary(self, query: str, per_paper_summaries_extd: Dict[str, Dict[str, Any]],
                                    plan: Dict[str, Any],
-                                   sys_prompt: str) -> Generator[CompletionResult, None, None]:
+                                   sys_prompt: str, cancel_token: Any = None) -> Generator[CompletionResult, None, None]:
         # first, we need to make a map from the index to the quotes because the llm is using index only
 
         # now fill in the prompt
@@ -395,10 +570,7 @@ class MultiStepQAPipeline:
                     )
                 else:
                     logger.warning(f"index {ind} out of bounds")
-            # existing sections should have their summaries removed because they are confusing.
-            # remove anything in []
-            already_written = "\n\n".join(existing_sections)
-            already_written = re.sub(r"\[.*?\]", "", already_written)
+            already_written = self.fit_already_written(existing_sections)
             fill_in_prompt_args = {
                 "query": query,
                 "plan": plan_str,
@@ -412,7 +584,7 @@ class MultiStepQAPipeline:
                 filled_in_prompt = PROMPT_ASSEMBLE_NO_QUOTES_SUMMARY.format(**fill_in_prompt_args)
 
             response = llm_completion(user_prompt=filled_in_prompt, model=self.llm_model, fallback=self.fallback_llm,
-                                      max_tokens=4096)
+                                      max_tokens=4096, cancel_token=cancel_token)
             import time as t 
             t.sleep(5)
             existing_sections.append(response.content)
@@ -1,10 +1,7 @@
 from typing import Dict, Any, Optional, Tuple, Union, List
-from sentence_transformers import CrossEncoder
 
-import modal
 import os
 import numpy as np
-import torch
 
 from scholarqa.rag.reranker.reranker_base import AbstractReranker, RERANKER_MAPPING
 import logging
@@ -24,6 +21,9 @@ class ModalReranker(AbstractReranker):
     #         (query, documents, self.batch_size), streaming=False
     #     )
     def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size: int = 32):
+        import torch
+        from sentence_transformers import CrossEncoder
+
         logger.info(f"Using HuggingFace model {model_name} for reranking")
         self.model = CrossEncoder(model_name, device=torch.device("cuda" if torch.cuda.is_available() else "cpu"))
         self.batch_size = batch_size
@@ -71,9 +71,11 @@ RERANKER_MAPPING["modal"] = ModalReranker
 
 
 class ModalEngine:
-    modal_client: modal.Client
+    modal_client: "modal.Client"
 
     def __init__(self, model_id: str, api_name: str, gen_options: Dict[str, Any] = None) -> None:
+        import modal
+
         # Skiff secrets
         modal_token = os.getenv("MODAL_TOKEN")
         modal_token_secret = os.getenv("MODAL_TOKEN_SECRET")
@@ -86,12 +88,14 @@ class ModalEngine:
     def fn_lookup(
             self,
             **opt_kwargs,
-    ) -> Tuple[modal.Function, Optional[Dict[str, Any]]]:
+    ) -> Tuple["modal.Function", Optional[Dict[str, Any]]]:
         if opt_kwargs:
             opts = {**self.gen_options, **opt_kwargs} if self.gen_options else {**opt_kwargs}
         else:
             opts = self.gen_options
 
+        import modal
+
         fn = modal.Function.lookup(self.model_id, self.api_name, client=self.modal_client)
         return fn, opts if opts else None
 
@@ -111,6 +115,9 @@ class ModalEngine:
 
 class HuggingFaceReranker(AbstractReranker):
     def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size: int = 32):
+        import torch
+        from sentence_transformers import CrossEncoder
+
         logger.info(f"Using HuggingFace model {model_name} for reranking")
         self.model = CrossEncoder(model_name, device=torch.device("cuda" if torch.cuda.is_available() else "cpu"))
         self.batch_size = batch_size
@@ -1,9 +1,11 @@
+import heapq
 import logging
 from abc import abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Set, Iterable, Optional, Generator
 
 import pandas as pd
 
+from scholarqa import metrics
 from scholarqa.rag.reranker.reranker_base import AbstractReranker
 from scholarqa.rag.retriever_base import AbstractRetriever
 from scholarqa.utils import make_int, get_ref_author_str
@@ -12,6 +14,74 @@ from anyascii import anyascii
 logger = logging.getLogger(__name__)
 
 
+class PaperAggregator:
+    """Incrementally aggregate scored snippets into papers, keeping only the top_n papers by relevance.
+
+    Snippets can be fed one at a time as the reranker produces them. Each paper is a shallow copy of its entry in
+    paper_metadata, so cached metadata is never mutated. A min-heap over the papers' relevance, with lazily
+    discarded stale entries, decides which paper to evict once more than top_n are held. Relevance only grows as
+    snippets arrive, so for a stream sorted by score (as reranker output is) no kept paper ever loses a snippet.
+    """
+
+    def __init__(self, paper_metadata: Dict[str, Any], top_n: Optional[int] = None):
+        self.paper_metadata = paper_metadata
+        self.top_n = top_n if top_n and top_n > 0 else None
+        self.papers: Dict[str, Dict[str, Any]] = dict()
+        self._first_seen: Dict[str, int] = dict()
+        # (relevance, -first_seen, corpus_id): among equally relevant papers the latest seen is evicted first
+        self._heap = []
+
+    def add(self, snippet: Dict[str, Any]) -> None:
+        """Fold a scored snippet into its paper; snippets without metadata or text are skipped."""
+        corpus_id = snippet["corpus_id"]
+        if corpus_id not in self.paper_metadata or snippet["text"] is None:
+            return
+        score = snippet.get("rerank_score", snippet["score"])
+        paper = self.papers.get(corpus_id)
+        if paper is None:
+            paper = {**self.paper_metadata[corpus_id], "corpus_id": corpus_id, "sentences": [],
+                     "relevance_judgement": max(-1, score)}
+            self.papers[corpus_id] = paper
+            self._first_seen.setdefault(corpus_id, len(self._first_seen))
+            self._push(corpus_id)
+        elif score > paper["relevance_judgement"]:
+            paper["relevance_judgement"] = score
+            self._push(corpus_id)
+        if snippet["stype"] != "public_api":
+            paper["sentences"].append(snippet)
+        if not paper["abstract"] and snippet["section_title"] == "abstract":
+            paper["abstract"] = snippet["text"]
+        if self.top_n and len(self.papers) > self.top_n:
+            self._evict()
+
+    def add_all(self, snippets: Iterable[Dict[str, Any]]) -> "PaperAggregator":
+        for snippet in snippets:
+            self.add(snippet)
+        return self
+
+    def _push(self, corpus_id: str) -> None:
+        heapq.heappush(self._heap, (self.papers[corpus_id]["relevance_judgement"], -self._first_seen[corpus_id],
+                                    corpus_id))
+
+    def _evict(self) -> None:
+        while self._heap:
+            relevance, _, corpus_id = heapq.heappop(self._heap)
+            paper = self.papers.get(corpus_id)
+            if paper is not None and paper["relevance_judgement"] == relevance:
+                del self.papers[corpus_id]
+                return
+
+    def result(self) -> List[Dict[str, Any]]:
+        """The kept papers, most relevant first (ties in the order the papers were first seen)."""
+        return sorted(self.papers.values(),
+                      key=lambda paper: (-paper["relevance_judgement"], self._first_seen[paper["corpus_id"]]))
+
+    def metadata_view(self) -> Dict[str, Any]:
+        """paper_metadata overlaid with the aggregated relevance and abstract of the kept papers, for this query."""
+        return {**self.paper_metadata,
+                **{cid: {k: v for k, v in paper.items() if k != "sentences"} for cid, paper in self.papers.items()}}
+
+
 class AbsPaperFinder(AbstractRetriever):
 
     @abstractmethod
@@ -21,10 +91,11 @@ class AbsPaperFinder(AbstractRetriever):
 
 class PaperFinder(AbsPaperFinder):
     def __init__(self, retriever: AbstractRetriever,
-                 context_threshold: float = 0.0):
+                 context_threshold: float = 0.0, max_papers: int = -1):
         self.retriever = retriever
         self.context_threshold = context_threshold
         self.n_rerank = -1
+        self.max_papers = max_papers
 
     def retrieve_passages(self, query: str, **filter_kwargs) -> List[Dict[str, Any]]:
         """Retrieve relevant passages along with scores from an index for the given query"""
@@ -33,60 +104,56 @@ class PaperFinder(AbsPaperFinder):
     def retrieve_additional_papers(self, query: str, **filter_kwargs) -> List[Dict[str, Any]]:
         return self.retriever.retrieve_additional_papers(query, **filter_kwargs)
 
+    def get_paper_metadata(self, corpus_ids: Set[str]) -> Dict[str, Any]:
+        with metrics.timed("metadata"):
+            return self.retriever.get_paper_metadata(corpus_ids)
+
     def rerank(self, query: str, retrieved_ctxs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         return retrieved_ctxs
 
+    def rerank_in_chunks(self, query: str, retrieved_ctxs: List[Dict[str, Any]], chunk_size: int = 64) -> \
+            Generator[List[Dict[str, Any]], None, None]:
+        """Yield the reranked passages chunk by chunk, all passages of a paper within the same chunk, so that a
+        paper's relevance is final once its chunk is out."""
+        yield self.rerank(query, retrieved_ctxs)
+
     def aggregate_into_dataframe(self, snippets_list: List[Dict[str, Any]], paper_metadata: Dict[str, Any]) -> \
             pd.DataFrame:
         """The reranked snippets is passage level. This function aggregates the passages to the paper level,
         The Dataframe also consists of aggregated passages stitched together with the paper title and abstract in the markdown format."""
-        snippets_list = [snippet for snippet in snippets_list if snippet["corpus_id"] in paper_metadata
-                         and snippet["text"] is not None]
-        aggregated_candidates = self.aggregate_snippets_to_papers(snippets_list, paper_metadata)
-        return self.format_retrieval_response(aggregated_candidates)
+        return self.format_retrieval_response(self.aggregate_papers(snippets_list, paper_metadata).result())
 
-    @staticmethod
-    def aggregate_snippets_to_papers(snippets_list: List[Dict[str, Any]], paper_metadata: Dict[str, Any]) -> List[
-        Dict[str, Any]]:
-        logging.info(f"Aggregating {len(snippets_list)} passages at paper level with metadata")
-        paper_snippets = dict()
-        for snippet in snippets_list:
-            corpus_id = snippet["corpus_id"]
-            if corpus_id not in paper_snippets:
-                paper_snippets[corpus_id] = paper_metadata[corpus_id]
-                paper_snippets[corpus_id]["corpus_id"] = corpus_id
-                paper_snippets[corpus_id]["sentences"] = []
-            if snippet["stype"] != "public_api":
-                paper_snippets[corpus_id]["sentences"].append(snippet)
-            paper_snippets[corpus_id]["relevance_judgement"] = max(
-                paper_snippets[corpus_id].get("relevance_judgement", -1),
-                snippet.get("rerank_score", snippet["score"]))
-            if not paper_snippets[corpus_id]["abstract"] and snippet["section_title"] == "abstract":
-                paper_snippets[corpus_id]["abstract"] = snippet["text"]
-        sorted_ctxs = sorted(paper_snippets.values(), key=lambda x: x["relevance_judgement"], reverse=True)
-        logger.info(f"Scores after aggregation: {[s['relevance_judgement'] for s in sorted_ctxs]}")
-        return sorted_ctxs
-
-    def format_retrieval_response(self, agg_reranked_candidates: List[Dict[str, Any]]) -> pd.DataFrame:
-        def format_sections_to_markdown(row: List[Dict[str, Any]]) -> str:
-            # convenience function to format the sections of a paper into markdown for function below
-            # Convert the list of dictionaries to a DataFrame
-            sentences_df = pd.DataFrame(row)
-            if sentences_df.empty:
-                return ""
-            # Sort by 'char_offset' to ensure sentences are in the correct order
-            sentences_df.sort_values(by="char_start_offset", inplace=True)
-
-            # Group by 'section_title', concatenate sentences, and maintain overall order by the first 'char_offset'
-            grouped = sentences_df.groupby("section_title", sort=False)["text"].apply("\n...\n".join)
+    def aggregate_papers(self, snippets: Iterable[Dict[str, Any]], paper_metadata: Dict[str, Any]) -> \
+            PaperAggregator:
+        """Stream the snippets into a PaperAggregator capped at max_papers."""
+        aggregator = PaperAggregator(paper_metadata, self.max_papers).add_all(snippets)
+        logger.info(f"Aggregated passages into {len(aggregator.papers)} papers: "
+                    f"{[p['relevance_judgement'] for p in aggregator.result()]}")
+        return aggregator
 
-            # Exclude sections titled 'Abstract' or 'Title'
-            grouped = grouped[(grouped.index != "abstract") & (grouped.index != "title")]
+    @staticmethod
+    def aggregate_snippets_to_papers(snippets_list: Iterable[Dict[str, Any]], paper_metadata: Dict[str, Any],
+                                     top_n: Optional[int] = None) -> List[Dict[str, Any]]:
+        return PaperAggregator(paper_metadata, top_n).add_all(snippets_list).result()
 
-            # Format as Markdown
-            markdown_output = "\n\n".join(f"## {title}\n{text}" for title, text in grouped.items())
-            return markdown_output
+    @staticmethod
+    def format_sections_to_markdown(sentences: List[Dict[str, Any]]) -> str:
+        """Stitch a paper's passages into markdown: passages in offset order, grouped under their section title
+        in order of first appearance, skipping the abstract and title sections."""
+        if not sentences:
+            return ""
+        ordered = sorted(sentences, key=lambda s: s["char_start_offset"] if s.get("char_start_offset") is not None
+                         else float("inf"))
+        sections = dict()
+        for sentence in ordered:
+            title = sentence.get("section_title")
+            if title is None or title != title:  # groupby drops missing (None/NaN) keys
+                continue
+            sections.setdefault(title, []).append(sentence["text"])
+        return "\n\n".join(f"## {title}\n" + "\n...\n".join(texts) for title, texts in sections.items()
+                             if title not in ("abstract", "title"))
 
+    def format_retrieval_response(self, agg_reranked_candidates: List[Dict[str, Any]]) -> pd.DataFrame:
         df = pd.DataFrame(agg_reranked_candidates)
         try:
             df = df.drop(["text", "section_title", "ref_mentions", "score", "stype", "rerank_score"], axis=1)
@@ -106,7 +173,7 @@ class PaperFinder(AbsPaperFinder):
 
         # authors are lists of jsons. process with "name" key inside
 
-        df["year"] = df["year"].apply(make_int)
+        df["year"] = [make_int(year) for year in df["year"]]
 
         df["authors"] = df["authors"].fillna(value="")
 
@@ -125,28 +192,27 @@ class PaperFinder(AbsPaperFinder):
         # now we need the big relevance_judgment_input_expanded
         # top of it
         # \n## Abstract\n{row['abstract']} --> Not using abstracts OR could use and not show
-        prepend_text = df.apply(
-            lambda
-                row: f"# Title: {row['title']}\n# Venue: {row['venue']}\n"
-                     f"# Authors: {', '.join([a['name'] for a in row['authors']])}\n## Abstract\n{row['abstract']}\n",
-            axis=1,
-        )
-        section_text = df["sentences"].apply(format_sections_to_markdown)
-        # update relevance_judgment_input
-        df.loc[:, "relevance_judgment_input_expanded"] = prepend_text + section_text
-        df["reference_string"] = df.apply(
-            lambda
-                row: anyascii(f"[{make_int(row.corpus_id)} | {get_ref_author_str(row.authors)} | "
-                     f"{make_int(row['year'])} | Citations: {make_int(row['citation_count'])}]"),
-            axis=1,
-        )
+        # plain comprehensions over the columns, row-wise df.apply dominated the cost of this function
+        df.loc[:, "relevance_judgment_input_expanded"] = [
+            f"# Title: {title}\n# Venue: {venue}\n"
+            f"# Authors: {', '.join([a['name'] for a in authors])}\n## Abstract\n{abstract}\n"
+            + self.format_sections_to_markdown(sentences)
+            for title, venue, authors, abstract, sentences in
+            zip(df["title"], df["venue"], df["authors"], df["abstract"], df["sentences"])
+        ]
+        df["reference_string"] = [
+            anyascii(f"[{make_int(corpus_id)} | {get_ref_author_str(authors)} | "
+                     f"{make_int(year)} | Citations: {make_int(citation_count)}]")
+            for corpus_id, authors, year, citation_count in
+            zip(df["corpus_id"], df["authors"], df["year"], df["citation_count"])
+        ]
         return df
 
 
 class PaperFinderWithReranker(PaperFinder):
     def __init__(self, retriever: AbstractRetriever, reranker: AbstractReranker, n_rerank: int = -1,
-                 context_threshold: float = 0.5):
-        super().__init__(retriever, context_threshold)
+                 context_threshold: float = 0.5, max_papers: int = -1):
+        super().__init__(retriever, context_threshold, max_papers)
         self.n_rerank = n_rerank
         if reranker:
             self.reranker_engine = reranker
@@ -171,3 +237,21 @@ class PaperFinderWithReranker(PaperFinder):
         sorted_ctxs = sorted_ctxs[:self.n_rerank] if self.n_rerank > 0 else sorted_ctxs
         logging.info(f"Done reranking: {len(sorted_ctxs)} passages remain")
         return sorted_ctxs
+
+    def rerank_in_chunks(self, query: str, retrieved_ctxs: List[Dict[str, Any]], chunk_size: int = 64) -> \
+            Generator[List[Dict[str, Any]], None, None]:
+        if self.n_rerank > 0:
+            # keeping the top n_rerank passages needs every score first
+            yield self.rerank(query, retrieved_ctxs)
+            return
+        paper_ctxs = dict()
+        for ctx in retrieved_ctxs:
+            paper_ctxs.setdefault(ctx["corpus_id"], []).append(ctx)
+        chunk = []
+        for ctxs in paper_ctxs.values():
+            chunk.extend(ctxs)
+            if len(chunk) >= chunk_size:
+                yield self.rerank(query, chunk)
+                chunk = []
+        if chunk:
+            yield self.rerank(query, chunk)
@@ -1,8 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import List, Any, Dict
+from typing import List, Any, Dict, Set
 import logging
 
-from scholarqa.utils import query_s2_api, METADATA_FIELDS, make_int, NUMERIC_META_FIELDS
+from scholarqa.utils import query_s2_api, METADATA_FIELDS, make_int, NUMERIC_META_FIELDS, get_paper_metadata
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +16,11 @@ class AbstractRetriever(ABC):
     def retrieve_additional_papers(self, query: str, **filter_kwargs) -> List[Dict[str, Any]]:
         pass
 
+    def get_paper_metadata(self, corpus_ids: Set[str]) -> Dict[str, Any]:
+        """Metadata for the given corpus ids, keyed by corpus id. Defaults to the S2 paper batch api; retrievers
+        over a local corpus override this to stay offline."""
+        return get_paper_metadata(corpus_ids) if corpus_ids else dict()
+
 
 class FullTextRetriever(AbstractRetriever):
     def __init__(self, n_retrieval: int = 256, n_keyword_srch: int = 20):
@@ -1,25 +1,28 @@
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from threading import Thread
 from time import time
-from typing import List, Any, Dict, Tuple, Generator
+from typing import List, Any, Dict, Tuple, Generator, Iterable, Set, Callable
 from uuid import uuid4
 
 import pandas as pd
 from tqdm import tqdm
 
+from scholarqa import metrics
 from scholarqa.config.config_setup import LogsConfig
 from scholarqa.llms.constants import CostAwareLLMResult, GPT_4o
 from scholarqa.llms.litellm_helper import CLAUDE_35_SONNET, CostAwareLLMCaller, CostReportingArgs
 from scholarqa.llms.prompts import SYSTEM_PROMPT_QUOTE_PER_PAPER, SYSTEM_PROMPT_QUOTE_CLUSTER, PROMPT_ASSEMBLE_SUMMARY
 from scholarqa.models import GeneratedSection, TaskResult, ToolRequest, CitationSrc
 from scholarqa.postprocess.json_output_utils import get_json_summary
-from scholarqa.preprocess.query_preprocessor import validate, decompose_query, LLMProcessedQuery
+from scholarqa.preprocess.query_preprocessor import validate, decompose_query, normalize_query, LLMProcessedQuery
 from scholarqa.rag.multi_step_qa_pipeline import MultiStepQAPipeline
-from scholarqa.rag.retrieval import PaperFinder
+from scholarqa.rag.retrieval import PaperFinder, PaperAggregator
+from scholarqa.stage_cache import stage_key
 from scholarqa.state_mgmt.local_state_mgr import AbsStateMgrClient, LocalStateMgrClient
 from scholarqa.trace.event_traces import EventTrace
-from scholarqa.utils import get_paper_metadata, NUMERIC_META_FIELDS, CATEGORICAL_META_FIELDS
+from scholarqa.utils import NUMERIC_META_FIELDS, CATEGORICAL_META_FIELDS
 from langsmith import traceable
 
 logger = logging.getLogger(__name__)
@@ -92,13 +95,19 @@ class ScholarQA:
         self.decomposer_llm = kwargs.get("decomposer_llm", self.llm_model)
         self.state_mgr = state_mgr if state_mgr else LocalStateMgrClient(self.logs_config.log_dir)
         self.llm_caller = CostAwareLLMCaller(self.state_mgr)
+        # optional early exit for quote extraction, see MultiStepQAPipeline.select_quotes_streaming, and the
+        # token bound on the sections already written that go into each section prompt
+        quote_budget = {k: kwargs[k] for k in ("min_quotes", "quote_token_budget", "already_written_token_budget")
+                        if k in kwargs}
         if not multi_step_pipeline:
             logger.info(f"Creating a new MultiStepQAPipeline with model: {llm_model} for all the steps")
-            self.multi_step_pipeline = MultiStepQAPipeline(self.llm_model, fallback_llm=fallback_llm)
+            self.multi_step_pipeline = MultiStepQAPipeline(self.llm_model, fallback_llm=fallback_llm, **quote_budget)
         else:
             # self.multi_step_pipeline = multi_step_pipeline
             # print(self.llm)
-            self.multi_step_pipeline = MultiStepQAPipeline(self.llm_model, fallback_llm=fallback_llm)
+            self.multi_step_pipeline = MultiStepQAPipeline(self.llm_model, fallback_llm=fallback_llm, **quote_budget)
+        # opt-in StageCache memoizing pipeline stages (retrieval, rerank + quotes, plan, sections) and answers
+        self.stage_cache = kwargs.get("stage_cache")
 
         self.tool_request = None
 
@@ -121,16 +130,18 @@ class ScholarQA:
             )
 
     @traceable(name="Preprocessing: Validate and decompose user query")
-    def preprocess_query(self, query: str, cost_args: CostReportingArgs, ) -> CostAwareLLMResult:
+    def preprocess_query(self, query: str, cost_args: CostReportingArgs, cancel_token: Any = None) -> CostAwareLLMResult:
         if self.validate:
             # Validate the query for harmful/unanswerable content
             validate(query)
         # Decompose the query to get filters like year, venue, fos, citations, etc along with a re-written
         # version of the query and a query suitable for keyword search.
 
-        return self.llm_caller.call_method(
-            cost_args=cost_args, method=decompose_query, query=query, decomposer_llm_model=self.decomposer_llm
-        )
+        with metrics.timed("decompose"):
+            return self.llm_caller.call_method(
+                cost_args=cost_args, method=decompose_query, query=query, decomposer_llm_model=self.decomposer_llm,
+                cancel_token=cancel_token
+            )
 
     @traceable(name="Retrieval: Find relevant paper passages for the query")
     def find_relevant_papers(self, llm_processed_query: LLMProcessedQuery) -> Tuple[
@@ -144,15 +155,17 @@ class ScholarQA:
             step_estimated_time=5
         )
         # Get relevant paper passages from the Semantic Scholar index for the llm rewritten query
-        snippet_results = self.paper_finder.retrieve_passages(query=rewritten_query,
-                                                              **llm_processed_query.search_filters)
+        with metrics.timed("snippet_search"):
+            snippet_results = self.paper_finder.retrieve_passages(query=rewritten_query,
+                                                                  **llm_processed_query.search_filters)
         snippet_corpus_ids = {snippet["corpus_id"] for snippet in snippet_results}
         self.update_task_state(f"Retrieved {len(snippet_results)} highly relevant passages", step_estimated_time=1)
 
         if keyword_query:
             # Get additional papers from the Semantic Scholar api via keyword search
-            search_api_results = self.paper_finder.retrieve_additional_papers(keyword_query,
-                                                                              **llm_processed_query.search_filters)
+            with metrics.timed("keyword_search"):
+                search_api_results = self.paper_finder.retrieve_additional_papers(
+                    keyword_query, **llm_processed_query.search_filters)
             search_api_results = [item for item in search_api_results if item["corpus_id"] not in snippet_corpus_ids]
             self.update_task_state(
                 f"Retrieved {len(search_api_results)} more papers from Semantic Scholar abstracts using keyword search",
@@ -163,69 +176,97 @@ class ScholarQA:
 
         return snippet_results, search_api_results
 
-    @traceable(name="Retrieval: Rerank the passages and aggregate at paper level")
-    def rerank_and_aggregate(self, user_query: str, retrieved_candidates: List[Dict[str, Any]], filter_paper_metadata: [
-        Dict[str, Any]]) -> Tuple[pd.DataFrame, Dict[str, Any]]:
-        if self.paper_finder.n_rerank > 0:
-            self.update_task_state(
-                f"Further re-rank and aggregate passages to focus on up to top {self.paper_finder.n_rerank} papers",
-                step_estimated_time=10)
+    def _quote_inputs(self, aggregator: PaperAggregator, corpus_ids: Set[str]) -> Iterable[Tuple[str, str]]:
+        """(reference string, paper markdown) of the given aggregated papers, most relevant first."""
+        papers = sorted((aggregator.papers[cid] for cid in corpus_ids if cid in aggregator.papers),
+                        key=lambda paper: -paper["relevance_judgement"])
+        paper_df = self.paper_finder.format_retrieval_response(papers)
+        if paper_df.empty:
+            return []
+        return zip(paper_df["reference_string"], paper_df["relevance_judgment_input_expanded"])
+
+    @traceable(name="Retrieval + Generation: Rerank passages and extract quotes as papers are finalized")
+    def step_rerank_and_select_quotes(self, query: str, retrieved_candidates: List[Dict[str, Any]],
+                                      filter_paper_metadata: Dict[str, Any], cost_args: CostReportingArgs,
+                                      sys_prompt: str = SYSTEM_PROMPT_QUOTE_PER_PAPER, cancel_token: Any = None) -> \
+            Tuple[pd.DataFrame, Dict[str, Any], CostAwareLLMResult]:
+        """
+        Rerank the passages, aggregate them into papers and extract quotes from the papers, pipelined: the paper
+        metadata request runs alongside reranking, reranked chunks are aggregated into papers as they arrive, and
+        every paper whose passages have all been scored is handed straight to quote extraction. Quote requests are bounded by the pipeline's max_pending,
+        so a slow LLM holds back reranking rather than queueing everything. With a top n_rerank or max_papers
+        cut, papers are only final once all passages are scored; the metadata overlap still applies.
+        """
+        logger.info("Running Steps 0.5 + 1 - reranking and quote extraction")
+        self.update_task_state("Re-ranking passages and extracting salient key statements from papers",
+                               step_estimated_time=20)
         start = time()
-        reranked_candidates = self.paper_finder.rerank(user_query, retrieved_candidates)
-        logger.info("Reranking time: %.2f", time() - start)
-        paper_metadata = filter_paper_metadata
-        paper_metadata.update(get_paper_metadata(
-            {snippet["corpus_id"] for snippet in reranked_candidates if
-             snippet["corpus_id"] not in filter_paper_metadata}))
-        agg_df = self.paper_finder.aggregate_into_dataframe(reranked_candidates, paper_metadata)
+        cost_args = cost_args._replace(model=self.multi_step_pipeline.llm_model)._replace(
+            description="Corpus QA Step 1: Quote extraction")
+        missing_ids = {c["corpus_id"] for c in retrieved_candidates if c["corpus_id"] not in filter_paper_metadata}
+        state = dict()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            metadata_future = executor.submit(self.paper_finder.get_paper_metadata, missing_ids)
+
+            def get_aggregator() -> PaperAggregator:
+                if "aggregator" not in state:
+                    paper_metadata = {**filter_paper_metadata, **metadata_future.result()}
+                    state["aggregator"] = PaperAggregator(paper_metadata, self.paper_finder.max_papers)
+                return state["aggregator"]
+
+            def finalized_papers() -> Generator[Tuple[str, str], None, None]:
+                for chunk in self.paper_finder.rerank_in_chunks(query, retrieved_candidates):
+                    self._raise_if_cancelled(cancel_token)
+                    aggregator = get_aggregator()
+                    aggregator.add_all(chunk)
+                    if aggregator.top_n is None:
+                        yield from self._quote_inputs(aggregator, {snippet["corpus_id"] for snippet in chunk})
+                logger.info("Reranking done in %.2f", time() - start)
+                # quote extraction pulls the chunks, so this includes any wait on its backpressure
+                metrics.observe_stage("rerank", time() - start)
+                aggregator = get_aggregator()
+                if aggregator.top_n is not None:
+                    yield from self._quote_inputs(aggregator, set(aggregator.papers))
+
+            with metrics.timed("quotes"):
+                per_paper_summaries = self.llm_caller.call_method(cost_args,
+                                                                  self.multi_step_pipeline.select_quotes_streaming,
+                                                                  query=query, papers=finalized_papers(),
+                                                                  sys_prompt=sys_prompt, cancel_token=cancel_token)
+        aggregator = get_aggregator()
+        agg_df = self.paper_finder.format_retrieval_response(aggregator.result())
         self.update_task_state(
             f"Found {len(agg_df)} highly relevant papers after re-ranking and aggregating",
             step_estimated_time=1)
-        logger.info("Reranking w. formatting time: %.2f", time() - start)
-        return agg_df, paper_metadata
-
-    @traceable(name="Generation: Extract relevant quotes from paper passages or filter")
-    def step_select_quotes(self, query: str, scored_df: pd.DataFrame, cost_args: CostReportingArgs,
-                           sys_prompt: str = SYSTEM_PROMPT_QUOTE_PER_PAPER) -> CostAwareLLMResult:
-        logger.info("Running Step 1 - quote extraction")
-        self.update_task_state("Extracting salient key statements from papers",
-                               step_estimated_time=15)
+        if not agg_df.empty:
+            api_corpus_ids = set(agg_df[agg_df.sentences.apply(lambda x: not x)].corpus_id.astype(str))
+            ref_strs = {rs.split(" | ")[0][1:] for rs in per_paper_summaries.result}
+            logger.info(f"Paper abstracts used from s2 api: {api_corpus_ids.intersection(ref_strs)}")
         logger.info(
-            f"{scored_df.shape[0]} papers with relevance_judgement > {self.paper_finder.context_threshold} to start with.")
-        start = time()
-        cost_args = cost_args._replace(model=self.multi_step_pipeline.llm_model)._replace(
-            description="Corpus QA Step 1: Quote extraction")
-        per_paper_summaries = self.llm_caller.call_method(cost_args, self.multi_step_pipeline.step_select_quotes,
-                                                          query=query, scored_df=scored_df,
-                                                          sys_prompt=sys_prompt)
-        api_corpus_ids = set(
-            scored_df[scored_df.sentences.apply(lambda x: not x)].corpus_id.astype(str))
-        ref_strs = {rs.split(" | ")[0][1:] for rs in per_paper_summaries.result}
-        logger.info(f"Paper abstracts used from s2 api: {api_corpus_ids.intersection(ref_strs)}")
-
-        logger.info(
-            f"Step 1 done - {len(per_paper_summaries.result)} papers with quotes extracted, cost: {per_paper_summaries.tot_cost}, "
-            f"time: {time() - start:.2f}")
-        return per_paper_summaries
+            f"Steps 0.5 + 1 done - {len(agg_df)} papers after re-ranking, {len(per_paper_summaries.result)} with "
+            f"quotes extracted, cost: {per_paper_summaries.tot_cost}, time: {time() - start:.2f}")
+        return agg_df, aggregator.metadata_view(), per_paper_summaries
 
     @traceable(name="Generation: Cluster quotes to generate an organization plan")
     def step_clustering(self, query: str, per_paper_summaries: Dict[str, str], cost_args: CostReportingArgs,
-                        sys_prompt: str = SYSTEM_PROMPT_QUOTE_CLUSTER) -> CostAwareLLMResult:
+                        sys_prompt: str = SYSTEM_PROMPT_QUOTE_CLUSTER, cancel_token: Any = None) -> CostAwareLLMResult:
         logger.info("Running Step 2: Clustering the extracted quotes into meaningful dimensions")
         self.update_task_state("Synthesizing an answer outline based on extracted quotes", step_estimated_time=15)
         start = time()
         cost_args = cost_args._replace(model=self.multi_step_pipeline.llm_model)._replace(
             description="Corpus QA Step 2: Clustering quotes into dimensions")
-        cluster_json = self.llm_caller.call_method(cost_args, self.multi_step_pipeline.step_clustering,
-                                                   query=query, per_paper_summaries=per_paper_summaries,
-                                                   sys_prompt=sys_prompt)
+        with metrics.timed("clustering"):
+            cluster_json = self.llm_caller.call_method(cost_args, self.multi_step_pipeline.step_clustering,
+                                                       query=query, per_paper_summaries=per_paper_summaries,
+                                                       sys_prompt=sys_prompt, cancel_token=cancel_token)
         logger.info(f"Step 2 done - {cluster_json.result}, cost: {cluster_json.tot_cost}, time: {time() - start:.2f}")
         return cluster_json
 
     @traceable(name="Generation: Generate an iterative summary")
     def step_gen_iterative_summary(self, query: str, per_paper_summaries: Dict[str, str],
                                    plan_json: Dict[str, Any], cost_args: CostReportingArgs,
-                                   sys_prompt: str = PROMPT_ASSEMBLE_SUMMARY) -> Generator[
+                                   sys_prompt: str = PROMPT_ASSEMBLE_SUMMARY, cancel_token: Any = None) -> Generator[
         str, None, CostAwareLLMResult]:
         logger.info("Running Step 3: Assemble the summary with the links (takes ~2 mins)")
         start = time()
@@ -234,7 +275,8 @@ class ScholarQA:
             description="Corpus QA Step 3: Generating summarized answer")
         sec_generator = self.llm_caller.call_iter_method(cost_args, self.multi_step_pipeline.generate_iterative_summary,
                                                          query=query, per_paper_summaries_extd=per_paper_summaries,
-                                                         plan=plan_json, sys_prompt=sys_prompt)
+                                                         plan=plan_json, sys_prompt=sys_prompt,
+                                                         cancel_token=cancel_token)
         try:
             while True:
                 response = next(sec_generator)
@@ -261,23 +303,116 @@ class ScholarQA:
     def postprocess_json_output(self, json_summary: List[Dict[str, Any]]) -> None:
         pass
 
-    def answer_query(self, query: str) -> Dict[str, Any]:
+    def answer_query(self, query: str, cancel_token: Any = None) -> Dict[str, Any]:
         task_id = str(uuid4())
         self.logs_config.task_id = task_id
         logger.info("New task")
         tool_request = ToolRequest(task_id=task_id, query=query, user_id="lib_user")
-        task_result = self.run_qa_pipeline(tool_request)
+        task_result = self.run_qa_pipeline(tool_request, cancel_token=cancel_token)
         return task_result.model_dump()
 
     def gen_table_thread(self, user_id: str, query: str, dim: Dict[str, Any],
                          cit_ids: List[int], tlist: List[Any]) -> Thread:
         return None
 
+    @staticmethod
+    def _raise_if_cancelled(cancel_token: Any) -> None:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+
     def get_user_msg_id(self):
         return self.tool_request.user_id, self.task_id
 
+    def _memoize(self, stage: str, key: str, compute: Callable[[], Any],
+                 should_cache: Callable[[Any], bool] = None) -> Tuple[Any, bool]:
+        if self.stage_cache is None:
+            return compute(), False
+        return self.stage_cache.get_or_compute(stage, key, compute, should_cache)
+
+    @staticmethod
+    def _cached_cost(result: CostAwareLLMResult, hit: bool) -> CostAwareLLMResult:
+        # nothing is spent on a stage served from the cache
+        return result._replace(tot_cost=0.0) if hit else result
+
+    def _pipeline_key(self) -> str:
+        """Hash of the settings that shape an answer besides the query, shared by all the stage keys."""
+        retriever = self.paper_finder.retriever
+        pipeline = self.multi_step_pipeline
+        return stage_key(type(retriever).__name__, getattr(retriever, "n_retrieval", 0),
+                         getattr(retriever, "n_keyword_srch", 0), self.paper_finder.n_rerank,
+                         self.paper_finder.context_threshold, self.paper_finder.max_papers,
+                         self.decomposer_llm, pipeline.llm_model, pipeline.min_quotes, pipeline.quote_token_budget)
+
+    def step_gen_sections(self, query: str, user_id: str, cluster_json: CostAwareLLMResult, plan_json: Dict[str, Any],
+                          per_paper_summaries_extd: Dict[str, Any], paper_metadata: Dict[str, Any],
+                          cost_args: CostReportingArgs, inline_tags: bool = False, cancel_token: Any = None) -> \
+            Tuple[List[Dict[str, Any]], List[GeneratedSection], CostAwareLLMResult]:
+        """Generate the answer section by section as per the plan, along with the tables for list sections."""
+        section_titles = [dim["name"] for dim in cluster_json.result["dimensions"]]
+        gen_sections_iter = self.step_gen_iterative_summary(query, per_paper_summaries_extd,
+                                                            plan_json, cost_args, cancel_token=cancel_token)
+
+        json_summary, generated_sections, table_threads = [], [], []
+        tables = [None for _ in cluster_json.result["dimensions"]]
+        citation_ids = dict()
+
+        task_estimated_time = 30 + 15 * len(plan_json)
+        task_estimated_time = max((task_estimated_time + task_estimated_time % 60) // 60, 1)
+        outline = '\n    - ' + '\n    - '.join(section_titles)
+        self.update_task_state(f"Start generating each section in the answer outline: {outline}",
+                               task_estimated_time=f"~{task_estimated_time} minutes" if task_estimated_time > 1 else "~1 minute",
+                               step_estimated_time=15)
+
+        try:
+            gen_iter = gen_sections_iter
+            idx = 0
+            while True:
+                if idx < len(plan_json):
+                    self.update_task_state(
+                        f"Iteratively generating section: {(idx + 1)} of {len(plan_json)} - {section_titles[idx]}",
+                        curr_response=generated_sections, step_estimated_time=15)
+                with metrics.timed("section"):
+                    section_text = next(gen_iter)
+                section_json = \
+                    get_json_summary(self.multi_step_pipeline.llm_model, [section_text], per_paper_summaries_extd,
+                                     paper_metadata,
+                                     citation_ids, inline_tags)[0]
+                import time as t
+                t.sleep(2)
+                section_json["format"] = cluster_json.result["dimensions"][idx]["format"]
+
+                json_summary.append(section_json)
+                self.postprocess_json_output(json_summary)
+                import time as t
+                t.sleep(2)
+                if section_json["format"] == "list" and section_json["citations"]:
+                    cluster_json.result["dimensions"][idx]["idx"] = idx
+                    cit_ids = [int(c["paper"]["corpus_id"]) for c in section_json["citations"]]
+                    tthread = self.gen_table_thread(user_id, query, cluster_json.result["dimensions"][idx], cit_ids,
+                                                    tables)
+                    if tthread:
+                        table_threads.append(tthread)
+                gen_sec = self.get_gen_sections_from_json(section_json)
+                generated_sections.append(gen_sec)
+                idx += 1
+        except StopIteration as e:
+            all_sections = e.value
+
+        self.update_task_state(f"Generating comparison tables", curr_response=generated_sections,
+                               step_estimated_time=20)
+
+        start = time()
+        for tthread in tqdm(table_threads):
+            tthread.join()
+        logger.info(f"Adhoc Table generation wait time: {time() - start:.2f}")
+
+        for sidx in range(len(json_summary)):
+            json_summary[sidx]["table"] = tables[sidx] if tables[sidx] else None
+            generated_sections[sidx].table = tables[sidx] if tables[sidx] else None
+        return json_summary, generated_sections, all_sections
+
     @traceable(run_type="tool", name="ai2_scholar_qa_trace")
-    def run_qa_pipeline(self, req: ToolRequest, inline_tags=False) -> TaskResult:
+    def run_qa_pipeline(self, req: ToolRequest, inline_tags=False, cancel_token: Any = None) -> TaskResult:
         """
                 This function takes a query and returns a response.
                 Goes through the following steps:
@@ -293,8 +428,11 @@ class ScholarQA:
                 5) Generate the summarized output using the quotes and outline in (3) and (4)
 
                 :param req: A scientific query posed to scholar qa by a user, consists of the string query, task id and user id
+                :param cancel_token: Optional cancellation token (any object with raise_if_cancelled() and remaining()),
+                checked between steps and used to bound the timeout of every LLM call
                 :return: A response to the query
         """
+        start = time()
         self.tool_request = req
         self.update_task_state("Processing user query", task_estimated_time="~3 minutes", step_estimated_time=5)
         task_id = self.task_id if self.task_id else req.task_id
@@ -304,6 +442,15 @@ class ScholarQA:
         logger.info(
             f"Received query: {query} from user_id: {user_id} with opt_in: {req.opt_in}"
         )
+        pipeline_key = self._pipeline_key()
+        # whole answers are only reused for the same user, the intermediate stages are shared
+        answer_key = stage_key(pipeline_key, user_id, normalize_query(query), inline_tags)
+        if self.stage_cache is not None:
+            cached_answer = self.stage_cache.get("answer", answer_key)
+            if cached_answer is not None:
+                self.update_task_state("Found a recent answer to the same query", curr_response=cached_answer.sections)
+                logger.info(f"Answer served from the stage cache for query: {query}")
+                return cached_answer.model_copy(update={"cost": 0.0})
         event_trace = EventTrace(
             task_id,
             self.paper_finder.retriever.n_retrieval if hasattr(self.paper_finder.retriever, "n_retrieval") else 0,
@@ -318,14 +465,19 @@ class ScholarQA:
             model=self.llm_model,
             msg_id=msg_id
         )
-        llm_processed_query = self.preprocess_query(query, cost_args)
+        llm_processed_query = self.preprocess_query(query, cost_args, cancel_token=cancel_token)
         import time as t 
         t.sleep(2)
         # llm_processed_query = query
         event_trace.trace_decomposition_event(llm_processed_query)
 
         # Paper finder step - retrieve relevant paper passages from semantic scholar index and api
-        snippet_srch_res, s2_srch_res = self.find_relevant_papers(llm_processed_query.result)
+        self._raise_if_cancelled(cancel_token)
+        # retrieval depends on the decomposed query only, so rephrasings with the same decomposition share it
+        retrieval_key = stage_key(pipeline_key, llm_processed_query.result)
+        (snippet_srch_res, s2_srch_res), _ = self._memoize(
+            "retrieval", retrieval_key, lambda: self.find_relevant_papers(llm_processed_query.result),
+            should_cache=lambda res: bool(res[0] or res[1]))
         retrieved_candidates = snippet_srch_res + s2_srch_res
         if not retrieved_candidates:
             raise Exception(
@@ -335,26 +487,35 @@ class ScholarQA:
         # print(retrieved_candidates)
 
         # Rerank the retrieved candidates based on the query with a cross encoder
+        self._raise_if_cancelled(cancel_token)
         s2_srch_metadata = [{k: v for k, v in paper.items() if
                              k == "corpus_id" or k in NUMERIC_META_FIELDS or k in CATEGORICAL_META_FIELDS} for paper in
                             s2_srch_res]
-        reranked_df, paper_metadata = self.rerank_and_aggregate(query, retrieved_candidates,
-                                                                {str(paper["corpus_id"]): paper for paper in
-                                                                 s2_srch_metadata})
+        # Step 1 - quote extraction, pipelined with reranking so papers are sent to the LLM as they are finalized
+        # reranking and quote extraction are pipelined, so the reranked papers and their quotes share an entry
+        quotes_key = stage_key(retrieval_key, query)
+        (reranked_df, paper_metadata, per_paper_summaries), hit = self._memoize(
+            "quotes", quotes_key, lambda: self.step_rerank_and_select_quotes(
+                query, retrieved_candidates, {str(paper["corpus_id"]): paper for paper in s2_srch_metadata}, cost_args,
+                cancel_token=cancel_token),
+            should_cache=lambda res: not res[0].empty and bool(res[2].result))
+        per_paper_summaries = self._cached_cost(per_paper_summaries, hit)
         if reranked_df.empty:
             raise Exception(
                 "No relevant papers found for the query post reranking, skipping quote extraction.")
         event_trace.trace_rerank_event(reranked_df.to_dict(orient="records"))
 
-        # Step 1 - quote extraction
-        per_paper_summaries = self.step_select_quotes(query, reranked_df, cost_args)
         if not per_paper_summaries.result:
             raise Exception(
                 "No relevant quotes extracted for the query, can't proceed further.")
         event_trace.trace_quote_event(per_paper_summaries)
 
         # step 2: outline planning and clustering
-        cluster_json = self.step_clustering(query, per_paper_summaries.result, cost_args)
+        plan_key = stage_key(quotes_key, per_paper_summaries.result)
+        cluster_json, hit = self._memoize(
+            "plan", plan_key,
+            lambda: self.step_clustering(query, per_paper_summaries.result, cost_args, cancel_token=cancel_token))
+        cluster_json = self._cached_cost(cluster_json, hit)
         import time as t
         t.sleep(2)
         # Changing to expected format in the summary generation prompt
@@ -364,77 +525,29 @@ class ScholarQA:
         event_trace.trace_clustering_event(cluster_json, plan_json)
 
         # step 2.1: extend the clustered snippets with their inline citations
+        self._raise_if_cancelled(cancel_token)
         per_paper_summaries_extd = self.multi_step_pipeline.extend_quote_citations(reranked_df,
                                                                                    per_paper_summaries.result,
-                                                                                   plan_json, paper_metadata)
+                                                                                   plan_json, paper_metadata,
+                                                                                   self.paper_finder.get_paper_metadata)
         import time as t
         t.sleep(2)
         event_trace.trace_inline_citation_following_event(per_paper_summaries_extd)
 
         # step 3: generating output as per the outline
-        section_titles = [dim["name"] for dim in cluster_json.result["dimensions"]]
-        gen_sections_iter = self.step_gen_iterative_summary(query, per_paper_summaries_extd,
-                                                            plan_json, cost_args)
-
-        json_summary, generated_sections, table_threads = [], [], []
-        tables = [None for _ in cluster_json.result["dimensions"]]
-        citation_ids = dict()
-
-        task_estimated_time = 30 + 15 * len(plan_json)
-        task_estimated_time = max((task_estimated_time + task_estimated_time % 60) // 60, 1)
-        outline = '\n    - ' + '\n    - '.join(section_titles)
-        self.update_task_state(f"Start generating each section in the answer outline: {outline}",
-                               task_estimated_time=f"~{task_estimated_time} minutes" if task_estimated_time > 1 else "~1 minute",
-                               step_estimated_time=15)
-
-        try:
-            gen_iter = gen_sections_iter
-            idx = 0
-            while True:
-                if idx < len(plan_json):
-                    self.update_task_state(
-                        f"Iteratively generating section: {(idx + 1)} of {len(plan_json)} - {section_titles[idx]}",
-                        curr_response=generated_sections, step_estimated_time=15)
-                section_text = next(gen_iter)
-                section_json = \
-                    get_json_summary(self.multi_step_pipeline.llm_model, [section_text], per_paper_summaries_extd,
-                                     paper_metadata,
-                                     citation_ids, inline_tags)[0]
-                import time as t
-                t.sleep(2)
-                section_json["format"] = cluster_json.result["dimensions"][idx]["format"]
-
-                json_summary.append(section_json)
-                self.postprocess_json_output(json_summary)
-                import time as t
-                t.sleep(2)
-                if section_json["format"] == "list" and section_json["citations"]:
-                    cluster_json.result["dimensions"][idx]["idx"] = idx
-                    cit_ids = [int(c["paper"]["corpus_id"]) for c in section_json["citations"]]
-                    tthread = self.gen_table_thread(user_id, query, cluster_json.result["dimensions"][idx], cit_ids,
-                                                    tables)
-                    if tthread:
-                        table_threads.append(tthread)
-                gen_sec = self.get_gen_sections_from_json(section_json)
-                generated_sections.append(gen_sec)
-                idx += 1
-        except StopIteration as e:
-            all_sections = e.value
-
-        self.update_task_state(f"Generating comparison tables", curr_response=generated_sections,
-                               step_estimated_time=20)
-
-        start = time()
-        for tthread in tqdm(table_threads):
-            tthread.join()
-        logger.info(f"Adhoc Table generation wait time: {time() - start:.2f}")
-
-        for sidx in range(len(json_summary)):
-            json_summary[sidx]["table"] = tables[sidx] if tables[sidx] else None
-            generated_sections[sidx].table = tables[sidx] if tables[sidx] else None
+        sections_key = stage_key(plan_key, plan_json, per_paper_summaries_extd, inline_tags)
+        (json_summary, generated_sections, all_sections), hit = self._memoize(
+            "sections", sections_key,
+            lambda: self.step_gen_sections(query, user_id, cluster_json, plan_json, per_paper_summaries_extd,
+                                           paper_metadata, cost_args, inline_tags, cancel_token=cancel_token))
+        all_sections = self._cached_cost(all_sections, hit)
         event_trace.trace_summary_event(json_summary, all_sections)
         self.postprocess_json_output(json_summary)
         import time as t
         t.sleep(2)
         event_trace.persist_trace(self.logs_config)
-        return TaskResult(sections=generated_sections, cost=event_trace.total_cost)
+        task_result = TaskResult(sections=generated_sections, cost=event_trace.total_cost)
+        if self.stage_cache is not None:
+            self.stage_cache.put("answer", answer_key, task_result)
+        metrics.observe_stage("pipeline", time() - start)
+        return task_result
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import logging
+import pickle
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable, Optional, Tuple
+
+from scholarqa import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def stage_key(*parts: Any) -> str:
+    """Stable hash of a stage's inputs; parts must be json serializable (namedtuples hash as lists)."""
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StageCache:
+    """Thread-safe LRU of ScholarQA pipeline stage outputs, keyed by (stage, hash of the stage inputs).
+
+    Values are stored pickled, so every get returns an independent copy that the pipeline is free to mutate
+    (copy.deepcopy of a DataFrame does not copy the lists and dicts held in its cells). Entries older than
+    ``ttl_seconds`` are dropped, so answers pick up changes to the underlying index eventually.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: Optional[float] = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, bytes]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, stage: str, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get((stage, key))
+            if entry is not None and self.ttl_seconds is not None and monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[(stage, key)]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                metrics.record_cache(f"stage:{stage}", False)
+                return None
+            self._entries.move_to_end((stage, key))
+            self.hits += 1
+        metrics.record_cache(f"stage:{stage}", True)
+        return pickle.loads(entry[1])
+
+    def put(self, stage: str, key: str, value: Any) -> None:
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.warning(f"Not caching {stage} output: {e}")
+            return
+        with self._lock:
+            self._entries[(stage, key)] = (monotonic(), data)
+            self._entries.move_to_end((stage, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, stage: str, key: str, compute: Callable[[], Any],
+                       should_cache: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, bool]:
+        """(value, cache hit) for a stage. On a miss the value is computed and stored unless should_cache rejects
+        it; exceptions are not cached."""
+        value = self.get(stage, key)
+        if value is not None:
+            logger.info(f"Stage cache hit: {stage}")
+            return value, True
+        value = compute()
+        if should_cache is None or should_cache(value):
+            self.put(stage, key, value)
+        return value, False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -4,10 +4,11 @@ from time import time
 from typing import List, Any, Optional
 from uuid import uuid5, UUID
 
-from nora_lib.tasks.state import IStateManager, StateManager
+from nora_lib.tasks.state import IStateManager
 
 from scholarqa.llms.constants import CompletionResult, CostReportingArgs
 from scholarqa.models import TaskResult, TaskStep, AsyncTaskState, ToolRequest
+from scholarqa.state_mgmt.locked_state import CoalescingStateManager
 
 UUID_NAMESPACE = os.getenv("UUID_ENCODER_KEY", "ai2-scholar-qa")
 
@@ -47,10 +48,11 @@ class AbsStateMgrClient(ABC):
 
 
 class LocalStateMgrClient(AbsStateMgrClient):
-    def __init__(self, logs_dir: str, async_state_dir: str = "async_state"):
+    def __init__(self, logs_dir: str, async_state_dir: str = "async_state", flush_interval: float = 0.25):
         self._async_state_dir = f"{logs_dir}/{async_state_dir}"
         os.makedirs(self._async_state_dir, exist_ok=True)
-        self.state_mgr = StateManager(AsyncTaskState, self._async_state_dir)
+        # progress updates are coalesced in memory and written at most once per flush_interval per task
+        self.state_mgr = CoalescingStateManager(AsyncTaskState, self._async_state_dir, flush_interval=flush_interval)
 
     def get_state_mgr(self, tool_req: Optional[ToolRequest] = None) -> IStateManager:
         return self.state_mgr
@@ -1,20 +1,147 @@
-from typing import Type
+import json
+import os
+import threading
+import weakref
+from time import monotonic
+from typing import Dict, Set, Tuple, Type
 
-from nora_lib.tasks.models import AsyncTaskState, R
+from nora_lib.tasks.models import AsyncTaskState, R, TASK_STATUSES
 from nora_lib.tasks.state import StateManager
 from filelock import FileLock
 
+TERMINAL_STATUSES = {TASK_STATUSES["COMPLETED"], TASK_STATUSES["FAILED"]}
+
 
 class LockedStateManager(StateManager):
+    """StateManager with per task lock files kept next to the state files and atomic writes, so a reader never
+    sees a partially written state."""
+
     def __init__(self, task_state_class: Type[AsyncTaskState[R]], state_dir) -> None:
         super().__init__(task_state_class, state_dir)
 
+    def _state_path(self, task_id: str) -> str:
+        return os.path.join(self._state_dir, f"{task_id}.json")
+
+    def _lock(self, task_id: str) -> FileLock:
+        return FileLock(os.path.join(self._state_dir, f"{task_id}.lock"))
+
     def read_state(self, task_id: str) -> AsyncTaskState[R]:
-        lock = FileLock(f"{task_id}.lock")
-        with lock:
+        with self._lock(task_id):
             return super().read_state(task_id)
 
     def write_state(self, state: AsyncTaskState[R]) -> None:
-        lock = FileLock(f"{state.task_id}.lock")
-        with lock:
-            super().write_state(state)
+        self._write_file(state)
+
+    def _write_file(self, state: AsyncTaskState[R]) -> Tuple[int, int]:
+        """Write the state via a temp file and rename, returns the (inode, mtime) of the new state file."""
+        task_state_path = self._state_path(state.task_id)
+        tmp_path = f"{task_state_path}.{os.getpid()}.tmp"
+        with self._lock(state.task_id):
+            with open(tmp_path, "w") as f:
+                json.dump(state.model_dump(), f)
+            os.replace(tmp_path, task_state_path)
+            stat = os.stat(task_state_path)
+            return stat.st_ino, stat.st_mtime_ns
+
+
+# live CoalescingStateManagers, their locks are recreated in a forked child by a single at-fork hook
+_coalescing_managers: "weakref.WeakSet[CoalescingStateManager]" = weakref.WeakSet()
+
+
+def _reinit_locks_after_fork() -> None:
+    for manager in list(_coalescing_managers):
+        manager._init_locks()
+
+
+os.register_at_fork(after_in_child=_reinit_locks_after_fork)
+
+
+class CoalescingStateManager(LockedStateManager):
+    """LockedStateManager that keeps task states in memory and coalesces their writes.
+
+    A task's state is written at most once per ``flush_interval`` seconds: a write arriving sooner only replaces the
+    in-memory state, and a timer writes the latest one once the interval has passed. Completed and failed states are
+    written immediately. Reads are served from memory while the state file is still the one this process wrote,
+    so an update from another process (e.g. the forked task runner) is always picked up from disk.
+    """
+
+    def __init__(self, task_state_class: Type[AsyncTaskState[R]], state_dir, flush_interval: float = 0.25) -> None:
+        super().__init__(task_state_class, state_dir)
+        self.flush_interval = flush_interval
+        self._init_memory()
+        _coalescing_managers.add(self)
+
+    def _init_memory(self) -> None:
+        self._states: Dict[str, AsyncTaskState[R]] = dict()
+        # task id -> (inode, mtime) of the state file as last written by this process
+        self._flushed_version: Dict[str, Tuple[int, int]] = dict()
+        self._last_flush: Dict[str, float] = dict()
+        # tasks whose in-memory state is newer than their state file
+        self._dirty: Set[str] = set()
+        self._init_locks()
+
+    def _init_locks(self) -> None:
+        # timer threads don't survive a fork, the child schedules its own
+        self._mem_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timers: Dict[str, threading.Timer] = dict()
+
+    def read_state(self, task_id: str) -> AsyncTaskState[R]:
+        with self._mem_lock:
+            state = self._states.get(task_id)
+            if state is not None and (task_id in self._dirty or self._is_current(task_id)):
+                return state.model_copy(deep=True)
+        state = super().read_state(task_id)
+        with self._mem_lock:
+            if task_id not in self._dirty:
+                self._states.pop(task_id, None)
+                self._flushed_version.pop(task_id, None)
+        return state
+
+    def _is_current(self, task_id: str) -> bool:
+        try:
+            stat = os.stat(self._state_path(task_id))
+        except FileNotFoundError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns) == self._flushed_version.get(task_id)
+
+    def write_state(self, state: AsyncTaskState[R]) -> None:
+        task_id = state.task_id
+        with self._mem_lock:
+            self._states[task_id] = state
+            self._dirty.add(task_id)
+            if task_id in self._timers and state.task_status not in TERMINAL_STATUSES:
+                # a flush is already scheduled and will pick up this state
+                return
+            wait = self.flush_interval - (monotonic() - self._last_flush.get(task_id, float("-inf")))
+            if wait > 0 and state.task_status not in TERMINAL_STATUSES:
+                timer = threading.Timer(wait, self.flush, args=(task_id,))
+                timer.daemon = True
+                self._timers[task_id] = timer
+                timer.start()
+                return
+        self.flush(task_id)
+
+    def flush(self, task_id: str) -> None:
+        """Write the latest in-memory state of a task to disk."""
+        # flushes are serialized so an older state can never overwrite a newer one
+        with self._flush_lock:
+            with self._mem_lock:
+                timer = self._timers.pop(task_id, None)
+                state = self._states.get(task_id)
+                self._last_flush[task_id] = monotonic()
+            if timer is not None and timer is not threading.current_thread():
+                timer.cancel()
+            if state is None:
+                return
+            version = self._write_file(state)
+            with self._mem_lock:
+                if self._states.get(task_id) is state:
+                    self._flushed_version[task_id] = version
+                    self._dirty.discard(task_id)
+                if state.task_status in TERMINAL_STATUSES:
+                    # nothing more will be written for the task, later reads go to disk
+                    self._states.pop(task_id, None)
+                    self._flushed_version.pop(task_id, None)
+                    self._last_flush.pop(task_id, None)
+                    self._dirty.discard(task_id)
@@ -0,0 +1,55 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# tokenizer used for budgeting (litellm's default as well); close enough to the Gemini/GPT tokenizers to keep
+# prompts within a budget
+DEFAULT_ENCODING = "cl100k_base"
+CHARS_PER_TOKEN = 4
+COUNT_CACHE_SIZE = 8192
+
+_counts: "OrderedDict[bytes, int]" = OrderedDict()
+_counts_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = DEFAULT_ENCODING):
+    """tiktoken encoding, loaded once per process; None if it is unavailable (token counts are then estimated)."""
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(f"Tokenizer {name} unavailable ({e}), estimating token counts from characters")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Token count of text, shared by the ScholarQA pipeline and the IRIS prompt budgets.
+
+    The same ideas, excerpts and sections are counted for every prompt they go into, so counts are cached in a
+    bounded LRU keyed by a digest of the text rather than by the text itself, which would keep every long prompt
+    alive.
+    """
+    if not text:
+        return 0
+    key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    with _counts_lock:
+        n_tokens = _counts.get(key)
+        if n_tokens is not None:
+            _counts.move_to_end(key)
+            return n_tokens
+    encoding = get_encoding()
+    if encoding is None:
+        n_tokens = -(-len(text) // CHARS_PER_TOKEN)
+    else:
+        n_tokens = len(encoding.encode(text, disallowed_special=()))
+    with _counts_lock:
+        _counts[key] = n_tokens
+        if len(_counts) > COUNT_CACHE_SIZE:
+            _counts.popitem(last=False)
+    return n_tokens
@@ -1,12 +1,29 @@
 import os
+import threading
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 from scholarqa.models import ToolRequest
-from scholarqa.trace.trace_writer import GCSWriter, LocalWriter, TraceWriter
+from scholarqa.trace.trace_writer import GCSWriter, TraceWriter, BatchedLocalWriter
 from scholarqa.llms.constants import CostAwareLLMResult
 from scholarqa.config.config_setup import LogsConfig
 
+_trace_writers: Dict[Tuple[str, str], TraceWriter] = dict()
+_trace_writers_lock = threading.Lock()
+
+
+def get_trace_writer(logs_config: LogsConfig) -> TraceWriter:
+    """One writer per trace destination for the process, so local traces share a single background writer."""
+    location = logs_config.event_trace_loc if logs_config.tracing_mode == "gcs" \
+        else f"{logs_config.log_dir}/{logs_config.event_trace_loc}"
+    with _trace_writers_lock:
+        if (logs_config.tracing_mode, location) not in _trace_writers:
+            _trace_writers[(logs_config.tracing_mode, location)] = GCSWriter(bucket_name=location) \
+                if logs_config.tracing_mode == "gcs" else \
+                BatchedLocalWriter(local_dir=location, max_queue_size=logs_config.trace_queue_size,
+                                   max_segment_bytes=logs_config.trace_segment_bytes)
+        return _trace_writers[(logs_config.tracing_mode, location)]
+
 
 class EventTrace:
     def __init__(self, task_id: str, n_retrieval: int, n_rerank: int, req: ToolRequest):
@@ -76,6 +93,4 @@ class EventTrace:
         self.total_cost += cost_result.tot_cost
 
     def persist_trace(self, logs_config: LogsConfig):
-        trace_writer = GCSWriter(bucket_name=logs_config.event_trace_loc) if logs_config.tracing_mode == "gcs" \
-            else LocalWriter(local_dir=f"{logs_config.log_dir}/{logs_config.event_trace_loc}")
-        trace_writer.write(trace_json=self, file_name=self.task_id)
+        get_trace_writer(logs_config).write(trace_json=self, file_name=self.task_id)
@@ -2,11 +2,28 @@ from abc import ABC, abstractmethod
 # from google.cloud import storage
 import logging
 import json
+import multiprocessing.util
 import os
+import queue
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
 
+def dumps_compact(obj: Dict[str, Any]) -> bytes:
+    """Single line json, with orjson when it is installed; anything non-serializable is written as str."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=str, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
 class TraceWriter(ABC):
     @abstractmethod
     def write(self, trace_json, file_name: str) -> None:
@@ -43,3 +60,105 @@ class LocalWriter(TraceWriter):
             logger.info(f"Pushed event trace to local path: {self.local_dir}/{file_name}.json")
         except Exception as e:
             logger.info(f"Error pushing {file_name} to local directory: {e}")
+
+
+class BatchedLocalWriter(TraceWriter):
+    """Append traces as json lines to rolling segment files from a background thread.
+
+    write() only enqueues the trace, serialization and file I/O happen on the writer thread, which drains the
+    queue in batches of up to ``batch_size`` traces per write. The queue is bounded: when the disk can't keep up,
+    write() blocks for at most ``put_timeout`` seconds and then drops the trace. A new segment
+    (traces-<start time>-<n>.jsonl) is started once the current one grows past ``max_segment_bytes``.
+    """
+
+    def __init__(self, local_dir: str, max_queue_size: int = 1024, batch_size: int = 64,
+                 flush_interval: float = 1.0, max_segment_bytes: int = 64 * 1024 * 1024, put_timeout: float = 0.05):
+        self.local_dir = local_dir
+        if not os.path.exists(local_dir):
+            logger.info(f"Creating local directory to record traces: {local_dir}")
+            os.makedirs(local_dir, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_segment_bytes = max_segment_bytes
+        self.put_timeout = put_timeout
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max_queue_size)
+        self._segment_prefix = f"traces-{datetime.now().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        self._segment_idx = 0
+        self._segment = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._thread.start()
+        # multiprocessing finalizers also run when a pool worker exits (e.g. after maxtasksperchild tasks), which
+        # leaves through os._exit and so skips atexit; in the main process they run from an atexit hook
+        multiprocessing.util.Finalize(self, self.close, exitpriority=10)
+
+    def write(self, trace_json, file_name: str) -> None:
+        if self._closed:
+            return
+        # shallow copy, the trace object is done with once persisted
+        record = {"trace_id": file_name, **trace_json.__dict__}
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                dropped = self.dropped
+            logger.warning(f"Trace queue full, dropped event trace {file_name} ({dropped} dropped so far)")
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Flush the queued traces and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stop = True
+                batch = [record for record in batch if record is not None]
+            if batch:
+                self._write_batch(batch)
+        if self._segment is not None:
+            self._segment.close()
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        lines = []
+        for record in batch:
+            try:
+                lines.append(dumps_compact(record))
+            except Exception as e:
+                logger.info(f"Error serializing event trace {record.get('trace_id')}: {e}")
+        if not lines:
+            return
+        try:
+            segment = self._current_segment()
+            segment.write(b"\n".join(lines) + b"\n")
+            segment.flush()
+            logger.info(f"Pushed {len(lines)} event traces to local path: {segment.name}")
+        except Exception as e:
+            logger.info(f"Error pushing {len(lines)} event traces to local directory: {e}")
+
+    def _current_segment(self):
+        if self._segment is not None and self._segment.tell() >= self.max_segment_bytes:
+            self._segment.close()
+            self._segment = None
+            self._segment_idx += 1
+        if self._segment is None:
+            self._segment = open(os.path.join(self.local_dir, f"{self._segment_prefix}-{self._segment_idx}.jsonl"),
+                                 "ab")
+        return self._segment
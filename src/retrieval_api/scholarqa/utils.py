@@ -7,6 +7,7 @@ from typing import Any, Dict, Optional, Set, List
 
 import requests
 from fastapi import HTTPException
+from requests.adapters import HTTPAdapter
 # from google.cloud import storage
 
 from scholarqa import glog
@@ -16,7 +17,11 @@ logger = logging.getLogger(__name__)
 
 S2_APIKEY = os.getenv("SEMANTIC_SCHOLAR_API_KEY")
 S2_HEADERS = {"x-api-key": S2_APIKEY}
-S2_API_BASE_URL = "https://api.semanticscholar.org/graph/v1/"
+# overridable to point at a mirror or a local stub (see benchmarks/s2_stub.py)
+S2_API_BASE_URL = os.getenv("S2_API_BASE_URL", "https://api.semanticscholar.org/graph/v1").rstrip("/") + "/"
+# pooled keep-alive connections to the S2 api, so only the first request (or prime_s2_session) pays for TLS setup
+S2_SESSION = requests.Session()
+S2_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
 CompletionResult = namedtuple("CompletionCost",
                               ["content", "model", "cost", "input_tokens", "output_tokens", "total_tokens"])
 NUMERIC_META_FIELDS = {"year", "citationCount", "referenceCount", "influentialCitationCount"}
@@ -106,7 +111,7 @@ def query_s2_api(
         method="get",
 ):
     url = S2_API_BASE_URL + end_pt
-    req_method = requests.get if method == "get" else requests.post
+    req_method = S2_SESSION.get if method == "get" else S2_SESSION.post
     response = req_method(url, headers=S2_HEADERS, params=params, json=payload)
     if response.status_code != 200:
         logging.exception(f"S2 API request to end point {end_pt} failed with status code {response.status_code}")
@@ -117,6 +122,11 @@ def query_s2_api(
     return response.json()
 
 
+def prime_s2_session(timeout: float = 10) -> None:
+    """Open a pooled connection to the S2 api ahead of the first query; the response itself is ignored."""
+    S2_SESSION.head(S2_API_BASE_URL, headers=S2_HEADERS, timeout=timeout)
+
+
 def get_paper_metadata(corpus_ids: Set[str]) -> Dict[str, Any]:
     paper_data = query_s2_api(
         end_pt="paper/batch",
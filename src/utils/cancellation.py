@@ -0,0 +1,63 @@
+import threading
+import time
+from typing import Dict, Optional
+
+
+class OperationCancelled(BaseException):
+    """Raised when a cancellation token is cancelled or its deadline has passed.
+
+    Derives from BaseException (like asyncio.CancelledError) so that the generic
+    ``except Exception`` fallbacks and ``@retry`` decorators used throughout the
+    agents do not swallow it and keep working on an abandoned request.
+    """
+
+
+class CancellationToken:
+    """Thread-safe cancellation flag with an optional deadline.
+
+    Long-running work checks the token between steps with ``raise_if_cancelled()``
+    and bounds in-flight LLM/HTTP calls with ``remaining()``.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self._event = threading.Event()
+        self._reason = None
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """Cancel the token; the first reason given is kept."""
+        if not self._event.is_set():
+            self._reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline exceeded")
+            return True
+        return False
+
+    @property
+    def reason(self) -> Optional[str]:
+        return self._reason
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline, or None if there is no deadline."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise OperationCancelled(self._reason)
+
+
+def llm_timeout_params(cancel_token: Optional[CancellationToken]) -> Dict[str, float]:
+    """Fail fast on a cancelled token, else return litellm kwargs capping the call at the time left."""
+    if cancel_token is None:
+        return {}
+    cancel_token.raise_if_cancelled()
+    remaining = cancel_token.remaining()
+    return {"timeout": remaining} if remaining is not None else {}
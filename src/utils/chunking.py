@@ -0,0 +1,114 @@
+import re
+from typing import Any, Iterator, List, Tuple
+
+import numpy as np
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+WORD = re.compile(r"\S+")
+# characters tokenized at a time, so very long documents never hold the offsets of the whole text
+DEFAULT_BLOCK_CHARS = 200_000
+
+# (start char, end char, number of tokens) of a sentence, or of a piece of a sentence longer than a chunk
+Unit = Tuple[int, int, int]
+
+
+def token_offsets(text: str, tokenizer: Any = None) -> np.ndarray:
+    """(start, end) character offsets of the tokens of text, shape (n_tokens, 2), from a single tokenizer call.
+
+    tokenizer is a fast HuggingFace tokenizer (offset mapping), a tiktoken encoding (decode_with_offsets) or
+    None for whitespace-separated words.
+    """
+    if not text:
+        return np.empty((0, 2), dtype=np.int64)
+    if tokenizer is None:
+        return np.array([match.span() for match in WORD.finditer(text)], dtype=np.int64).reshape(-1, 2)
+    if hasattr(tokenizer, "decode_with_offsets"):
+        _, starts = tokenizer.decode_with_offsets(tokenizer.encode(text, disallowed_special=()))
+        starts = np.asarray(starts, dtype=np.int64)
+        return np.stack([starts, np.append(starts[1:], len(text))], axis=1)
+    encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                         return_attention_mask=False, verbose=False)
+    return np.asarray(encoding["offset_mapping"], dtype=np.int64).reshape(-1, 2)
+
+
+def _block_end(text: str, start: int, block_chars: int) -> int:
+    """End of the block starting at start: after the last sentence (else word) boundary within block_chars."""
+    end = start + block_chars
+    if end >= len(text):
+        return len(text)
+    block = text[start:end]
+    boundary = None
+    for boundary in SENTENCE_END.finditer(block):
+        pass
+    if boundary is not None:
+        return start + boundary.end()
+    space = block.rfind(" ")
+    return start + space + 1 if space > 0 else end
+
+
+def _sentence_units(text: str, start: int, end: int, tokenizer: Any, chunk_size: int) -> List[Unit]:
+    """Sentences of text[start:end] with their token counts; sentences over chunk_size tokens are split."""
+    offsets = token_offsets(text[start:end], tokenizer) + start
+    if not len(offsets):
+        return []
+    bounds, position = [], start
+    for match in SENTENCE_END.finditer(text, start, end):
+        bounds.append((position, match.start()))
+        position = match.end()
+    bounds.append((position, end))
+
+    # first token of each sentence; a sentence owns the tokens starting before the next one
+    first = np.searchsorted(offsets[:, 0], [s for s, _ in bounds]).tolist() + [len(offsets)]
+    units = []
+    for (sentence_start, sentence_end), token_start, token_end in zip(bounds, first, first[1:]):
+        n_tokens = token_end - token_start
+        if n_tokens <= chunk_size:
+            if n_tokens:
+                units.append((sentence_start, sentence_end, n_tokens))
+            continue
+        for piece in range(token_start, token_end, chunk_size):
+            piece_end = min(piece + chunk_size, token_end)
+            units.append((int(offsets[piece, 0]), int(offsets[piece_end - 1, 1]), piece_end - piece))
+    return units
+
+
+def iter_chunks(text: str, tokenizer: Any = None, chunk_size: int = 512, overlap: int = 0,
+                block_chars: int = DEFAULT_BLOCK_CHARS) -> Iterator[str]:
+    """Yield chunks of text of at most chunk_size tokens, made of whole sentences.
+
+    The text is tokenized once per block of block_chars characters (cut at a sentence boundary) and sentence
+    lengths are read off the token offsets, instead of tokenizing every sentence separately. A sentence longer
+    than chunk_size is split at token boundaries. Each chunk starts with the last sentences of the previous one,
+    up to overlap tokens. Chunks are slices of text, so they keep its original whitespace.
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    current: List[Unit] = []
+    n_tokens = 0
+    start = 0
+    while start < len(text):
+        end = _block_end(text, start, block_chars)
+        for unit in _sentence_units(text, start, end, tokenizer, chunk_size):
+            if current and n_tokens + unit[2] > chunk_size:
+                yield text[current[0][0]:current[-1][1]].strip()
+                current = _overlap(current, overlap)
+                n_tokens = sum(u[2] for u in current)
+                while current and n_tokens + unit[2] > chunk_size:
+                    n_tokens -= current.pop(0)[2]
+            current.append(unit)
+            n_tokens += unit[2]
+        start = end
+    if current:
+        yield text[current[0][0]:current[-1][1]].strip()
+
+
+def _overlap(units: List[Unit], overlap: int) -> List[Unit]:
+    """The trailing units of a chunk totalling at most overlap tokens, never the whole chunk."""
+    kept, n_tokens = [], 0
+    for unit in reversed(units[1:]):
+        if n_tokens + unit[2] > overlap:
+            break
+        kept.append(unit)
+        n_tokens += unit[2]
+    return kept[::-1]
+
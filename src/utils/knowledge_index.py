@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+
+class KnowledgeIndex:
+    """Persistent flat vector index over chunks of the user's uploaded documents.
+
+    Chunk metadata lives in ``chunks.jsonl`` and L2-normalised float32 embeddings in
+    ``embeddings.npy`` under ``index_dir``, so the index survives restarts. Search is a
+    single matrix-vector product followed by a partial sort, which keeps top-k lookups
+    over tens of thousands of chunks in the millisecond range.
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
+        chunk_size: int = 200,
+        chunk_overlap: int = 40,
+    ):
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.embedding_model = embedding_model
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+        self._model = None
+        self._lock = threading.RLock()
+        self.chunks: List[Dict[str, Any]] = []
+        self._doc_ids = set()
+        self.embeddings: Optional[np.ndarray] = None
+        self._load()
+
+    @property
+    def model(self):
+        """Sentence embedding model, loaded on first use."""
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+
+            logger.info(f"Loading embedding model {self.embedding_model} for the knowledge index")
+            self._model = SentenceTransformer(self.embedding_model)
+        return self._model
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def has_document(self, doc_id: str) -> bool:
+        with self._lock:
+            return doc_id in self._doc_ids
+
+    def add_document(self, doc_id: str, text: str, source: str, metadata: Optional[Dict[str, Any]] = None) -> int:
+        """Chunk, embed and persist a document; returns the number of chunks added (0 if already indexed)."""
+        if self.has_document(doc_id):
+            logger.info(f"Document {source} already in the knowledge index")
+            return 0
+        pieces = self._chunk_text(text)
+        if not pieces:
+            return 0
+        vectors = self._encode(pieces)
+
+        with self._lock:
+            for i, piece in enumerate(pieces):
+                self.chunks.append({
+                    "doc_id": doc_id,
+                    "source": source,
+                    "chunk_id": i,
+                    "text": piece,
+                    **(metadata or {}),
+                })
+            self.embeddings = vectors if self.embeddings is None else np.vstack([self.embeddings, vectors])
+            self._doc_ids.add(doc_id)
+            self._save()
+        logger.info(f"Indexed {len(pieces)} chunks from {source}")
+        return len(pieces)
+
+    def search(self, query: str, top_k: int = 5, min_score: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Return the top_k chunks most similar to query, best first, each with a cosine ``score``."""
+        with self._lock:
+            if not self.chunks:
+                return []
+            embeddings, chunks = self.embeddings, self.chunks
+        scores = embeddings @ self._encode([query])[0]
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {**chunks[i], "score": float(scores[i])}
+            for i in top
+            if min_score is None or scores[i] >= min_score
+        ]
+
+    def warm_up(self) -> None:
+        """Load the embedding model and run one dummy encode, so the first upload or search does not pay for it."""
+        self._encode(["warm-up"])
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts, batch_size=32, normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False
+        ).astype(np.float32)
+
+    def _chunk_text(self, text: str) -> List[str]:
+        """Split text into overlapping windows of chunk_size words."""
+        words = text.split()
+        step = max(self.chunk_size - self.chunk_overlap, 1)
+        return [
+            " ".join(words[start:start + self.chunk_size])
+            for start in range(0, max(len(words) - self.chunk_overlap, 1), step)
+            if words[start:start + self.chunk_size]
+        ]
+
+    def _save(self) -> None:
+        """Replace each file through a temp file; _load rejects a chunk/embedding count mismatch."""
+        chunks_tmp = self.index_dir / "chunks.jsonl.tmp"
+        with open(chunks_tmp, "w") as f:
+            for chunk in self.chunks:
+                f.write(json.dumps(chunk) + "\n")
+        embeddings_tmp = self.index_dir / "embeddings.tmp.npy"
+        np.save(embeddings_tmp, self.embeddings)
+        with open(self.index_dir / "meta.json.tmp", "w") as f:
+            json.dump({"embedding_model": self.embedding_model, "num_chunks": len(self.chunks)}, f)
+        os.replace(embeddings_tmp, self.index_dir / "embeddings.npy")
+        os.replace(chunks_tmp, self.index_dir / "chunks.jsonl")
+        os.replace(self.index_dir / "meta.json.tmp", self.index_dir / "meta.json")
+
+    def _load(self) -> None:
+        meta_path = self.index_dir / "meta.json"
+        if not meta_path.exists():
+            return
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(self.index_dir / "chunks.jsonl") as f:
+                chunks = [json.loads(line) for line in f if line.strip()]
+            embeddings = np.load(self.index_dir / "embeddings.npy")
+        except Exception as e:
+            logger.error(f"Could not load knowledge index from {self.index_dir}, starting empty: {e}")
+            return
+        if len(chunks) != len(embeddings):
+            logger.error(f"Knowledge index at {self.index_dir} is inconsistent, starting empty")
+            return
+
+        self.chunks = chunks
+        self._doc_ids = {chunk["doc_id"] for chunk in chunks}
+        if meta.get("embedding_model") == self.embedding_model:
+            self.embeddings = embeddings
+        elif chunks:
+            logger.warning(
+                f"Knowledge index was built with {meta.get('embedding_model')}, re-embedding "
+                f"{len(chunks)} chunks with {self.embedding_model}"
+            )
+            self.embeddings = self._encode([chunk["text"] for chunk in chunks])
+            self._save()
+        logger.info(f"Loaded knowledge index with {len(self.chunks)} chunks from {self.index_dir}")
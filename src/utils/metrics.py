@@ -0,0 +1,57 @@
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Any, Iterator, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+
+# a single LLM call takes seconds, an MCTS expansion runs one per valid action
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120, 300, 600)
+
+MCTS_PHASE_SECONDS = Histogram("iris_mcts_phase_seconds", "Wall time of an MCTS rollout phase", ["phase"],
+                               buckets=LATENCY_BUCKETS)
+AGENT_CALL_SECONDS = Histogram("iris_agent_call_seconds", "Wall time of a single agent LLM call attempt",
+                               ["agent", "outcome"], buckets=LATENCY_BUCKETS)
+AGENT_RETRIES = Counter("iris_agent_retries_total",
+                        "Failed agent LLM call attempts, retried by the agent until its tries run out", ["agent"])
+LLM_TOKENS = Counter("iris_llm_tokens_total", "Tokens used by agent LLM calls", ["agent", "model", "kind"])
+CACHE_REQUESTS = Counter("iris_cache_requests_total", "Lookups in the IRIS caches", ["cache", "result"])
+
+
+@contextmanager
+def timed_phase(phase: str) -> Iterator[None]:
+    """Observe the wall time of an MCTS phase; a phase that raises is not observed."""
+    start = perf_counter()
+    yield
+    MCTS_PHASE_SECONDS.labels(phase=phase).observe(perf_counter() - start)
+
+
+@contextmanager
+def agent_call(agent: str) -> Iterator[None]:
+    """Time one attempt of an agent's LLM call; a failed attempt also counts as a retry."""
+    start = perf_counter()
+    try:
+        yield
+    except BaseException:
+        AGENT_CALL_SECONDS.labels(agent=agent, outcome="error").observe(perf_counter() - start)
+        AGENT_RETRIES.labels(agent=agent).inc()
+        raise
+    AGENT_CALL_SECONDS.labels(agent=agent, outcome="ok").observe(perf_counter() - start)
+
+
+def record_usage(agent: str, response: Any, model: Optional[str] = None) -> None:
+    """Count the tokens of a litellm completion response."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    model = getattr(response, "model", None) or model or "unknown"
+    LLM_TOKENS.labels(agent=agent, model=model, kind="input").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.labels(agent=agent, model=model, kind="output").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def render_latest() -> Tuple[bytes, str]:
+    """(body, content type) of the /metrics response; includes the ScholarQA metrics once it is loaded."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
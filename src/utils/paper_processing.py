@@ -5,12 +5,13 @@ from pathlib import Path
 import subprocess
 import tempfile
 from loguru import logger
-import re
 from dataclasses import dataclass
 import numpy as np
 from transformers import AutoTokenizer, AutoModel
 import torch
 
+from .chunking import iter_chunks
+
 @dataclass
 class ProcessedPaper:
     """Represents a processed scientific paper."""
@@ -105,31 +106,34 @@ class PaperProcessor:
             metadata=metadata
         )
     
-    def _create_chunks(self, text: str, chunk_size: int = 512) -> List[str]:
-        """Split text into chunks of approximately equal size."""
-        # Split into sentences
-        sentences = re.split(r'(?<=[.!?])\s+', text)
-        
-        chunks = []
-        current_chunk = []
-        current_length = 0
-        
-        for sentence in sentences:
-            sentence_length = len(self.tokenizer.encode(sentence))
-            
-            if current_length + sentence_length > chunk_size and current_chunk:
-                chunks.append(" ".join(current_chunk))
-                current_chunk = []
-                current_length = 0
-            
-            current_chunk.append(sentence)
-            current_length += sentence_length
-        
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
-            
-        return chunks
+    def _create_chunks(self, text: str, chunk_size: int = 512, overlap: int = 0) -> List[str]:
+        """Split text into chunks of whole sentences of at most chunk_size tokens; the text is tokenized once."""
+        return list(iter_chunks(text, self.tokenizer, chunk_size, overlap))
     
+    def embed(self, texts: List[str], batch_size: int = None) -> np.ndarray:
+        """L2-normalised, mean-pooled embeddings of texts, shape (len(texts), hidden size).
+
+        Texts are batched in order of length so that each batch pads to similar lengths, and padding is
+        masked out of the mean, so a text gets the same embedding as when it is encoded on its own.
+        """
+        batch_size = batch_size or self.config['retrieval'].get('embedding_batch_size', 32)
+        embeddings = np.empty((len(texts), self.model.config.hidden_size), dtype=np.float32)
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        with torch.inference_mode():
+            for start in range(0, len(texts), batch_size):
+                batch = order[start:start + batch_size]
+                tokens = self.tokenizer(
+                    [texts[i] for i in batch],
+                    padding=True,
+                    truncation=True,
+                    return_tensors="pt"
+                )
+                hidden = self.model(**tokens).last_hidden_state
+                mask = tokens["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+                embeddings[batch] = torch.nn.functional.normalize(pooled, dim=-1).float().cpu().numpy()
+        return embeddings
+
     def rerank_chunks(
         self,
         query: str,
@@ -137,38 +141,16 @@ class PaperProcessor:
         top_k: int = 5
     ) -> List[str]:
         """Rerank chunks based on similarity to query."""
-        # Get query embedding
-        query_tokens = self.tokenizer(
-            query,
-            padding=True,
-            truncation=True,
-            return_tensors="pt"
-        )
-        
-        with torch.no_grad():
-            query_embedding = self.model(**query_tokens).last_hidden_state.mean(dim=1)
-        
-        # Get chunk embeddings
-        chunk_embeddings = []
-        for chunk in chunks:
-            tokens = self.tokenizer(
-                chunk,
-                padding=True,
-                truncation=True,
-                return_tensors="pt"
-            )
-            with torch.no_grad():
-                embedding = self.model(**tokens).last_hidden_state.mean(dim=1)
-                chunk_embeddings.append(embedding)
-        
-        # Calculate similarities
-        similarities = []
-        for emb in chunk_embeddings:
-            similarity = torch.cosine_similarity(query_embedding, emb)
-            similarities.append(similarity.item())
-        
+        if not chunks or top_k <= 0:
+            return []
+        query_embedding = self.embed([query])[0]
+        # cosine similarity of every chunk in one product, the embeddings are normalised
+        similarities = self.embed(chunks) @ query_embedding
+
         # Get top-k chunks
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
+        k = min(top_k, len(chunks))
+        top_indices = np.argpartition(-similarities, k - 1)[:k]
+        top_indices = top_indices[np.argsort(-similarities[top_indices], kind="stable")]
         return [chunks[i] for i in top_indices]
     
     def summarize_chunks(
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) of a PDF; runs in a worker process."""
+    import pymupdf
+
+    with pymupdf.open(pdf_path) as doc:
+        return [doc.load_page(page_num).get_text() for page_num in range(start, stop)]
+
+
+def _extract_page_range_in_subprocess(pdf_path: str, start: int, stop: int) -> List[str]:
+    """Run _extract_page_range in a fresh interpreter started on this module.
+
+    Not a multiprocessing pool: spawn and forkserver workers re-import the parent's ``__main__`` (app.py) and
+    would re-run all of its module-level setup (agents, MCTS, knowledge index, warm-up) in every worker.
+    """
+    result = subprocess.run(
+        [sys.executable, "-m", "src.utils.pdf_ingestion", pdf_path, str(start), str(stop)],
+        cwd=REPO_ROOT, capture_output=True, check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PDFIngestor:
+    """Extract text from uploaded PDFs off the request thread.
+
+    Each upload becomes a job on a small thread pool and is tracked by an ingestion id.
+    Documents with more than ``parallel_page_threshold`` pages are split into page ranges
+    that are parsed in parallel, each in a short-lived worker process. Extracted pages are cached on disk by
+    file content hash, so re-uploading a file skips parsing entirely.
+    ``on_complete(job, pages)`` runs on the ingestion thread once text is available and its
+    return value is exposed as the job's ``result``.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        on_complete: Optional[Callable[[Dict[str, Any], List[str]], Dict[str, Any]]] = None,
+        max_jobs: int = 2,
+        max_processes: Optional[int] = None,
+        pages_per_task: int = 16,
+        parallel_page_threshold: int = 32,
+        max_tracked_jobs: int = 256,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.on_complete = on_complete
+        self.max_processes = max_processes or min(4, os.cpu_count() or 1)
+        self.pages_per_task = pages_per_task
+        self.parallel_page_threshold = parallel_page_threshold
+        self.max_tracked_jobs = max_tracked_jobs
+
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="pdf-ingest")
+        # threads that wait on the page-range worker processes, max_processes at a time
+        self._range_executor = ThreadPoolExecutor(max_workers=self.max_processes, thread_name_prefix="pdf-pages")
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def submit(self, file_path: str, filename: str) -> str:
+        """Queue a PDF for extraction and return its ingestion id."""
+        ingestion_id = str(uuid.uuid4())
+        job = {
+            "id": ingestion_id,
+            "filename": filename,
+            "source": file_path,
+            "status": "queued",
+            "pages_done": 0,
+            "pages_total": None,
+            "cached": False,
+            "result": None,
+            "error": None,
+        }
+        with self._lock:
+            self._jobs[ingestion_id] = job
+            while len(self._jobs) > self.max_tracked_jobs:
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job)
+        return ingestion_id
+
+    def status(self, ingestion_id: str) -> Optional[Dict[str, Any]]:
+        """Snapshot of a job's progress, or None for an unknown id."""
+        with self._lock:
+            job = self._jobs.get(ingestion_id)
+            if job is None:
+                return None
+            snapshot = dict(job)
+        total = snapshot["pages_total"]
+        snapshot["progress"] = 1.0 if snapshot["status"] == "done" else (
+            round(snapshot["pages_done"] / total, 3) if total else 0.0)
+        return snapshot
+
+    def _update(self, job: Dict[str, Any], **fields) -> None:
+        with self._lock:
+            job.update(fields)
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        try:
+            self._update(job, status="extracting")
+            content_hash = file_sha256(job["source"])
+            self._update(job, content_hash=content_hash)
+
+            pages = self._read_cache(content_hash)
+            if pages is not None:
+                self._update(job, cached=True, pages_total=len(pages), pages_done=len(pages))
+            else:
+                pages = self._extract(job)
+                self._write_cache(content_hash, pages)
+
+            result = None
+            if self.on_complete:
+                self._update(job, status="indexing")
+                result = self.on_complete(job, pages)
+            self._update(job, status="done", result=result)
+            logger.info(f"Ingested {job['filename']} ({len(pages)} pages, cached={job['cached']})")
+        except Exception as e:
+            logger.error(f"Failed to ingest {job['filename']}: {e}")
+            self._update(job, status="failed", error=str(e))
+
+    def _extract(self, job: Dict[str, Any]) -> List[str]:
+        import pymupdf
+
+        with pymupdf.open(job["source"]) as doc:
+            n_pages = len(doc)
+            self._update(job, pages_total=n_pages)
+            if n_pages <= self.parallel_page_threshold:
+                pages = []
+                for page_num in range(n_pages):
+                    pages.append(doc.load_page(page_num).get_text())
+                    self._update(job, pages_done=page_num + 1)
+                return pages
+
+        # Fan page ranges out across worker processes and reassemble them in order
+        ranges = [(start, min(start + self.pages_per_task, n_pages))
+                  for start in range(0, n_pages, self.pages_per_task)]
+        futures = {self._range_executor.submit(_extract_page_range_in_subprocess, job["source"], start, stop): start
+                   for start, stop in ranges}
+        by_start = {}
+        for future in as_completed(futures):
+            texts = future.result()
+            by_start[futures[future]] = texts
+            self._update(job, pages_done=job["pages_done"] + len(texts))
+        return [text for start, _ in ranges for text in by_start[start]]
+
+    def _read_cache(self, content_hash: str) -> Optional[List[str]]:
+        cache_path = self.cache_dir / f"{content_hash}.json"
+        if not cache_path.exists():
+            return None
+        try:
+            with open(cache_path) as f:
+                return json.load(f)["pages"]
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable text cache entry {cache_path}: {e}")
+            return None
+
+    def _write_cache(self, content_hash: str, pages: List[str]) -> None:
+        cache_path = self.cache_dir / f"{content_hash}.json"
+        tmp_path = cache_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"pages": pages}, f)
+        os.replace(tmp_path, cache_path)
+
+
+if __name__ == "__main__":
+    # worker entry point of _extract_page_range_in_subprocess: pdf path, first page, stop page
+    json.dump(_extract_page_range(sys.argv[1], int(sys.argv[2]), int(sys.argv[3])), sys.stdout)
@@ -0,0 +1,153 @@
+import importlib.util
+import re
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+from loguru import logger
+
+from .text_relevance import rank_diverse
+
+VENDORED_TOKENS = Path(__file__).resolve().parents[1] / "retrieval_api" / "scholarqa" / "tokens.py"
+
+
+def _load_vendored_tokens():
+    """The token counter of the vendored ScholarQA library (src/retrieval_api/scholarqa/tokens.py), shared with it.
+
+    It is loaded from its file rather than imported as scholarqa.tokens: that name only resolves to the vendored
+    copy when src/retrieval_api comes first on sys.path, and the installed ai2-scholar-qa package has no tokens
+    module. The module only needs the standard library (and tiktoken, if installed).
+    """
+    module = sys.modules.get("scholarqa.tokens")
+    if module is not None and Path(getattr(module, "__file__", "")).resolve() == VENDORED_TOKENS:
+        return module
+    spec = importlib.util.spec_from_file_location("src.utils._scholarqa_tokens", VENDORED_TOKENS)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+_tokens = _load_vendored_tokens()
+CHARS_PER_TOKEN = _tokens.CHARS_PER_TOKEN
+count_tokens = _tokens.count_tokens
+get_encoding = _tokens.get_encoding
+
+DEFAULT_MAX_TOKENS = 12000
+DEFAULT_WEIGHTS = {"idea": 0.35, "knowledge": 0.45, "history": 0.2}
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+UNIT_SEPARATOR = "\n\n"
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens, at the last sentence or word boundary."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = get_encoding()
+    if encoding is None:
+        cut = text[:max_tokens * CHARS_PER_TOKEN]
+    else:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    boundary = max(cut.rfind(". "), cut.rfind("\n"))
+    if boundary > len(cut) // 2:
+        return cut[:boundary + 1].rstrip()
+    space = cut.rfind(" ")
+    return (cut[:space] if space > 0 else cut).rstrip()
+
+
+def select_units(units: Sequence[str], max_tokens: int, query: Optional[str] = None,
+                 recent: bool = False) -> List[str]:
+    """Keep the units (paragraphs, excerpts, sections) that fit into max_tokens, in their original order.
+
+    Units are taken greedily by BM25 relevance to query, near-duplicates left out, or the latest first if
+    ``recent``, otherwise in order. If not even the first choice fits, it is truncated rather than dropping everything.
+    """
+    units = [unit for unit in units if unit and unit.strip()]
+    if not units or max_tokens <= 0:
+        return []
+    if query:
+        order = rank_diverse(query, units)
+    elif recent:
+        order = list(reversed(range(len(units))))
+    else:
+        order = list(range(len(units)))
+
+    separator_tokens = count_tokens(UNIT_SEPARATOR)
+    kept, used = set(), 0
+    for i in order:
+        cost = count_tokens(units[i]) + (separator_tokens if kept else 0)
+        if used + cost <= max_tokens:
+            kept.add(i)
+            used += cost
+    if not kept:
+        return [truncate_tokens(units[order[0]], max_tokens)]
+    return [units[i] for i in sorted(kept)]
+
+
+class PromptBudget:
+    """Input token budget of a prompt, split between its variable components (idea, knowledge, history).
+
+    Each component gets a share of what the fixed text (template, instructions) leaves, in proportion to its
+    weight; a component that needs less than its share hands the rest to the others. A component over its
+    share keeps its most relevant units, so long retrieved context is trimmed by relevance, not cut off. The
+    idea itself is only ever cut from the end: ranking its paragraphs would drop parts of the idea being worked on.
+    """
+
+    def __init__(self, max_tokens: int = DEFAULT_MAX_TOKENS, weights: Optional[Dict[str, float]] = None):
+        self.max_tokens = max_tokens
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "PromptBudget":
+        budget_config = config.get("prompt_budget", {})
+        return cls(budget_config.get("max_input_tokens", DEFAULT_MAX_TOKENS), budget_config.get("weights"))
+
+    def allocate(self, sizes: Dict[str, int], available: int) -> Dict[str, int]:
+        """Token limit of each component given the tokens it needs."""
+        limits, pending = {}, dict(sizes)
+        while pending:
+            total_weight = sum(self.weights.get(name, 0.0) for name in pending) or float(len(pending))
+            shares = {name: available * (self.weights.get(name, 0.0) or 1.0) / total_weight for name in pending}
+            fitting = [name for name in pending if pending[name] <= shares[name]]
+            if not fitting:
+                limits.update({name: int(share) for name, share in shares.items()})
+                break
+            for name in fitting:
+                limits[name] = pending.pop(name)
+                available -= limits[name]
+        return limits
+
+    def fit(self, fixed: str = "", query: Optional[str] = None, recent: Iterable[str] = ("history",),
+            truncate: Iterable[str] = ("idea",),
+            **components: Union[str, Sequence[str], None]) -> Dict[str, Union[str, List[str]]]:
+        """Trim the components so that they fit into the budget together with the fixed text.
+
+        Strings are split into paragraphs and returned as a string, sequences are taken as units and returned
+        as a list. Units are ranked by relevance to ``query``; the components named in ``recent`` keep their
+        latest units instead, and those named in ``truncate`` are cut from the end as a whole text.
+        """
+        recent, truncate = set(recent), set(truncate)
+        units = {name: ([] if value is None else
+                        [u for u in PARAGRAPH_BREAK.split(value) if u.strip()] if isinstance(value, str) else
+                        [str(u) for u in value])
+                 for name, value in components.items()}
+        sizes = {name: count_tokens(UNIT_SEPARATOR.join(parts)) for name, parts in units.items()}
+        available = max(self.max_tokens - count_tokens(fixed), 0)
+        limits = sizes if sum(sizes.values()) <= available else self.allocate(sizes, available)
+
+        fitted = {}
+        for name, parts in units.items():
+            as_text = not isinstance(components[name], (list, tuple))
+            if sizes[name] <= limits[name]:
+                fitted[name] = (components[name] or "") if as_text else parts
+                continue
+            if name in truncate:
+                text = truncate_tokens(components[name] if as_text else UNIT_SEPARATOR.join(parts), limits[name])
+                logger.debug(f"Truncated prompt component {name} from {sizes[name]} to {limits[name]} tokens")
+                fitted[name] = text if as_text else [text]
+                continue
+            parts = select_units(parts, limits[name], None if name in recent else query, recent=name in recent)
+            logger.debug(f"Trimmed prompt component {name} from {sizes[name]} to {limits[name]} tokens")
+            fitted[name] = UNIT_SEPARATOR.join(parts) if as_text else parts
+        return fitted
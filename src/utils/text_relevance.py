@@ -0,0 +1,82 @@
+import math
+import re
+import zlib
+from collections import Counter
+from functools import lru_cache
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(
+    "a an and are as at be been but by can could do does for from had has have how in into is it its may more "
+    "most not of on or our should such than that the their them then there these they this those through to "
+    "under use used using was we were what when where which while who will with within would you your".split()
+)
+MINHASH_PRIME = (1 << 31) - 1
+
+
+def terms(text: str) -> List[str]:
+    """Lower-cased word tokens of text without stop words."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def bm25_scores(query: str, documents: Sequence[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """Okapi BM25 score of each document for query, with document frequencies taken from the documents themselves."""
+    query_terms = set(terms(query))
+    if not documents or not query_terms:
+        return [0.0] * len(documents)
+    term_counts = [Counter(terms(document)) for document in documents]
+    lengths = [sum(counts.values()) for counts in term_counts]
+    avg_length = sum(lengths) / len(lengths) or 1.0
+    n = len(documents)
+    idf = {}
+    for term in query_terms:
+        df = sum(1 for counts in term_counts if term in counts)
+        idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    scores = []
+    for counts, length in zip(term_counts, lengths):
+        norm = k1 * (1 - b + b * length / avg_length)
+        scores.append(sum(idf[term] * counts[term] * (k1 + 1) / (counts[term] + norm)
+                          for term in query_terms if term in counts))
+    return scores
+
+
+@lru_cache(maxsize=None)
+def _permutations(num_perm: int, seed: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.RandomState(seed)
+    return (rng.randint(1, MINHASH_PRIME, num_perm, dtype=np.int64),
+            rng.randint(0, MINHASH_PRIME, num_perm, dtype=np.int64))
+
+
+@lru_cache(maxsize=4096)
+def minhash(text: str, num_perm: int = 64, shingle_size: int = 3) -> np.ndarray:
+    """MinHash signature of the word shingles of text; cached since the same chunks are compared for every idea."""
+    words = terms(text)
+    shingles = {" ".join(words[i:i + shingle_size]) for i in range(max(len(words) - shingle_size + 1, 1))}
+    hashes = np.fromiter((zlib.crc32(shingle.encode()) for shingle in shingles), dtype=np.int64, count=len(shingles))
+    a, b = _permutations(num_perm)
+    # crc32 < 2**32 and a < 2**31, so the products stay within int64
+    return ((np.outer(hashes, a) + b) % MINHASH_PRIME).min(axis=0)
+
+
+def estimated_jaccard(first: np.ndarray, second: np.ndarray) -> float:
+    return float(np.mean(first == second))
+
+
+def rank_diverse(query: str, documents: Sequence[str], duplicate_threshold: float = 0.8) -> List[int]:
+    """Indices of the documents by BM25 relevance to query, best first, without near-duplicates: a document whose
+    estimated Jaccard similarity to a better ranked one reaches duplicate_threshold is left out. Documents sharing
+    no term with the query are left out too, unless none does."""
+    scores = bm25_scores(query, documents)
+    any_match = any(scores)
+    kept, signatures = [], []
+    for i in sorted(range(len(documents)), key=lambda i: (-scores[i], i)):
+        if any_match and not scores[i]:
+            break
+        signature = minhash(documents[i])
+        if any(estimated_jaccard(signature, other) >= duplicate_threshold for other in signatures):
+            continue
+        kept.append(i)
+        signatures.append(signature)
+    return kept
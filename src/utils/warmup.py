@@ -0,0 +1,61 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from loguru import logger
+
+
+class WarmUp:
+    """Run start-up work (model loading, dummy inference, connection priming) on a background thread.
+
+    Steps run in order and each records its status and duration. The app is ready once every required
+    step has succeeded; optional steps (e.g. priming a connection to an external api) only affect latency,
+    so a failure is logged without holding readiness back.
+    """
+
+    def __init__(self):
+        self._steps: List[Tuple[str, Callable[[], Any], bool]] = []
+        self._lock = threading.Lock()
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._thread = None
+        self.finished = False
+
+    def add_step(self, name: str, fn: Callable[[], Any], required: bool = True) -> "WarmUp":
+        self._steps.append((name, fn, required))
+        self._status[name] = {"status": "pending", "required": required}
+        return self
+
+    def start(self) -> "WarmUp":
+        self._thread = threading.Thread(target=self._run, name="warm-up", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        start = time.perf_counter()
+        for name, fn, required in self._steps:
+            self._update(name, status="running")
+            step_start = time.perf_counter()
+            try:
+                fn()
+                self._update(name, status="done", seconds=round(time.perf_counter() - step_start, 3))
+            except Exception as e:
+                (logger.error if required else logger.warning)(f"Warm-up step {name} failed: {e}")
+                self._update(name, status="failed", error=str(e),
+                             seconds=round(time.perf_counter() - step_start, 3))
+        self.finished = True
+        logger.info(f"Warm-up finished in {time.perf_counter() - start:.2f}s, ready: {self.ready}")
+
+    def _update(self, name: str, **fields) -> None:
+        with self._lock:
+            self._status[name].update(fields)
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return self.finished and all(step["status"] == "done" for step in self._status.values()
+                                         if step["required"])
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            steps = {name: dict(step) for name, step in self._status.items()}
+        return {"ready": self.ready, "finished": self.finished, "steps": steps}